@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+'''Throughput and memory benchmark of `target-s3-jsonl` against a local moto S3 server.
+
+A synthetic Singer stream is generated once, then every case runs in its own process, so the peak RSS of each case is measured alone.
+The `upload_file` cases run the `main` entry point (local files uploaded by the scheduler),
+the `put_object` cases stream the records of each stream from the generated file through `put_object`, parsing included.
+
+Usage
+-----
+    python benchmarks/benchmark_s3.py --streams 2 --records 100000 --width 20 --output after.json
+    python benchmarks/benchmark_s3.py --compare before.json after.json
+'''
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from inspect import iscoroutinefunction
+import argparse
+import json
+import logging
+import platform
+import random
+import resource
+import subprocess
+import sys
+
+SCHEMA_TYPES: List[Dict[str, Any]] = [
+    {'type': ['null', 'string']},
+    {'type': ['null', 'integer']},
+    {'type': ['null', 'number']},
+    {'type': ['null', 'string'], 'format': 'date-time'},
+    {'type': ['null', 'boolean']},
+]
+MODES: List[str] = ['upload_file', 'put_object']
+COMPRESSIONS: List[str] = ['none', 'gzip', 'lzma', 'zstd']
+
+
+def _value(schema: Dict[str, Any], generator: random.Random, index: int) -> Any:
+    if schema.get('format') == 'date-time':
+        return (datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=index)).isoformat()
+    elif schema['type'][1] == 'integer':
+        return generator.randint(-2 ** 31, 2 ** 31)
+    elif schema['type'][1] == 'number':
+        return round(generator.uniform(-1e6, 1e6), 4)
+    elif schema['type'][1] == 'boolean':
+        return generator.random() < 0.5
+    return ''.join(generator.choices('abcdefghijklmnopqrstuvwxyzé ', k=generator.randint(4, 32)))
+
+
+def generate_stream(path: Path, streams: int, records: int, width: int, seed: int = 0) -> None:
+    '''Write a synthetic Singer stream of `streams` interleaved streams of `records` records with `width` columns'''
+    generator = random.Random(seed)
+    properties: Dict[str, Dict] = {'c_pk': {'type': ['null', 'integer']}} | {
+        f'c_{column}': SCHEMA_TYPES[column % len(SCHEMA_TYPES)] for column in range(1, width)}
+
+    with path.open('w', encoding='utf-8') as output:
+        for stream in range(streams):
+            output.write(json.dumps({
+                'type': 'SCHEMA', 'stream': f'stream_{stream}', 'schema': {'type': 'object', 'properties': properties}, 'key_properties': ['c_pk']}) + '\n')
+        for index in range(records):
+            for stream in range(streams):
+                record = {name: index if name == 'c_pk' else _value(schema, generator, index) for name, schema in properties.items()}
+                output.write(json.dumps({
+                    'type': 'RECORD', 'stream': f'stream_{stream}', 'record': record,
+                    'version': 1, 'time_extracted': '2022-01-01T00:00:00.000000Z'}) + '\n')
+        output.write(json.dumps({'type': 'STATE', 'value': {'bookmarks': {f'stream_{stream}': index for stream in range(streams)}}}) + '\n')
+
+
+def stream_records(lines: Iterable[str], stream: str) -> Iterator[Dict]:
+    '''Records of the stream, read from the Singer messages as they are consumed, so the memory used is the one of `put_object`'''
+    for message in map(json.loads, lines):
+        if message['type'] == 'RECORD' and message['stream'] == stream:
+            yield message['record']
+
+
+def percentile(values: List[float], quantile: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, round(quantile * (len(values) - 1)))]
+
+
+def _timed(latencies: List[float], function: Callable) -> Callable:
+    '''Wrap the function to record its duration'''
+    if iscoroutinefunction(function):
+        async def timed_coroutine(*args: Any, **kwargs: Any) -> Any:
+            start = perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                latencies.append(perf_counter() - start)
+
+        return timed_coroutine
+
+    def timed(*args: Any, **kwargs: Any) -> Any:
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(perf_counter() - start)
+
+    return timed
+
+
+def run_case(case: Dict[str, Any]) -> Dict[str, Any]:
+    '''Run a benchmark case in the current process'''
+    from target_s3_json import s3
+
+    latencies: List[float] = []
+    config: Dict[str, Any] = case['config']
+    input_path = Path(case['input'])
+
+    if case['mode'] == 'upload_file':
+        if config.get('upload_backend') == 'aiobotocore':
+            from target_s3_json import aio
+
+            aio.upload_file = _timed(latencies, aio.upload_file)
+        else:
+            s3.upload_file = _timed(latencies, s3.upload_file)
+        config_path = input_path.with_name(f"{case['id']}.json")
+        config_path.write_text(json.dumps(config), encoding='utf-8')
+        sys.argv = ['target-s3-jsonl', '--config', str(config_path)]
+
+        start = perf_counter()
+        with input_path.open('r', encoding='utf-8') as lines, open('/dev/null', 'w') as state:
+            stdout, sys.stdout = sys.stdout, state
+            try:
+                s3.main(lines)
+            finally:
+                sys.stdout = stdout
+        duration = perf_counter() - start
+
+    else:
+        from target.file import config_file
+
+        config = s3.config_compression(config_file(s3.config_s3(config)))
+        config['client'] = s3.get_client(config)
+        with input_path.open('r', encoding='utf-8') as lines:
+            streams: List[str] = [message['stream'] for message in map(json.loads, lines) if message['type'] == 'SCHEMA']
+
+        put_object = _timed(latencies, s3.put_object)
+        start = perf_counter()
+        for stream in streams:
+            relative_path = config['path_template'].format(stream=stream, date_time=config['date_time'], part=1)
+            with input_path.open('r', encoding='utf-8') as lines:
+                put_object(config, {'relative_path': relative_path, 'absolute_path': config['work_path'] / relative_path}, stream_records(lines, stream))
+        duration = perf_counter() - start
+
+    return {
+        'duration': duration,
+        # NOTE: kilobytes on Linux, bytes on macOS
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024),
+        'uploads': len(latencies),
+        'latency_p50': percentile(latencies, 0.5),
+        'latency_p90': percentile(latencies, 0.9),
+        'latency_p99': percentile(latencies, 0.99),
+        'latency_max': max(latencies, default=None),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    endpoint_url = f'http://127.0.0.1:{server._server.port}'  # type: ignore
+    client = boto3.client('s3', region_name='us-east-1', endpoint_url=endpoint_url, aws_access_key_id='BENCH', aws_secret_access_key='BENCH')
+    client.create_bucket(Bucket='benchmark')
+
+    results: List[Dict[str, Any]] = []
+    try:
+        with TemporaryDirectory() as work_dir:
+            input_path = Path(work_dir, 'input.jsonl')
+            generate_stream(input_path, args.streams, args.records, args.width, args.seed)
+            input_size = input_path.stat().st_size
+            records = args.streams * args.records
+
+            for mode in args.modes:
+                for compression in args.compressions:
+                    case_id = f'{mode}-{compression}'
+                    config: Dict[str, Any] = {
+                        's3_bucket': 'benchmark',
+                        'aws_access_key_id': 'BENCH',
+                        'aws_secret_access_key': 'BENCH',
+                        'aws_endpoint_url': endpoint_url,
+                        'work_dir': str(Path(work_dir, case_id)),
+                        'path_template': f'{case_id}/{{stream}}-{{date_time}}-{{part}}.json',
+                        'compression': compression,
+                    } | json.loads(args.config)
+                    case = {'id': case_id, 'mode': mode, 'input': str(input_path), 'config': config}
+
+                    process = subprocess.run([sys.executable, __file__, '--worker', json.dumps(case)], capture_output=True, text=True)
+                    if process.returncode:
+                        raise RuntimeError(f'Benchmark case {case_id} failed:\n{process.stderr}')
+                    result: Dict[str, Any] = json.loads(process.stdout.splitlines()[-1])
+
+                    objects = client.list_objects_v2(Bucket='benchmark', Prefix=f'{case_id}/').get('Contents', [])
+                    result |= {
+                        'case': case_id,
+                        'mode': mode,
+                        'compression': compression,
+                        'records_per_second': records / result['duration'],
+                        'input_mb_per_second': input_size / 1024 ** 2 / result['duration'],
+                        'objects': len(objects),
+                        'uploaded_bytes': sum(item['Size'] for item in objects),
+                    }
+                    results.append(result)
+                    print(_format(result), file=sys.stderr)
+    finally:
+        server.stop()
+
+    return {
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'streams': args.streams, 'records': args.records, 'width': args.width, 'seed': args.seed, 'config': json.loads(args.config)},
+        'input_bytes': input_size,
+        'results': results,
+    }
+
+
+def _format(result: Dict[str, Any]) -> str:
+    return '{case:<24} {records_per_second:>12,.0f} rec/s {input_mb_per_second:>8.2f} MB/s {peak_rss_mb:>8.1f} MB RSS' \
+        '   upload p50 {latency_p50} p99 {latency_p99}'.format(**result | {
+            'latency_p50': f"{result['latency_p50']:.3f}s" if result['latency_p50'] is not None else '-',
+            'latency_p99': f"{result['latency_p99']:.3f}s" if result['latency_p99'] is not None else '-'})
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> Iterable[str]:
+    '''Relative change of each case between two benchmark runs'''
+    cases: Dict[str, Dict[str, Any]] = {result['case']: result for result in before['results']}
+    yield f"{'case':<24} {'rec/s':>10} {'peak RSS':>10} {'upload p99':>12}   ({before['revision']} -> {after['revision']})"
+    for result in after['results']:
+        if result['case'] in cases:
+            previous = cases[result['case']]
+            changes = [
+                f"{result[key] / previous[key] - 1:>+{width}.1%}" if result[key] and previous[key] else f"{'-':>{width}}"
+                for key, width in (('records_per_second', 10), ('peak_rss_mb', 10), ('latency_p99', 12))]
+            yield f"{result['case']:<24} " + ' '.join(changes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=2, help='Number of streams')
+    parser.add_argument('--records', type=int, default=20000, help='Number of records per stream')
+    parser.add_argument('--width', type=int, default=20, help='Number of columns')
+    parser.add_argument('--seed', type=int, default=0, help='Random generator seed')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES, help='Upload modes')
+    parser.add_argument('--compressions', nargs='+', default=COMPRESSIONS, help='Compression codecs')
+    parser.add_argument('--config', default='{}', help='JSON config options added to every case, e.g. \'{"upload_backend": "aiobotocore"}\'')
+    parser.add_argument('--output', help='JSON results file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two JSON results files')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_case(json.loads(args.worker))))
+    elif args.compare:
+        print('\n'.join(compare(*(json.loads(Path(path).read_text(encoding='utf-8')) for path in args.compare))))
+    else:
+        report = run(args)
+        if args.output:
+            Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf-8')
+        else:
+            print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
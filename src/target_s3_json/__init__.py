@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 
-__version__ = '2.1.0'
+__version__ = '2.2.0'
+
+import sys
+from typing import TextIO
 
 # from pathlib import Path
 
 # Package imports
 # from target._logger import get_logger
-from .s3 import main
 
 # LOGGER = get_logger(Path(__file__).with_name('logging.conf'))
 
@@ -24,5 +26,12 @@ CONFIG_PARAMS = {
 }
 
 
+def main(lines: TextIO = sys.stdin) -> None:
+    '''Main, the target modules being imported on the first call so importing the package stays cheap'''
+    from .s3 import main as s3_main
+
+    s3_main(lines)
+
+
 if __name__ == '__main__':
     main()
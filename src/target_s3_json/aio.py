@@ -0,0 +1,229 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from asyncio import Future, create_task, gather, get_running_loop, to_thread, wait, FIRST_COMPLETED
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from pathlib import Path
+from time import perf_counter
+
+from aiobotocore.session import get_session
+from aiobotocore.config import AioConfig
+from aiobotocore.credentials import AioRefreshableCredentials
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import ClientError, NoCredentialsError
+
+from .multipart import MultipartUpload, MIN_PART_SIZE, PART_SIZE
+from .resume import UploadManifest, get_manifest, resumable
+from .retry import Retry
+from .s3 import create_session, file_uploaded, get_compressor, get_retry, object_uploaded, pool_size, upload_args, upload_resumed, upload_restarted, \
+    upload_size, writer_args
+from .serializer import get_serializer
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+# NOTE: the botocore refreshable credentials are refreshed once they expire in less than 15 minutes
+REFRESH_TIMEOUT: int = 15 * 60
+CREDENTIALS_REFRESH_INTERVAL: int = 60
+
+
+def credentials_metadata(credentials: RefreshableCredentials) -> Dict[str, str]:
+    '''Metadata of the aiobotocore refreshable credentials, fetched from the botocore ones, refreshed by botocore once about to expire.
+
+    The expiry time of the botocore credentials being private, the metadata expires `CREDENTIALS_REFRESH_INTERVAL` seconds
+    after the refresh timeout, so it's fetched again from them every `CREDENTIALS_REFRESH_INTERVAL` seconds.
+    '''
+    frozen = credentials.get_frozen_credentials()
+    return {
+        'access_key': frozen.access_key,
+        'secret_key': frozen.secret_key,
+        'token': frozen.token,
+        'expiry_time': (datetime.now(timezone.utc) + timedelta(seconds=REFRESH_TIMEOUT + CREDENTIALS_REFRESH_INTERVAL)).isoformat()}
+
+
+@asynccontextmanager
+async def create_client(config: Dict[str, Any]) -> AsyncIterator[Any]:
+    '''aiobotocore S3 client.
+
+    A single client is used for every upload, so they all share the same aiohttp connection pool
+    sized by the `max_pool_connections` config option.
+    The credentials are resolved the same way as the `boto3` client ones, on a worker thread, and the assumed role ones are refreshed.
+    '''
+    # NOTE: the credentials resolution and the role assumption send blocking requests, e.g. to STS or the instance metadata service
+    session = await to_thread(create_session, config)
+    credentials = await to_thread(session.get_credentials)
+    if credentials is None:
+        raise NoCredentialsError()
+    aio_session = get_session()
+    credentials_args: Dict[str, Any] = {}
+
+    if isinstance(credentials, RefreshableCredentials):
+        # NOTE: the role is assumed again by botocore on a worker thread
+        aio_session._credentials = AioRefreshableCredentials.create_from_metadata(
+            metadata=await to_thread(credentials_metadata, credentials),
+            refresh_using=partial(to_thread, credentials_metadata, credentials),
+            method=credentials.method)
+    else:
+        frozen = credentials.get_frozen_credentials()
+        credentials_args = {'aws_access_key_id': frozen.access_key, 'aws_secret_access_key': frozen.secret_key, 'aws_session_token': frozen.token}
+
+    async with aio_session.create_client(
+            's3',
+            region_name=session.region_name,
+            # NOTE: the requests are retried by the `Retry` policy of the uploads
+            config=AioConfig(max_pool_connections=pool_size(config), retries={'total_max_attempts': 1}),
+            **credentials_args,
+            **({'endpoint_url': config.get('aws_endpoint_url')} if config.get('aws_endpoint_url') else {})) as client:
+        yield client
+
+
+class AioMultipartWriter(MultipartUpload):
+    '''asyncio streaming S3 object writer.
+
+    Same as the `MultipartWriter`, but the parts are uploaded by tasks awaited on the running event loop
+    instead of a thread pool. See `MultipartUpload`.
+    '''
+
+    async def __aenter__(self) -> 'AioMultipartWriter':
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            await self.close()
+        else:
+            await self.abort()
+
+    async def _call(self, function: Callable[..., Awaitable[Dict[str, Any]]], **kwargs: Any) -> Dict[str, Any]:
+        return await (self.retry.call_async(function, **kwargs) if self.retry else function(**kwargs))
+
+    def _uploaded(self, result: Dict[str, Any]) -> Future:
+        future: Future = get_running_loop().create_future()
+        future.set_result(result)
+        return future
+
+    async def write(self, data: bytes) -> int:
+        body: Optional[bytearray] = self.part_buffer.write(data)
+        if body is not None:
+            await self._upload_part(body)
+
+        return len(data)
+
+    async def writelines(self, lines: Iterable[bytes]) -> None:
+        for line in lines:
+            await self.write(line)
+
+    async def write_file(self, path: Path) -> None:
+        '''Send the file content, except the parts already uploaded according to the `manifest`'''
+        with path.open('rb') as input_file:
+            chunks: Iterator[Tuple[int, Optional[Dict[str, Any]], bytes]] = self._chunks(input_file)
+            # NOTE: the file is read, and the resumed parts hashed again, on a worker thread so the event loop keeps running
+            while (item := await to_thread(next, chunks, None)) is not None:
+                part_number, result, chunk = item
+                if result is None:
+                    await self.write(chunk)
+                else:
+                    self.parts[part_number] = self._uploaded(result)
+
+    async def write_buffer(self, data: memoryview) -> None:
+        '''Send the data buffered in memory, by slices of `part_size` bytes'''
+        for chunk in self._slices(data):
+            await self.write(chunk)  # type: ignore[arg-type]
+
+    async def _send_part(self, part_number: int, body: bytearray, part_checksum: Optional[str] = None) -> Dict[str, Any]:
+        return self._part_sent(part_number, await self._call(self.client.upload_part, **self._part_args(part_number, body, part_checksum)), part_checksum)
+
+    async def _upload_part(self, body: bytearray) -> None:
+        if self.upload_id is None:
+            self._started(await self._call(self.client.create_multipart_upload, **self._create_args()))
+
+        part_number: int = self._next_part_number()
+
+        # NOTE: Wait for a free upload slot, this is what bounds the memory used
+        pending: Set[Future] = {task for task in self.parts.values() if not task.done()}
+        while len(pending) >= self.max_concurrency:
+            _, pending = await wait(pending, return_when=FIRST_COMPLETED)
+        for task in self.parts.values():
+            if task.done():
+                task.result()  # NOTE: raise the part upload error as soon as it's known
+
+        self.parts[part_number] = create_task(self._send_part(part_number, body, self.part_buffer.part_checksum))
+
+    async def close(self) -> None:
+        body: bytearray = self.part_buffer.flush()
+
+        if self.upload_id is None:
+            self._put(await self._call(self.client.put_object, **self._put_args(body)))
+            return
+
+        try:
+            if body:
+                await self._upload_part(body)
+
+            parts: List[Dict[str, Any]] = [
+                self._part(part_number, response)
+                for part_number, response in zip(sorted(self.parts), await gather(*(self.parts[number] for number in sorted(self.parts))))]
+            self._completed(await self._call(self.client.complete_multipart_upload, **self._complete_args(parts)), parts)
+        except Exception:
+            await self.abort()
+            raise
+
+        self._closed(parts)
+
+    async def abort(self) -> None:
+        if self.upload_id is not None:
+            for task in self.parts.values():
+                task.cancel()
+            await gather(*self.parts.values(), return_exceptions=True)
+            if self._left_in_progress():
+                return
+            await self._call(self.client.abort_multipart_upload, **self._upload_args())
+            self._aborted()
+
+
+async def put_object(config: Dict[str, Any], file_metadata: Dict, stream_data: Iterable) -> None:
+    start: float = perf_counter()
+    async with AioMultipartWriter(
+            config['client'], compressor=get_compressor(config), **writer_args(config, file_metadata, get_retry(config, file_metadata))) as output:
+        await output.writelines(map(get_serializer(config), stream_data))
+    object_uploaded(config, file_metadata, output, start)
+
+
+async def _list_parts(client: Any, **kwargs: Any) -> List[Dict]:
+    return [part async for page in client.get_paginator('list_parts').paginate(**kwargs) for part in page.get('Parts', [])]
+
+
+async def resume_upload(config: Dict[str, Any], file_metadata: Dict, retry: Retry) -> Optional[UploadManifest]:
+    '''Manifest of the file multipart upload, once the one left in progress by a previous run is resumed or aborted'''
+    manifest: Optional[UploadManifest] = get_manifest(config, file_metadata, max(config.get('part_size', PART_SIZE), MIN_PART_SIZE))
+    if manifest is None or manifest.upload_id is None:
+        return manifest
+
+    resume: Optional[bool] = resumable(config, manifest)
+    try:
+        if resume:
+            return upload_resumed(manifest, await retry.call_async(_list_parts, config['client'], **upload_args(config, file_metadata, manifest)))
+        elif resume is None:
+            return None
+
+        await retry.call_async(config['client'].abort_multipart_upload, **upload_args(config, file_metadata, manifest))
+    except ClientError as error:
+        return upload_restarted(config, file_metadata, manifest, error)
+
+    return upload_restarted(config, file_metadata, manifest)
+
+
+async def upload_file(config: Dict[str, Any], file_metadata: Dict, buffer: Optional[bytearray] = None) -> None:
+    if config.get('local', False):
+        return
+
+    retry: Retry = get_retry(config, file_metadata)
+    # NOTE: the uploads from memory are not resumed, their data being lost with the process
+    manifest: Optional[UploadManifest] = None if buffer is not None else await resume_upload(config, file_metadata, retry)
+
+    if upload_size(file_metadata, buffer) > 0:
+        async with AioMultipartWriter(config['client'], **writer_args(config, file_metadata, retry, manifest)) as output:
+            if buffer is not None:
+                await output.write_buffer(memoryview(buffer))
+            else:
+                await output.write_file(file_metadata['absolute_path'])
+        file_uploaded(config, file_metadata, output, buffer)
@@ -0,0 +1,87 @@
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from base64 import b64decode, b64encode
+import hashlib
+import zlib
+
+
+class Checksum(NamedTuple):
+    '''S3 additional checksum algorithm
+
+    Parameters
+    ----------
+    name : str
+        S3 `ChecksumAlgorithm` name
+    new : Callable
+        factory returning an incremental hasher, with the `update` and `digest` methods
+    '''
+    name: str
+    new: Callable[[], Any]
+
+    @property
+    def parameter(self) -> str:
+        '''Name of the S3 request and response checksum value parameter, e.g. `ChecksumCRC32C`'''
+        return f'Checksum{self.name}'
+
+
+class CRC32:
+    '''Incremental CRC32, with the `hashlib` interface'''
+
+    def __init__(self) -> None:
+        self.value: int = 0
+
+    def update(self, data: bytes) -> None:
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(4, 'big')
+
+
+def _crc32c() -> Any:
+    try:
+        import crc32c
+    except ImportError as error:
+        raise ImportError("The 'crc32c' checksum requires the crc32c package: pip install target-s3-jsonl[crc32c]") from error
+
+    return crc32c.CRC32CHash()
+
+
+CHECKSUMS: Dict[str, Checksum] = {
+    'crc32': Checksum('CRC32', CRC32),
+    'crc32c': Checksum('CRC32C', _crc32c),
+    'sha1': Checksum('SHA1', hashlib.sha1),
+    'sha256': Checksum('SHA256', hashlib.sha256),
+}
+
+
+def get_checksum(config: Dict[str, Any]) -> Optional[Checksum]:
+    '''Checksum algorithm selected by the `checksum_algorithm` config option, None by default'''
+    name: str = f"{config.get('checksum_algorithm', 'none')}".lower() or 'none'
+    if name == 'none':
+        return None
+
+    if name not in CHECKSUMS:
+        raise NotImplementedError(
+            "Checksum algorithm '{}' is not supported. "
+            "Expected: 'none', {}"
+            .format(name, ', '.join(f"'{item}'" for item in CHECKSUMS)))
+
+    return CHECKSUMS[name]
+
+
+def encode(digest: bytes) -> str:
+    return b64encode(digest).decode('ascii')
+
+
+def data_checksum(checksum: Checksum, data: bytes) -> str:
+    hasher: Any = checksum.new()
+    hasher.update(data)
+    return encode(hasher.digest())
+
+
+def composite_checksum(checksum: Checksum, part_checksums: List[str]) -> str:
+    '''Checksum of a multipart upload object, as computed by S3: the checksum of the concatenated part checksums, and the number of parts'''
+    hasher: Any = checksum.new()
+    for part_checksum in part_checksums:
+        hasher.update(b64decode(part_checksum))
+
+    return f'{encode(hasher.digest())}-{len(part_checksums)}'
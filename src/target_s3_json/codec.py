@@ -0,0 +1,164 @@
+from typing import Any, Callable, Deque, Dict, NamedTuple, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from importlib.metadata import entry_points
+from io import BufferedWriter, RawIOBase, TextIOWrapper
+from pathlib import Path
+import lzma
+import zlib
+
+from .multipart import NoCompressor
+
+# NOTE: entry point group used by the third party packages to register their own codecs
+ENTRY_POINT_GROUP: str = 'target_s3_json.codecs'
+GZIP_BLOCK_SIZE: int = 1024 ** 2
+
+
+class Codec(NamedTuple):
+    '''Compression codec
+
+    Parameters
+    ----------
+    extension : str
+        file extension appended to the `path_template`
+    compressor : Callable
+        factory returning an incremental compressor from the config. The compressor exposes the `compress` and `flush` methods.
+    '''
+    extension: str
+    compressor: Callable[[Dict[str, Any]], Any]
+
+
+CODECS: Dict[str, Codec] = {}
+
+
+def register_codec(name: str, extension: str, compressor: Callable[[Dict[str, Any]], Any]) -> None:
+    '''Register a compression codec available through the `compression` config option.
+
+    Third party packages can also expose a `Codec` through a `target_s3_json.codecs` entry point named after the codec.
+    '''
+    CODECS[name.lower()] = Codec(extension, compressor)
+
+
+class ParallelGzipCompressor:
+    '''Block parallel gzip compressor.
+
+    The data is cut into `block_size` blocks compressed as independent gzip members on a thread pool, `zlib` releasing the GIL.
+    The concatenated members, returned in order, form a standard multi member `.gz` file.
+    '''
+
+    def __init__(self, level: int = 9, workers: int = 2, block_size: int = GZIP_BLOCK_SIZE) -> None:
+        self.level: int = level
+        self.workers: int = max(workers, 1)
+        self.block_size: int = block_size
+        self.buffer: bytearray = bytearray()
+        self.blocks: Deque[Future] = deque()
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def _compress_block(self, block: bytes) -> bytes:
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(block) + compressor.flush()
+
+    def _submit(self) -> None:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.blocks.append(self.executor.submit(self._compress_block, bytes(self.buffer)))
+        self.buffer.clear()
+
+    def _pop(self, wait: bool = False) -> bytes:
+        output = bytearray()
+        # NOTE: at most 2 blocks per worker are kept in memory
+        while self.blocks and (wait or self.blocks[0].done() or len(self.blocks) > 2 * self.workers):
+            output += self.blocks.popleft().result()
+        return bytes(output)
+
+    def compress(self, data: bytes) -> bytes:
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self._submit()
+
+        return self._pop()
+
+    def flush(self) -> bytes:
+        if self.buffer or not self.blocks:
+            self._submit()
+        output = self._pop(wait=True)
+        self.executor.shutdown()  # type: ignore
+        self.executor = None
+
+        return output
+
+
+def _gzip_compressor(config: Dict[str, Any]) -> Any:
+    if config.get('compression_workers', 1) > 1:
+        return ParallelGzipCompressor(config.get('compression_level', 9), config['compression_workers'], config.get('compression_block_size', GZIP_BLOCK_SIZE))
+    return zlib.compressobj(config.get('compression_level', 9), zlib.DEFLATED, 31)  # NOTE: wbits=31 gzip container, same as `gzip.compress`
+
+
+def _zstd_compressor(config: Dict[str, Any]) -> Any:
+    try:
+        import zstandard
+    except ImportError as error:
+        raise ImportError("The 'zstd' compression requires the zstandard package: pip install target-s3-jsonl[zstd]") from error
+
+    return zstandard.ZstdCompressor(level=config.get('compression_level', 3), threads=config.get('compression_workers', 0)).compressobj()
+
+
+register_codec('none', '', lambda config: NoCompressor())
+register_codec('gzip', '.gz', _gzip_compressor)
+register_codec('lzma', '.xz', lambda config: lzma.LZMACompressor(preset=config.get('compression_level')))
+register_codec('zstd', '.zst', _zstd_compressor)
+
+
+def _load_entry_points() -> None:
+    group: Any = entry_points()
+    for entry_point in group.select(group=ENTRY_POINT_GROUP) if hasattr(group, 'select') else group.get(ENTRY_POINT_GROUP, []):
+        if entry_point.name.lower() not in CODECS:
+            register_codec(entry_point.name, *entry_point.load())
+
+
+def get_codec(config: Dict[str, Any]) -> Codec:
+    compression: str = f"{config.get('compression', 'none')}".lower() or 'none'
+    if compression not in CODECS:
+        _load_entry_points()
+
+    if compression not in CODECS:
+        raise NotImplementedError(
+            "Compression type '{}' is not supported. "
+            "Expected: {}"
+            .format(compression, ', '.join(f"'{item}'" for item in CODECS)))
+
+    return CODECS[compression]
+
+
+class CompressedFile(RawIOBase):
+    '''Writable binary file compressing the data written with an incremental compressor'''
+
+    def __init__(self, path: Path, compressor: Any, mode: str = 'ab') -> None:
+        self.file = open(path, mode)
+        self.compressor: Any = compressor
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.file.write(self.compressor.compress(bytes(data)))
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.file.write(self.compressor.flush())
+            self.file.close()
+        super().close()
+
+
+def open_func(config: Dict[str, Any]) -> Callable:
+    '''File opener of the `compression` codec, appending a new compressed member or frame to the file on each call'''
+    compression: str = f"{config.get('compression', 'none')}".lower() or 'none'
+    codec: Codec = get_codec(config)
+
+    def open_compressed(path: Path, mode: str = 'ab', encoding: Optional[str] = None) -> Any:
+        output = BufferedWriter(CompressedFile(path, codec.compressor(config), mode.replace('t', '').replace('b', '') + 'b'))
+        return TextIOWrapper(output, encoding=encoding) if 't' in mode else output
+
+    open_compressed.__name__ = f'{compression}_open'
+    return open_compressed
@@ -0,0 +1,181 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from pathlib import Path, PurePosixPath
+import argparse
+import json
+
+from botocore.client import BaseClient
+
+from .codec import get_codec
+from .multipart import MAX_PARTS, MIN_PART_SIZE
+from .retry import Retry
+from .s3 import config_s3, get_client, get_encryption_args, get_retry
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+MAX_OBJECT_SIZE: int = 32 * 1024 ** 2
+TARGET_SIZE: int = 256 * 1024 ** 2
+# NOTE: S3 DeleteObjects limit
+MAX_DELETE_KEYS: int = 1000
+
+
+def list_objects(client: BaseClient, bucket: str, prefix: str, suffix: str, max_size: int = MAX_OBJECT_SIZE) -> List[Dict[str, Any]]:
+    '''Objects under the `prefix` ending with the `suffix` and smaller than `max_size`, ordered by key'''
+    return sorted((
+        item for page in client.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix) for item in page.get('Contents', [])
+        if item['Key'].endswith(suffix) and item['Size'] < max_size), key=lambda item: item['Key'])
+
+
+def plan(objects: List[Dict[str, Any]], target_size: int = TARGET_SIZE, min_objects: int = 2) -> Iterator[List[Dict[str, Any]]]:
+    '''Batches of consecutive objects of the same directory, each batch concatenated into an object of at most `target_size` bytes'''
+    batch: List[Dict[str, Any]] = []
+    for item in objects + [{'Key': '', 'Size': target_size}]:
+        full: bool = sum(source['Size'] for source in batch) + item['Size'] > target_size or len(batch) >= MAX_PARTS // 2
+        if batch and (full or PurePosixPath(item['Key']).parent != PurePosixPath(batch[0]['Key']).parent):
+            if len(batch) >= min_objects:
+                yield batch
+            batch = []
+        batch.append(item)
+
+
+def compacted_key(batch: List[Dict[str, Any]], suffix: str) -> str:
+    return f"{batch[0]['Key'].removesuffix(suffix)}-compacted-{len(batch)}{suffix}"
+
+
+def _read_range(client: BaseClient, **kwargs: Any) -> bytes:
+    return client.get_object(**kwargs)['Body'].read()
+
+
+class PartCopier:
+    '''Multipart upload of the concatenation of S3 objects.
+
+    The objects of at least 5 MiB are copied server side by `UploadPartCopy`.
+    As every part but the last one must be at least 5 MiB, the smaller objects are read and buffered into parts of 5 MiB,
+    topped up with the first bytes of the next large object when needed.
+    The sources are read or copied only if their ETag is unchanged.
+    '''
+
+    def __init__(self, client: BaseClient, bucket: str, key: str, upload_id: str, retry: Retry) -> None:
+        self.client: BaseClient = client
+        self.bucket: str = bucket
+        self.key: str = key
+        self.upload_id: str = upload_id
+        self.retry: Retry = retry
+        self.buffer: bytearray = bytearray()
+        self.parts: List[Dict[str, Any]] = []
+        self.copied_bytes: int = 0
+
+    def _part_args(self) -> Dict[str, Any]:
+        return {'Bucket': self.bucket, 'Key': self.key, 'UploadId': self.upload_id, 'PartNumber': len(self.parts) + 1}
+
+    def _read(self, source: Dict[str, Any], start: int, end: int) -> None:
+        self.buffer += self.retry.call(
+            _read_range, self.client, Bucket=self.bucket, Key=source['Key'], IfMatch=source['ETag'], Range=f'bytes={start}-{end - 1}')
+
+    def flush(self) -> None:
+        if self.buffer:
+            response: Dict[str, Any] = self.retry.call(self.client.upload_part, Body=bytes(self.buffer), **self._part_args())
+            self.parts.append({'ETag': response['ETag'], 'PartNumber': len(self.parts) + 1})
+            self.buffer.clear()
+
+    def add(self, source: Dict[str, Any]) -> None:
+        offset: int = 0
+        if self.buffer and source['Size'] >= MIN_PART_SIZE:
+            offset = MIN_PART_SIZE - len(self.buffer)
+            self._read(source, 0, offset)
+            self.flush()
+
+        if source['Size'] - offset >= MIN_PART_SIZE:
+            response: Dict[str, Any] = self.retry.call(
+                self.client.upload_part_copy,
+                CopySource={'Bucket': self.bucket, 'Key': source['Key']},
+                CopySourceIfMatch=source['ETag'],
+                **({'CopySourceRange': f"bytes={offset}-{source['Size'] - 1}"} if offset else {}),
+                **self._part_args())
+            self.parts.append({'ETag': response['CopyPartResult']['ETag'], 'PartNumber': len(self.parts) + 1})
+            self.copied_bytes += source['Size'] - offset
+        elif source['Size'] > offset:
+            self._read(source, offset, source['Size'])
+            if len(self.buffer) >= MIN_PART_SIZE:
+                self.flush()
+
+
+def compact_objects(config: Dict[str, Any], batch: List[Dict[str, Any]], suffix: str) -> str:
+    '''Concatenate the `batch` objects into a new object, then delete them once the new object is verified'''
+    client: BaseClient = config['client']
+    bucket: str = config['s3_bucket']
+    key: str = compacted_key(batch, suffix)
+    size: int = sum(source['Size'] for source in batch)
+    retry: Retry = get_retry(config, {'relative_path': key})
+    _, encryption_args = get_encryption_args(config)
+
+    upload_id: str = retry.call(client.create_multipart_upload, Bucket=bucket, Key=key, **encryption_args.get('ExtraArgs', {}))['UploadId']
+    copier = PartCopier(client, bucket, key, upload_id, retry)
+    try:
+        for source in batch:
+            copier.add(source)
+        copier.flush()
+        retry.call(client.complete_multipart_upload, Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': copier.parts})
+    except Exception:
+        retry.call(client.abort_multipart_upload, Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+
+    # NOTE: the sources are deleted only once the compacted object is found with the expected size
+    compacted_size: int = retry.call(client.head_object, Bucket=bucket, Key=key)['ContentLength']
+    if compacted_size != size:
+        retry.call(client.delete_object, Bucket=bucket, Key=key)
+        raise ValueError(f'Compacted object s3://{bucket}/{key} of {compacted_size} bytes instead of {size}, the source objects are kept')
+
+    for index in range(0, len(batch), MAX_DELETE_KEYS):
+        response: Dict[str, Any] = retry.call(client.delete_objects, Bucket=bucket, Delete={
+            'Objects': [{'Key': source['Key']} for source in batch[index:index + MAX_DELETE_KEYS]], 'Quiet': True})
+        if response.get('Errors'):
+            raise ValueError(f"Unable to delete the objects compacted into s3://{bucket}/{key}: {response['Errors']}")
+
+    LOGGER.info('%d objects compacted into s3://%s/%s, %d of %d bytes copied server side', len(batch), bucket, key, copier.copied_bytes, size)
+    return key
+
+
+def compact(config: Dict[str, Any], prefix: str, suffix: Optional[str] = None, max_size: int = MAX_OBJECT_SIZE, target_size: int = TARGET_SIZE,
+            dry_run: bool = False) -> List[Tuple[str, int]]:
+    '''Compact the small objects under the `prefix`.
+
+    The objects are concatenated as they are, which keeps the JSON Lines valid as well as the `gzip`, `lzma` and `zstd` files,
+    these formats supporting concatenated members, streams and frames. `suffix` defaults to `.json` and the `compression` extension.
+    '''
+    if config.get('output_format') == 'parquet' or (suffix or '').endswith('.parquet'):
+        raise NotImplementedError(
+            "The 'parquet' files can't be concatenated. "
+            "Expected: the 'jsonl' output format")
+
+    suffix = suffix if suffix is not None else '.json' + get_codec(config).extension
+    compacted: List[Tuple[str, int]] = []
+    for batch in plan(list_objects(config['client'], config['s3_bucket'], prefix, suffix, max_size), target_size):
+        if dry_run:
+            LOGGER.info('%d objects to compact into s3://%s/%s', len(batch), config['s3_bucket'], compacted_key(batch, suffix))
+            compacted.append((compacted_key(batch, suffix), len(batch)))
+        else:
+            compacted.append((compact_objects(config, batch, suffix), len(batch)))
+
+    return compacted
+
+
+def main() -> None:
+    '''Compaction command'''
+    parser = argparse.ArgumentParser(description='Concatenate the small objects under an S3 prefix into larger ones, server side when possible.')
+    parser.add_argument('-c', '--config', help='Config file', required=True)
+    parser.add_argument('-p', '--prefix', help='S3 key prefix of the objects to compact', default='')
+    parser.add_argument('--suffix', help="Suffix of the objects to compact. Default: '.json' and the `compression` extension")
+    parser.add_argument('--max-size', type=int, default=MAX_OBJECT_SIZE, help='Size in bytes below which an object is compacted')
+    parser.add_argument('--target-size', type=int, default=TARGET_SIZE, help='Maximum size in bytes of the compacted objects')
+    parser.add_argument('--dry-run', action='store_true', help='Only log the planned compactions')
+    args = parser.parse_args()
+
+    config: Dict[str, Any] = config_s3(json.loads(Path(args.config).read_text(encoding='utf-8')))
+    config['client'] = get_client(config)
+    compacted: List[Tuple[str, int]] = compact(config, args.prefix, args.suffix, args.max_size, args.target_size, args.dry_run)
+    LOGGER.info('%d compacted objects%s', len(compacted), ' planned' if args.dry_run else '')
+
+
+if __name__ == '__main__':
+    main()
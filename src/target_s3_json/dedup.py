@@ -0,0 +1,71 @@
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set, Tuple
+import json
+
+from .serializer import get_serializer
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+
+def _hashable(value: Any) -> Hashable:
+    # NOTE: the object and array key values are compared by their JSON text
+    return json.dumps(value, sort_keys=True, default=str) if isinstance(value, (dict, list)) else value
+
+
+def record_key(record: Any, key_properties: Sequence[str]) -> Optional[Tuple]:
+    '''Values of the `key_properties` of the record, None if one of them is missing.
+
+    The records of the `passthrough` mode, kept as their JSON line, are decoded for their key.
+    '''
+    if isinstance(record, (bytes, str)):
+        record = json.loads(record)
+    if not isinstance(record, dict) or any(key not in record for key in key_properties):
+        return None
+    return tuple(_hashable(record[key]) for key in key_properties)
+
+
+class Deduplicator:
+    '''Deduplication of the buffered records by the `key_properties` of their stream, available as `config['dedup']`.
+
+    Before a buffer of records is serialized, only the last version of each key is kept, at the position of that last version,
+    the keys seen being indexed by a set of the key values. The records without key properties, or missing one, are kept.
+    The records are deduplicated within a buffer only, so the memory used is bounded by the `memory_buffer`,
+    and nothing is deduplicated with a `file_size`, the records being written one at a time.
+
+    The records and the serialized bytes removed are reported by the `dedup_records` and `dedup_bytes` metrics.
+    '''
+
+    def __init__(self) -> None:
+        self.key_properties: Dict[str, List[str]] = {}
+
+    def set_key_properties(self, stream: str, key_properties: List[str]) -> None:
+        self.key_properties[stream] = list(key_properties)
+
+    def deduplicate(self, stream: Optional[str], config: Dict[str, Any], records: List) -> None:
+        '''Remove from the `records` of the `stream` the previous versions of each key, in place'''
+        key_properties: List[str] = self.key_properties.get(stream, []) if stream is not None else []
+        if not key_properties or len(records) < 2:
+            return
+
+        seen: Set[Tuple] = set()
+        kept: List = []
+        removed: List = []
+        for record in reversed(records):
+            key: Optional[Tuple] = record_key(record, key_properties)
+            if key is None or key not in seen:
+                if key is not None:
+                    seen.add(key)
+                kept.append(record)
+            else:
+                removed.append(record)
+
+        if not removed:
+            return
+
+        kept.reverse()
+        records[:] = kept
+        size: int = sum(map(len, map(get_serializer(config), removed)))
+        LOGGER.debug('%d duplicate records of stream %s removed, %d bytes', len(removed), stream, size)
+        if config.get('metrics') is not None:
+            config['metrics'].increment('dedup_records', len(removed), stream=stream)
+            config['metrics'].increment('dedup_bytes', size, stream=stream)
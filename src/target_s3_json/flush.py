@@ -0,0 +1,113 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from asyncio import Lock, sleep
+from time import monotonic
+
+from target.file import _get_relative_path
+
+from .serializer import write
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+FLUSH_INTERVAL: float = 1.0
+
+
+def next_part(stream: str, stream_data: Dict, config: Dict[str, Any]) -> None:
+    '''Continue the stream with its next file part'''
+    stream_data[stream]['part'] += 1
+    relative_path: str = _get_relative_path(stream=stream, config=config, date_time=config['date_time'], part=stream_data[stream]['part'])
+    stream_data[stream]['path'] |= {
+        stream_data[stream]['part']: {
+            'relative_path': relative_path,
+            'absolute_path': config['work_path'] / relative_path}}
+
+
+async def rotate_file(
+    stream: str, stream_data: Dict, config: Dict[str, Any], save: Callable = write, post_processing: Optional[Callable] = None
+) -> None:
+    '''Write the buffered records and post process the file of the stream, before its `file_size` or the stream closure,
+    then continue with the next file part. Same as the `file_size` rotation of `save_json`.
+    '''
+    file_info: Dict = stream_data[stream]
+    file_metadata: Dict = file_info['path'][file_info['part']]
+    await save(config, file_metadata, file_info['file_data'])
+    if post_processing:
+        await post_processing(config, file_metadata)
+    LOGGER.debug("File '%s' rotated", file_metadata['absolute_path'])
+
+    next_part(stream, stream_data, config)
+
+
+class FlushScheduler:
+    '''Rotation of the files by age and records count, available as `config['flush']`.
+
+    A file is closed, and post processed, once it holds `max_records` records, or `max_object_age_seconds` after its first record,
+    the stream continuing with the next file part. The age is checked in the background by `run`, so the records of the quiet streams
+    are delivered on time, while the files of the busy ones are still cut by the `memory_buffer` or the `file_size`.
+
+    Parameters
+    ----------
+    rotate : Callable
+        coroutine function closing the file of the `stream` of its `stream_data`, called with the `config`
+    files : Callable
+        function returning the stream, stream data and config of the files open
+    max_object_age_seconds : float, optional
+        maximum number of seconds between the first record of a file and its rotation
+    max_records : int, optional
+        maximum number of records of a file
+    '''
+
+    def __init__(self, rotate: Callable[[str, Dict, Dict[str, Any]], Awaitable[Any]], files: Callable[[], Iterable[Tuple[str, Dict, Dict[str, Any]]]],
+                 max_object_age_seconds: Optional[float] = None, max_records: Optional[int] = None) -> None:
+        self.rotate: Callable[[str, Dict, Dict[str, Any]], Awaitable[Any]] = rotate
+        self.files: Callable[[], Iterable[Tuple[str, Dict, Dict[str, Any]]]] = files
+        self.max_object_age_seconds: Optional[float] = max_object_age_seconds
+        self.max_records: Optional[int] = max_records
+        self.error: Optional[BaseException] = None
+
+    async def _rotate(self, stream: str, stream_data: Dict, config: Dict[str, Any]) -> None:
+        # NOTE: the parquet files are closed, the next part being opened by the next record
+        stream_data[stream]['path'][stream_data[stream]['part']].pop('opened_at', None)
+        await self.rotate(stream, stream_data, config)
+        config['metrics'].increment('rotations', stream=stream)
+        if config.get('memory'):
+            config['memory'].release()
+
+    async def record(self, stream: str, stream_data: Dict, config: Dict[str, Any]) -> None:
+        '''Count the record written to the file of the stream, and rotate the file once it holds `max_records` records'''
+        file_metadata: Dict = stream_data[stream]['path'][stream_data[stream]['part']]
+        file_metadata.setdefault('opened_at', monotonic())
+        file_metadata['record_count'] = file_metadata.get('record_count', 0) + 1
+
+        if self.max_records and file_metadata['record_count'] >= self.max_records:
+            await self._rotate(stream, stream_data, config)
+
+    def close(self, stream: str, stream_data: Dict) -> None:
+        '''The file of the closed stream is no longer rotated'''
+        stream_data[stream]['path'][stream_data[stream]['part']].pop('opened_at', None)
+
+    async def flush(self) -> None:
+        '''Rotate the files older than `max_object_age_seconds`'''
+        now: float = monotonic()
+        for stream, stream_data, config in list(self.files()):
+            opened_at: Optional[float] = stream_data[stream]['path'][stream_data[stream]['part']].get('opened_at')
+            if opened_at is not None and now - opened_at >= self.max_object_age_seconds:  # type: ignore[operator]
+                LOGGER.debug('File of stream %s open for more than %ss rotated', stream, self.max_object_age_seconds)
+                await self._rotate(stream, stream_data, config)
+
+    async def run(self, lock: Lock, interval: float = FLUSH_INTERVAL) -> None:
+        '''Rotate the files older than `max_object_age_seconds` every `interval` seconds, the error being kept for the `Loader` to raise.
+
+        The `lock` is held while the records are written, the files being rotated in between.
+        '''
+        try:
+            while True:
+                await sleep(interval)
+                async with lock:
+                    await self.flush()
+        except Exception as error:
+            self.error = error
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise self.error
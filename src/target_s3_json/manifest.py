@@ -0,0 +1,93 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pathlib import Path
+from uuid import uuid4
+import json
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+
+def _key(template: str, config: Dict[str, Any], stream: Optional[str] = None) -> str:
+    return template.format(stream=stream, date_time=config['date_time'], uuid=uuid4())
+
+
+class OutputManifest:
+    '''Manifest of the objects written by the run, available as `config['manifest']`.
+
+    Every uploaded file is listed with its record count, uncompressed and compressed sizes, ETag and `checksum_algorithm` checksum,
+    and the minimum and maximum values of the `manifest_field` record field,
+    so the downstream jobs find the new objects without listing the bucket.
+
+    The run manifest is uploaded to the `manifest_key` once every file is uploaded,
+    and one manifest per stream to the `manifest_stream_key`. Both are `path_template` like templates.
+    '''
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.config: Dict[str, Any] = config
+        self.field: Optional[str] = config.get('manifest_field')
+        self.files: List[Dict[str, Any]] = []
+
+    def record(self, file_metadata: Dict, record: Any) -> None:
+        '''Count the `record` written to the file, and update its `manifest_field` range'''
+        file_metadata['records'] = file_metadata.get('records', 0) + 1
+
+        # NOTE: the `passthrough` records are not parsed, so their field values are unknown
+        value: Any = record.get(self.field) if self.field and isinstance(record, dict) else None
+        if value is None:
+            return
+        try:
+            if 'min' not in file_metadata or value < file_metadata['min']:
+                file_metadata['min'] = value
+            if 'max' not in file_metadata or value > file_metadata['max']:
+                file_metadata['max'] = value
+        except TypeError:
+            LOGGER.warning("Field '%s' value %r not comparable with the range [%r, %r] of %s",
+                           self.field, value, file_metadata['min'], file_metadata['max'], file_metadata['relative_path'])
+
+    def add(self, file_metadata: Dict) -> None:
+        '''List the uploaded file'''
+        if not file_metadata.get('compressed_size'):
+            return
+
+        self.files.append({
+            'key': file_metadata['relative_path'],
+            'stream': file_metadata.get('stream'),
+            'records': file_metadata.get('records'),
+            'size': file_metadata.get('size'),
+            'compressed_size': file_metadata['compressed_size'],
+            'etag': file_metadata.get('etag'),
+            'checksum': file_metadata.get('checksum')} | ({
+                'min': file_metadata.get('min'), 'max': file_metadata.get('max')} if self.field else {}))
+
+    def content(self, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            'bucket': None if self.config.get('local', False) else self.config.get('s3_bucket'),
+            'date_time': self.config['date_time'].isoformat(),
+            'checksum_algorithm': f"{self.config.get('checksum_algorithm', 'none')}".lower() or 'none',
+            'field': self.field,
+            'records': sum(item['records'] or 0 for item in files),
+            'size': sum(item['size'] or 0 for item in files),
+            'compressed_size': sum(item['compressed_size'] for item in files),
+            'files': sorted(files, key=lambda item: item['key'])}
+
+    def manifests(self) -> Dict[str, Dict[str, Any]]:
+        '''Content of the run and streams manifests, by key'''
+        manifests: Dict[str, Dict[str, Any]] = {}
+        if self.config.get('manifest_key'):
+            manifests[_key(self.config['manifest_key'], self.config)] = self.content(self.files)
+        if self.config.get('manifest_stream_key'):
+            for stream in sorted({item['stream'] for item in self.files if item['stream'] is not None}):
+                manifests[_key(self.config['manifest_stream_key'], self.config, stream)] = self.content(
+                    [item for item in self.files if item['stream'] == stream]) | {'stream': stream}
+
+        return manifests
+
+    async def save(self, upload: Callable[[Dict[str, Any], Dict], Awaitable[Any]]) -> None:
+        '''Write the manifests to the `work_dir`, then `upload` them like the data files'''
+        for key, content in self.manifests().items():
+            path: Path = self.config['work_path'] / key
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(content, ensure_ascii=False, default=str, indent=2), encoding='utf-8')
+
+            await upload(self.config, {'relative_path': key, 'absolute_path': path})
+            LOGGER.info('Manifest of %d files written at %s', len(content['files']), key)
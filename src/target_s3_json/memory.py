@@ -0,0 +1,75 @@
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import sys
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+
+def record_size(value: Any) -> int:
+    '''Approximate memory used by a record, its nested values included'''
+    size: int = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(record_size(key) + record_size(item) for key, item in value.items())
+    elif isinstance(value, list):
+        size += sum(record_size(item) for item in value)
+    return size
+
+
+def _file_metadata(stream: str, stream_data: Dict) -> Dict:
+    return stream_data[stream]['path'][stream_data[stream]['part']]
+
+
+class MemoryBudget:
+    '''Memory budget shared by the records buffered by every stream, available as `config['memory']`.
+
+    Once the records buffered exceed the `budget` bytes, the largest buffers are spilled to their file in the `work_dir`,
+    uploaded with the file later on, so the memory used stays bounded whatever the number of streams.
+    The files buffered in memory by `upload_from_memory` are accounted for, and spilled along with their records.
+
+    Parameters
+    ----------
+    budget : int
+        maximum number of bytes of the records buffered
+    spill : Callable
+        coroutine function writing the buffered records of the `stream` of its `stream_data` to its file, called with the `config`
+    '''
+
+    def __init__(self, budget: int, spill: Callable[[str, Dict, Dict[str, Any]], Awaitable[Any]]) -> None:
+        self.budget: int = budget
+        self.spill: Callable[[str, Dict, Dict[str, Any]], Awaitable[Any]] = spill
+        self.size: int = 0
+        self.spilled_bytes: int = 0
+        # NOTE: the stream, its stream data and config, the memory used, the buffered records size and count, by records buffer
+        self.buffers: Dict[int, Tuple[str, Dict, Dict[str, Any], int, int, int]] = {}
+
+    def release(self) -> None:
+        '''Release the buffers written to their file, or uploaded'''
+        for key in [key for key, (stream, stream_data, *_) in self.buffers.items()
+                    if not stream_data[stream]['file_data'] and not _file_metadata(stream, stream_data).get('buffer')]:
+            self.size -= self.buffers.pop(key)[3]
+
+    async def add(self, stream: str, stream_data: Dict, config: Dict[str, Any], record: Any) -> None:
+        '''Account for the record once buffered, and spill the largest buffers when over budget'''
+        file_data: List = stream_data[stream].get('file_data') or []
+        if not file_data or file_data[-1] is not record:
+            return  # NOTE: the record is already written to its file
+
+        key: int = id(file_data)
+        if key not in self.buffers:
+            # NOTE: the buffers of the files closed since are released
+            self.release()
+        previous, records_size, count = self.buffers[key][3:] if key in self.buffers else (0, 0, 0)
+        # NOTE: a buffer written to its file since only holds its last records
+        records_size = records_size + record_size(record) if len(file_data) == count + 1 else sum(record_size(item) for item in file_data)
+        # NOTE: with `upload_from_memory`, the records written are buffered compressed until the file is uploaded
+        size: int = records_size + len(_file_metadata(stream, stream_data).get('buffer') or b'')
+        self.size += size - previous
+        self.buffers[key] = (stream, stream_data, config, size, records_size, len(file_data))
+
+        while self.size > self.budget and self.buffers:
+            key, (stream, stream_data, config, size, *_) = max(self.buffers.items(), key=lambda item: item[1][3])
+            LOGGER.debug('Memory budget of %d bytes exceeded, %d bytes of stream %s spilled', self.budget, size, stream)
+            await self.spill(stream, stream_data, config)
+            del self.buffers[key]
+            self.size -= size
+            self.spilled_bytes += size
@@ -0,0 +1,195 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from asyncio import sleep
+from bisect import bisect_left
+from pathlib import Path
+from threading import RLock
+import json
+import socket
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+METRICS_INTERVAL: float = 60
+METRICS_PREFIX: str = 'target_s3_json'
+HISTOGRAM_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))
+
+Key = Tuple[str, Optional[str]]
+
+
+class Histogram:
+    '''Cumulative histogram of the observed values, Prometheus style'''
+
+    def __init__(self, buckets: Tuple[float, ...] = HISTOGRAM_BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = buckets
+        self.counts: List[int] = [0] * len(buckets)
+        self.count: int = 0
+        self.sum: float = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[min(bisect_left(self.buckets, value), len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.sum += value
+
+    def copy(self) -> 'Histogram':
+        histogram: Histogram = Histogram(self.buckets)
+        histogram.counts, histogram.count, histogram.sum = self.counts[:], self.count, self.sum
+        return histogram
+
+    def cumulative_counts(self) -> List[int]:
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class Metrics:
+    '''Runtime metrics of the target, available as `config['metrics']`.
+
+    The metrics are tagged by stream, and emitted every `metrics_interval` seconds and at the end of the run
+    as Singer `METRIC` log lines, and optionally to a Prometheus textfile (`metrics_prometheus_file`)
+    and a StatsD UDP server (`metrics_statsd_host`, `metrics_statsd_port`).
+
+    - `records_in` : records received, the duplicates removed included
+    - `bytes_in` : uncompressed bytes uploaded
+    - `bytes_out` : compressed bytes uploaded
+    - `compression_ratio` : `bytes_in` / `bytes_out`
+    - `upload_duration_seconds` : upload duration histogram
+    - `queue_depth` : files pending or in flight in the upload scheduler
+    - `inflight_bytes` : bytes uploaded at the same time
+    - `retries` : upload requests retries
+    - `throttles` : upload requests throttled by S3
+    - `buffered_bytes` : memory used by the records buffered, with a `memory_budget`
+    - `spilled_bytes` : memory released by writing the largest buffers to their file, with a `memory_budget`
+    - `rotations` : files closed by `max_object_age_seconds` or `max_records`
+    - `dedup_records` : duplicate records removed, with `deduplicate_records`
+    - `dedup_bytes` : serialized bytes of the duplicate records removed, with `deduplicate_records`
+    '''
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        self.counters: Dict[Key, float] = {}
+        self.gauges: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+        self.samplers: Dict[Key, Callable[[], float]] = {}
+        self.sent: Dict[Key, float] = {}
+        # NOTE: the metrics are updated by the upload threads as well as the event loop
+        self.lock: RLock = RLock()
+
+        self.prometheus_file: Optional[Path] = Path(config['metrics_prometheus_file']).expanduser() if config.get('metrics_prometheus_file') else None
+        self.statsd_address: Optional[Tuple[str, int]] = (config['metrics_statsd_host'], config.get('metrics_statsd_port', 8125)) \
+            if config.get('metrics_statsd_host') else None
+        self.statsd: Optional[socket.socket] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM) if self.statsd_address else None
+
+    def increment(self, name: str, value: float = 1, stream: Optional[str] = None) -> None:
+        with self.lock:
+            self.counters[(name, stream)] = self.counters.get((name, stream), 0) + value
+
+    def gauge(self, name: str, value: float, stream: Optional[str] = None) -> None:
+        with self.lock:
+            self.gauges[(name, stream)] = value
+
+    def sample(self, name: str, sampler: Callable[[], float], stream: Optional[str] = None) -> None:
+        '''Gauge set to the `sampler` value on each emission'''
+        with self.lock:
+            self.samplers[(name, stream)] = sampler
+
+    def observe(self, name: str, value: float, stream: Optional[str] = None) -> None:
+        with self.lock:
+            self.histograms.setdefault((name, stream), Histogram()).observe(value)
+        self._send_statsd([_statsd_line(name, value * 1000, 'ms', stream)])
+
+    def upload(self, stream: Optional[str], bytes_in: Optional[int], bytes_out: int, duration: float) -> None:
+        '''Record a completed upload'''
+        with self.lock:
+            if bytes_in:
+                self.increment('bytes_in', bytes_in, stream)
+            self.increment('bytes_out', bytes_out, stream)
+            if self.counters.get(('bytes_in', stream)) and self.counters[('bytes_out', stream)]:
+                self.gauge('compression_ratio', self.counters[('bytes_in', stream)] / self.counters[('bytes_out', stream)], stream)
+        self.observe('upload_duration_seconds', duration, stream)
+
+    def emit(self) -> None:
+        '''Emit the current metrics values to the sinks, from a snapshot taken at once'''
+        with self.lock:
+            for key, sampler in self.samplers.items():
+                self.gauges[key] = sampler()
+            counters: Dict[Key, float] = dict(self.counters)
+            gauges: Dict[Key, float] = dict(self.gauges)
+            histograms: Dict[Key, Histogram] = {key: histogram.copy() for key, histogram in self.histograms.items()}
+
+        for (name, stream), value in counters.items():
+            LOGGER.info('METRIC: %s', json.dumps({'type': 'counter', 'metric': name, 'value': value, 'tags': _tags(stream)}))
+        for (name, stream), value in gauges.items():
+            LOGGER.info('METRIC: %s', json.dumps({'type': 'gauge', 'metric': name, 'value': value, 'tags': _tags(stream)}))
+        for (name, stream), histogram in histograms.items():
+            LOGGER.info('METRIC: %s', json.dumps({'type': 'histogram', 'metric': name, 'value': {
+                'count': histogram.count, 'sum': histogram.sum,
+                'buckets': {f'{bucket}': count for bucket, count in zip(histogram.buckets, histogram.cumulative_counts())}}, 'tags': _tags(stream)}))
+
+        if self.prometheus_file:
+            self._write_prometheus(counters, gauges, histograms)
+
+        lines: List[str] = []
+        for key, value in counters.items():
+            # NOTE: StatsD counters are incremented by the difference since the last emission
+            if value != self.sent.get(key, 0):
+                lines.append(_statsd_line(key[0], value - self.sent.get(key, 0), 'c', key[1]))
+                self.sent[key] = value
+        lines.extend(_statsd_line(name, value, 'g', stream) for (name, stream), value in gauges.items())
+        self._send_statsd(lines)
+
+    def _send_statsd(self, lines: List[str]) -> None:
+        if self.statsd and lines:
+            try:
+                self.statsd.sendto('\n'.join(lines).encode('utf-8'), self.statsd_address)  # type: ignore[arg-type]
+            except OSError as error:
+                LOGGER.warning('Unable to send the metrics to StatsD: %s', error)
+
+    def _write_prometheus(self, counters: Dict[Key, float], gauges: Dict[Key, float], histograms: Dict[Key, Histogram]) -> None:
+        lines: List[str] = []
+        for metric_type, series in (('counter', counters), ('gauge', gauges)):
+            for name in sorted({name for name, _ in series}):
+                metric = f'{METRICS_PREFIX}_{name}' + ('_total' if metric_type == 'counter' else '')
+                lines.append(f'# TYPE {metric} {metric_type}')
+                lines.extend(f'{metric}{_labels(stream)} {value}' for (item, stream), value in series.items() if item == name)
+
+        for name in sorted({name for name, _ in histograms}):
+            metric = f'{METRICS_PREFIX}_{name}'
+            lines.append(f'# TYPE {metric} histogram')
+            for (item, stream), histogram in histograms.items():
+                if item == name:
+                    lines.extend(f'{metric}_bucket{_labels(stream, le="+Inf" if bucket == float("inf") else f"{bucket}")} {count}'
+                                 for bucket, count in zip(histogram.buckets, histogram.cumulative_counts()))
+                    lines.append(f'{metric}_sum{_labels(stream)} {histogram.sum}')
+                    lines.append(f'{metric}_count{_labels(stream)} {histogram.count}')
+
+        # NOTE: atomic replace, the node exporter textfile collector never reads a partial file
+        temp_file: Path = self.prometheus_file.with_name(self.prometheus_file.name + '.tmp')  # type: ignore[union-attr]
+        temp_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+        temp_file.replace(self.prometheus_file)  # type: ignore[arg-type]
+
+    async def run(self, interval: float = METRICS_INTERVAL) -> None:
+        '''Emit the metrics every `interval` seconds'''
+        while True:
+            await sleep(interval)
+            self.emit()
+
+    def close(self) -> None:
+        self.emit()
+        if self.statsd:
+            self.statsd.close()
+
+
+def _tags(stream: Optional[str]) -> Dict[str, str]:
+    return {} if stream is None else {'stream': stream}
+
+
+def _labels(stream: Optional[str], **labels: str) -> str:
+    labels = _tags(stream) | labels
+    return '{' + ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"')) for key, value in labels.items()) + '}' if labels else ''
+
+
+def _statsd_line(name: str, value: float, metric_type: str, stream: Optional[str]) -> str:
+    # NOTE: DogStatsD tags extension, supported by Telegraf and the Datadog agent
+    return f'{METRICS_PREFIX}.{name}:{value:.15g}|{metric_type}' + (f'|#stream:{stream}' if stream is not None else '')
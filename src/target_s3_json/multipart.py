@@ -0,0 +1,349 @@
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from abc import ABC, abstractmethod
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from itertools import count
+
+from .checksum import Checksum, composite_checksum, data_checksum, encode
+from .resume import UploadManifest
+from .retry import Retry
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+# NOTE: S3 multipart upload limits https://docs.aws.amazon.com/AmazonS3/latest/userguide/qfacts.html
+MIN_PART_SIZE: int = 5 * 1024 ** 2
+MAX_PARTS: int = 10000
+PART_SIZE: int = 8 * 1024 ** 2
+
+
+class NoCompressor:
+    '''Identity compressor exposing the `compress` / `flush` interface of `zlib.compressobj` and `lzma.LZMACompressor`'''
+
+    def compress(self, data: bytes) -> bytes:
+        # NOTE: e.g. the memoryview of a shared memory block, returned as bytes
+        return bytes(data)
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class PartBuffer:
+    '''Compressed data buffer cut into multipart upload parts.
+
+    The data written is passed through an incremental `compressor` and buffered until `part_size` compressed bytes are available.
+    With a `checksum` algorithm, the compressed data is hashed as it is buffered, and the checksum of the last part is available as `part_checksum`.
+
+    Parameters
+    ----------
+    compressor : object, optional
+        incremental compressor with the `compress` and `flush` methods. No compression by default.
+    part_size : int
+        compressed part size in bytes, 8 MiB by default. S3 requires at least 5 MiB.
+    checksum : Checksum, optional
+        checksum algorithm of the parts
+    '''
+
+    def __init__(self, compressor: Optional[Any] = None, part_size: int = PART_SIZE, checksum: Optional[Checksum] = None) -> None:
+        self.compressor: Any = compressor or NoCompressor()
+        self.part_size: int = max(part_size, MIN_PART_SIZE)
+        self.buffer: bytearray = bytearray()
+        self.size: int = 0
+        self.compressed_size: int = 0
+        self.checksum: Optional[Checksum] = checksum
+        self.hasher: Any = checksum.new() if checksum else None
+        self.part_checksum: Optional[str] = None
+
+    def _append(self, data: bytes) -> None:
+        self.buffer += data
+        if self.hasher:
+            self.hasher.update(data)
+
+    def write(self, data: bytes) -> Optional[bytearray]:
+        '''Buffer the compressed `data`, and return the buffer content once a full part is available'''
+        self.size += len(data)
+        self._append(self.compressor.compress(data))
+
+        return self.pop() if len(self.buffer) >= self.part_size else None
+
+    def flush(self) -> bytearray:
+        '''Return the remaining compressed data'''
+        self._append(self.compressor.flush())
+
+        return self.pop()
+
+    def pop(self) -> bytearray:
+        # NOTE: the buffer is handed over as the part body, without copy
+        body: bytearray = self.buffer
+        self.buffer = bytearray()
+        self.compressed_size += len(body)
+        if self.hasher:
+            self.part_checksum = encode(self.hasher.digest())
+            self.hasher = self.checksum.new()  # type: ignore[union-attr]
+
+        return body
+
+
+class MultipartUpload(ABC):
+    '''Streaming S3 object upload state, shared by the `MultipartWriter` and the `aiobotocore` writer.
+
+    The data written is compressed and cut into parts by a `PartBuffer`.
+    Each full part is sent as a multipart upload part while the data is still being written, at most `max_concurrency` parts at a time.
+    The memory used is then bounded to roughly `(max_concurrency + 1) * part_size`, whatever the object size.
+
+    Objects smaller than `part_size` are sent with a single `put_object` call on `close`.
+    Any exception raised within the context manager aborts the multipart upload.
+    The object ETag is available as `etag` once the writer is closed.
+
+    The writers only send the requests, the request arguments, parts, checksums and manifest being handled here.
+
+    Parameters
+    ----------
+    client : BaseClient
+        S3 client
+    bucket : str
+        destination S3 bucket
+    key : str
+        destination S3 key
+    compressor : object, optional
+        incremental compressor with the `compress` and `flush` methods. No compression by default.
+    part_size : int
+        compressed part size in bytes, 8 MiB by default. S3 requires at least 5 MiB.
+    max_concurrency : int
+        maximum number of parts uploaded in parallel
+    extra_args : dict, optional
+        extra arguments provided to the `put_object` or `create_multipart_upload` calls, e.g. the encryption settings
+    retry : Retry, optional
+        retry policy of each request, so a failed part is sent again alone. Not retried by default.
+    manifest : UploadManifest, optional
+        manifest saving the upload state, so an interrupted upload is left in progress to be resumed instead of aborted.
+        The upload it records, if any, is resumed by `write_file`.
+    checksum : Checksum, optional
+        additional checksum algorithm. Each part is sent with its checksum, computed while the data is compressed and verified by S3.
+        The object checksum is then available as `object_checksum` once the writer is closed.
+    '''
+
+    def __init__(self, client: Any, bucket: str, key: str, compressor: Optional[Any] = None,
+                 part_size: int = PART_SIZE, max_concurrency: int = 4, extra_args: Optional[Dict[str, Any]] = None,
+                 retry: Optional[Retry] = None, manifest: Optional[UploadManifest] = None, checksum: Optional[Checksum] = None) -> None:
+        self.client: Any = client
+        self.bucket: str = bucket
+        self.key: str = key
+        self.part_buffer: PartBuffer = PartBuffer(compressor, part_size, checksum)
+        self.max_concurrency: int = max(max_concurrency, 1)
+        self.extra_args: Dict[str, Any] = extra_args or {}
+        self.retry: Optional[Retry] = retry
+        self.manifest: Optional[UploadManifest] = manifest
+        self.checksum: Optional[Checksum] = checksum
+
+        self.upload_id: Optional[str] = manifest.upload_id if manifest else None
+        self.parts: Dict[int, Any] = {}
+        self.etag: Optional[str] = None
+        self.object_checksum: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return self.part_buffer.size
+
+    @property
+    def compressed_size(self) -> int:
+        return self.part_buffer.compressed_size
+
+    def _checksum_args(self, value: Optional[str]) -> Dict[str, str]:
+        return {self.checksum.parameter: value} if self.checksum and value else {}
+
+    def _part(self, part_number: int, response: Dict[str, Any]) -> Dict[str, Any]:
+        return {'ETag': response['ETag'], 'PartNumber': part_number} | self._checksum_args(response.get(self.checksum.parameter) if self.checksum else None)
+
+    @abstractmethod
+    def _uploaded(self, result: Dict[str, Any]) -> Any:
+        '''Completed future of a part already uploaded, set to the part upload `result`'''
+
+    def _chunks(self, input_file: BinaryIO) -> Iterator[Tuple[int, Optional[Dict[str, Any]], bytes]]:
+        '''Part number and chunk of `part_size` bytes of the file to send,
+        or result of the part already uploaded according to the `manifest`, its chunk being skipped'''
+        uploaded: Dict[int, str] = self.manifest.parts if self.manifest and self.upload_id else {}
+        checksums: Dict[int, str] = self.manifest.checksums if self.manifest and self.upload_id else {}
+        for part_number in count(1):
+            if part_number in uploaded:
+                part_checksum: Optional[str] = checksums.get(part_number)
+                if self.checksum and not part_checksum:
+                    # NOTE: a part uploaded but not saved in the manifest, nor listed with its checksum, is hashed again, the file being sent as is
+                    part_checksum = data_checksum(self.checksum, input_file.read(self.part_buffer.part_size))
+                input_file.seek(part_number * self.part_buffer.part_size)
+                yield part_number, {'ETag': uploaded[part_number]} | self._checksum_args(part_checksum), b''
+                continue
+
+            chunk: bytes = input_file.read(self.part_buffer.part_size)
+            if not chunk:
+                return
+            yield part_number, None, chunk
+
+    def _slices(self, data: memoryview) -> Iterator[memoryview]:
+        for start in range(0, len(data), self.part_buffer.part_size):
+            yield data[start:start + self.part_buffer.part_size]
+
+    def _create_args(self) -> Dict[str, Any]:
+        return {'Bucket': self.bucket, 'Key': self.key, **({'ChecksumAlgorithm': self.checksum.name} if self.checksum else {}), **self.extra_args}
+
+    def _started(self, response: Dict[str, Any]) -> None:
+        self.upload_id = response['UploadId']
+        if self.manifest:
+            self.manifest.start(self.upload_id)
+        LOGGER.debug('Multipart upload %s started for s3://%s/%s', self.upload_id, self.bucket, self.key)
+
+    def _next_part_number(self) -> int:
+        part_number: int = len(self.parts) + 1
+        if part_number > MAX_PARTS:
+            raise ValueError(f'Multipart upload exceeding {MAX_PARTS} parts for s3://{self.bucket}/{self.key}, increase the `part_size`')
+        return part_number
+
+    def _part_args(self, part_number: int, body: bytearray, part_checksum: Optional[str]) -> Dict[str, Any]:
+        return {'Bucket': self.bucket, 'Key': self.key, 'UploadId': self.upload_id, 'PartNumber': part_number, 'Body': body,
+                **self._checksum_args(part_checksum)}
+
+    def _part_sent(self, part_number: int, response: Dict[str, Any], part_checksum: Optional[str]) -> Dict[str, Any]:
+        if self.manifest:
+            self.manifest.add_part(part_number, response['ETag'], part_checksum)
+
+        return response | self._checksum_args(part_checksum)
+
+    def _put_args(self, body: bytearray) -> Dict[str, Any]:
+        return {'Body': body, 'Bucket': self.bucket, 'Key': self.key, **self._checksum_args(self.part_buffer.part_checksum), **self.extra_args}
+
+    def _put(self, response: Dict[str, Any]) -> None:
+        self.etag = response.get('ETag')
+        self.object_checksum = self.part_buffer.part_checksum
+
+    def _complete_args(self, parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        return {'Bucket': self.bucket, 'Key': self.key, 'UploadId': self.upload_id, 'MultipartUpload': {'Parts': parts}}
+
+    def _completed(self, response: Dict[str, Any], parts: List[Dict[str, Any]]) -> None:
+        self.etag = response.get('ETag')
+        if self.checksum:
+            self.object_checksum = composite_checksum(self.checksum, [part[self.checksum.parameter] for part in parts])
+
+    def _closed(self, parts: List[Dict[str, Any]]) -> None:
+        if self.manifest:
+            self.manifest.remove()
+        LOGGER.debug('Multipart upload %s completed for s3://%s/%s with %d parts', self.upload_id, self.bucket, self.key, len(parts))
+
+    def _upload_args(self) -> Dict[str, Any]:
+        return {'Bucket': self.bucket, 'Key': self.key, 'UploadId': self.upload_id}
+
+    def _left_in_progress(self) -> bool:
+        '''Whether the interrupted upload is left in progress, to be resumed by the next run according to the `manifest`'''
+        if self.manifest:
+            LOGGER.warning('Multipart upload %s interrupted for s3://%s/%s, resumed by the next run', self.upload_id, self.bucket, self.key)
+        return self.manifest is not None
+
+    def _aborted(self) -> None:
+        LOGGER.warning('Multipart upload %s aborted for s3://%s/%s', self.upload_id, self.bucket, self.key)
+
+
+class MultipartWriter(MultipartUpload):
+    '''Streaming S3 object writer, the parts being uploaded by a thread pool with the boto3 `client`. See `MultipartUpload`.'''
+
+    def __init__(self, client: 'BaseClient', bucket: str, key: str, compressor: Optional[Any] = None,
+                 part_size: int = PART_SIZE, max_concurrency: int = 4, extra_args: Optional[Dict[str, Any]] = None,
+                 retry: Optional[Retry] = None, manifest: Optional[UploadManifest] = None, checksum: Optional[Checksum] = None) -> None:
+        super().__init__(client, bucket, key, compressor, part_size, max_concurrency, extra_args, retry, manifest, checksum)
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> 'MultipartWriter':
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _call(self, function: Callable[..., Dict[str, Any]], **kwargs: Any) -> Dict[str, Any]:
+        return self.retry.call(function, **kwargs) if self.retry else function(**kwargs)
+
+    def _uploaded(self, result: Dict[str, Any]) -> Future:
+        future: Future = Future()
+        future.set_result(result)
+        return future
+
+    def write(self, data: bytes) -> int:
+        body: Optional[bytearray] = self.part_buffer.write(data)
+        if body is not None:
+            self._upload_part(body)
+
+        return len(data)
+
+    def writelines(self, lines: Iterable[bytes]) -> None:
+        for line in lines:
+            self.write(line)
+
+    def write_file(self, path: Path) -> None:
+        '''Send the file content, except the parts already uploaded according to the `manifest`'''
+        with path.open('rb') as input_file:
+            for part_number, result, chunk in self._chunks(input_file):
+                if result is None:
+                    self.write(chunk)
+                else:
+                    self.parts[part_number] = self._uploaded(result)
+
+    def write_buffer(self, data: memoryview) -> None:
+        '''Send the data buffered in memory, by slices of `part_size` bytes'''
+        for chunk in self._slices(data):
+            self.write(chunk)  # type: ignore[arg-type]
+
+    def _send_part(self, part_number: int, body: bytearray, part_checksum: Optional[str] = None) -> Dict[str, Any]:
+        return self._part_sent(part_number, self._call(self.client.upload_part, **self._part_args(part_number, body, part_checksum)), part_checksum)
+
+    def _upload_part(self, body: bytearray) -> None:
+        if self.upload_id is None:
+            self._started(self._call(self.client.create_multipart_upload, **self._create_args()))
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+        part_number: int = self._next_part_number()
+
+        # NOTE: Wait for a free upload slot, this is what bounds the memory used
+        pending: Set[Future] = {future for future in self.parts.values() if not future.done()}
+        while len(pending) >= self.max_concurrency:
+            _, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in self.parts.values():
+            if future.done():
+                future.result()  # NOTE: raise the part upload error as soon as it's known
+
+        self.parts[part_number] = self.executor.submit(self._send_part, part_number, body, self.part_buffer.part_checksum)
+
+    def close(self) -> None:
+        body: bytearray = self.part_buffer.flush()
+
+        if self.upload_id is None:
+            self._put(self._call(self.client.put_object, **self._put_args(body)))
+            return
+
+        try:
+            if body:
+                self._upload_part(body)
+
+            parts: List[Dict[str, Any]] = [self._part(part_number, future.result()) for part_number, future in sorted(self.parts.items())]
+            self._completed(self._call(self.client.complete_multipart_upload, **self._complete_args(parts)), parts)
+        except Exception:
+            self.abort()
+            raise
+
+        if self.executor:
+            self.executor.shutdown()
+        self._closed(parts)
+
+    def abort(self) -> None:
+        if self.upload_id is not None:
+            for future in self.parts.values():
+                future.cancel()
+            if self.executor:
+                self.executor.shutdown()
+            if self._left_in_progress():
+                return
+            self._call(self.client.abort_multipart_upload, **self._upload_args())
+            self._aborted()
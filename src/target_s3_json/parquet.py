@@ -0,0 +1,196 @@
+from typing import Any, Callable, Dict, List, Optional
+from asyncio import to_thread
+from datetime import date, datetime, timezone
+import json
+
+try:
+    import pyarrow
+    from pyarrow import parquet
+except ImportError as error:
+    raise ImportError("The 'parquet' output format requires the pyarrow package: pip install target-s3-jsonl[parquet]") from error
+
+from target.file import set_schema as file_set_schema
+
+from .flush import next_part
+from .serializer import written_records
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+PARQUET_ROW_GROUP_SIZE: int = 64 * 1024
+PARQUET_COMPRESSION: str = 'snappy'
+
+
+def _json_string(value: Any) -> Optional[str]:
+    return value if value is None or isinstance(value, str) else json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    date_time = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    # NOTE: the naive date-time values are assumed in UTC
+    return date_time if date_time.tzinfo else date_time.replace(tzinfo=timezone.utc)
+
+
+def _date(value: Optional[str]) -> Optional[date]:
+    return None if value is None else date.fromisoformat(value[:10])
+
+
+def _types(schema: Dict) -> List[str]:
+    types = schema.get('type', [])
+    return [types] if isinstance(types, str) else [item for item in types if item != 'null']
+
+
+def arrow_type(schema: Dict) -> pyarrow.DataType:
+    '''Arrow data type of a Singer JSON schema property.
+
+    The properties without a single type, the objects without `properties` and the arrays without `items` are saved as JSON strings.
+    '''
+    types = _types(schema)
+    if set(types) == {'integer', 'number'}:
+        types = ['number']
+
+    if len(types) != 1 or 'anyOf' in schema:
+        return pyarrow.string()
+    elif types[0] == 'string':
+        return {'date-time': pyarrow.timestamp('us', tz='UTC'), 'date': pyarrow.date32()}.get(schema.get('format', ''), pyarrow.string())
+    elif types[0] == 'integer':
+        return pyarrow.int64()
+    elif types[0] == 'number':
+        return pyarrow.float64()
+    elif types[0] == 'boolean':
+        return pyarrow.bool_()
+    elif types[0] == 'object' and schema.get('properties'):
+        return pyarrow.struct([pyarrow.field(name, arrow_type(item)) for name, item in schema['properties'].items()])
+    elif types[0] == 'array' and schema.get('items'):
+        return pyarrow.list_(arrow_type(schema['items']))
+    return pyarrow.string()
+
+
+def arrow_schema(schema: Dict) -> pyarrow.Schema:
+    '''Arrow schema of a Singer JSON schema. Every column is nullable, and the record properties missing from the schema are dropped.'''
+    return pyarrow.schema([pyarrow.field(name, arrow_type(item)) for name, item in schema.get('properties', {}).items()])
+
+
+def _converter(data_type: pyarrow.DataType) -> Optional[Callable[[Any], Any]]:
+    '''Function converting the JSON values to the Python values expected by the Arrow data type, None if no conversion is required'''
+    if pyarrow.types.is_timestamp(data_type):
+        return _timestamp
+    elif pyarrow.types.is_date(data_type):
+        return _date
+    elif pyarrow.types.is_string(data_type):
+        return _json_string
+    elif pyarrow.types.is_struct(data_type):
+        converters = {data_type.field(index).name: _converter(data_type.field(index).type) for index in range(data_type.num_fields)}
+        if any(converters.values()):
+            return lambda value: None if value is None else {
+                name: converter(value.get(name)) if converter else value.get(name) for name, converter in converters.items()}
+    elif pyarrow.types.is_list(data_type):
+        converter = _converter(data_type.value_type)
+        if converter:
+            return lambda value: None if value is None else [converter(item) for item in value]
+    return None
+
+
+def record_batch(schema: pyarrow.Schema, records: List[Dict]) -> pyarrow.RecordBatch:
+    '''Columnar record batch of the records'''
+    arrays = []
+    for field in schema:
+        converter = _converter(field.type)
+        arrays.append(pyarrow.array(
+            [converter(record.get(field.name)) for record in records] if converter else [record.get(field.name) for record in records],
+            type=field.type))
+
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def config_parquet(config_default: Dict[str, Any]) -> Dict[str, Any]:
+    config: Dict[str, Any] = {
+        'parquet_row_group_size': PARQUET_ROW_GROUP_SIZE,
+        'parquet_compression': PARQUET_COMPRESSION
+    } | config_default
+
+    if f"{config.get('compression', 'none')}".lower() not in {'', 'none'}:
+        raise NotImplementedError(
+            "Compression type '{}' is not supported with the 'parquet' output format. "
+            "Expected: 'none', the columns are compressed using `parquet_compression`"
+            .format(config.get('compression')))
+
+    # NOTE: the parquet columns compression codec is validated before reading the stream
+    if f"{config['parquet_compression']}".upper() not in {'NONE', 'SNAPPY', 'GZIP', 'BROTLI', 'LZ4', 'ZSTD'}:
+        raise NotImplementedError(
+            "Parquet compression type '{}' is not supported. "
+            "Expected: 'none', 'snappy', 'gzip', 'brotli', 'lz4' or 'zstd'"
+            .format(config['parquet_compression']))
+
+    config['path_template'] = config['path_template'].removesuffix('.json') + '.parquet'
+    config['open_func'] = open
+
+    return config
+
+
+def set_schema(stream: str, config: Dict, stream_data: Dict, schema: Dict = {}) -> None:
+    file_set_schema(stream, config, stream_data, schema)
+    # NOTE: a new schema of an existing stream is written in the next file part
+    stream_data[stream]['schema'] = arrow_schema(schema.get('schema', {}))
+
+
+async def write_row_group(stream: str, stream_data: Dict, config: Dict[str, Any]) -> None:
+    '''Append the buffered records of the stream to its parquet file as a new row group'''
+    file_info: Dict = stream_data[stream]
+    if not file_info['file_data']:
+        return
+
+    file_metadata: Dict = file_info['path'][file_info['part']]
+    written_records(config, file_metadata, file_info['file_data'])
+    if file_info.get('writer') is None:
+        file_metadata['absolute_path'].parent.mkdir(parents=True, exist_ok=True)
+        file_info['writer'] = parquet.ParquetWriter(
+            file_metadata['absolute_path'].as_posix(), file_info['schema'], compression=config.get('parquet_compression', PARQUET_COMPRESSION))
+
+    batch: pyarrow.RecordBatch = await to_thread(record_batch, file_info['writer'].schema, file_info['file_data'])
+    await to_thread(file_info['writer'].write_batch, batch, row_group_size=config.get('parquet_row_group_size', PARQUET_ROW_GROUP_SIZE))
+
+    del file_info['file_data'][:]
+
+
+async def close_file(stream: str, stream_data: Dict, config: Dict[str, Any], post_processing: Optional[Callable] = None) -> None:
+    '''Write the remaining records and close the parquet file of the stream'''
+    await write_row_group(stream, stream_data, config)
+
+    file_info: Dict = stream_data[stream]
+    if file_info.get('writer') is not None:
+        await to_thread(file_info.pop('writer').close)
+        file_info['path'][file_info['part']]['closed'] = True
+        if post_processing:
+            await post_processing(config, file_info['path'][file_info['part']])
+        LOGGER.debug("File '%s' saved using the parquet writer", file_info['path'][file_info['part']]['absolute_path'])
+
+
+async def save_parquet(
+    stream: str, stream_data: Dict, config: Dict[str, Any], record: Optional[Dict[Any, Any]] = None, post_processing: Optional[Callable] = None
+) -> None:
+    '''Buffer the records of the stream and append them to its parquet file by row groups of `parquet_row_group_size` records.
+
+    The file is closed, and post processed, once over `file_size` bytes, on a schema change, or at the closure (no more records).
+    '''
+
+    file_info: Dict = stream_data[stream]
+
+    # NOTE: Closure: no more records
+    if record is None:
+        await close_file(stream, stream_data, config, post_processing)
+        return
+
+    writer = file_info.get('writer')
+    if writer is not None and (not writer.schema.equals(file_info['schema']) or (
+            config.get('file_size') is not None and file_info['path'][file_info['part']]['absolute_path'].stat().st_size >= config['file_size'])):
+        await close_file(stream, stream_data, config, post_processing)
+
+    if file_info['path'][file_info['part']].get('closed'):
+        next_part(stream, stream_data, config)
+
+    file_info['file_data'].append(record)
+    if len(file_info['file_data']) >= config.get('parquet_row_group_size', PARQUET_ROW_GROUP_SIZE):
+        await write_row_group(stream, stream_data, config)
@@ -0,0 +1,129 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import re
+
+from target.file import _get_relative_path
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+MAX_OPEN_PARTITIONS: int = 64
+# NOTE: `path_template` field of a record value, e.g. `{record.event_date}` or `{record.address.region:.2}`
+RECORD_FIELD = re.compile(r'\{record\.([^{}!:]+)(![rsa])?(?::([^{}]*))?\}')
+# NOTE: Hive partition values conventions, also read by Athena
+HIVE_DEFAULT_PARTITION: str = '__HIVE_DEFAULT_PARTITION__'
+HIVE_ESCAPED_CHARS: str = '"#%\'*/:=?\\\x7f{[]^'
+CONVERSIONS: Dict[str, Callable[[Any], str]] = {'r': repr, 's': str, 'a': ascii}
+
+
+def partition_fields(path_template: str) -> List[str]:
+    '''Record fields of the `path_template`, in order'''
+    return [match.group(1) for match in RECORD_FIELD.finditer(path_template)]
+
+
+def _field_value(record: Dict, field: str) -> Any:
+    value: Any = record
+    for name in field.split('.'):
+        value = value.get(name) if isinstance(value, dict) else None
+    return value
+
+
+def partition_value(value: Any, conversion: Optional[str] = None, format_spec: Optional[str] = None) -> str:
+    '''Partition directory name of a record value, escaped as by Hive'''
+    if value is None:
+        return HIVE_DEFAULT_PARTITION
+
+    text: str = format(CONVERSIONS[conversion[1]](value) if conversion else value, format_spec or '')
+    if text == '':
+        return HIVE_DEFAULT_PARTITION
+
+    return ''.join(f'%{ord(char):02X}' if char in HIVE_ESCAPED_CHARS or ord(char) < 0x20 else char for char in text)
+
+
+def partition_template(path_template: str, record: Dict) -> str:
+    '''`path_template` with its record fields replaced by the record values'''
+    return RECORD_FIELD.sub(
+        lambda match: partition_value(_field_value(record, match.group(1)), match.group(2), match.group(3)).replace('}', '}}'), path_template)
+
+
+class PartitionWriters:
+    '''Files of the stream partitions, the records being routed to the file of the `path_template` record fields values.
+
+    At most `max_open_partitions` files are open at the same time. Opening one more file closes, and post processes,
+    the least recently written one, so the memory used stays bounded whatever the number of partitions.
+    The `memory_buffer` is shared by the open files. A partition written again once closed continues with the next file part.
+
+    Parameters
+    ----------
+    config : dict
+        configuration dictionary
+    set_schemas : Callable
+        function used to process the schemas, applied to each partition
+    writeline : Callable
+        function used to save the records of a partition
+    max_open_partitions : int
+        maximum number of files open at the same time
+    '''
+
+    def __init__(self, config: Dict[str, Any], set_schemas: Callable, writeline: Callable, max_open_partitions: int = MAX_OPEN_PARTITIONS) -> None:
+        self.config: Dict[str, Any] = config
+        self.set_schemas: Callable = set_schemas
+        self.writeline: Callable = writeline
+        self.max_open_partitions: int = max(max_open_partitions, 1)
+
+        self.schemas: Dict[str, Dict] = {}
+        # NOTE: ordered from the least to the most recently written, the partition config and stream data by stream and partition template
+        self.writers: OrderedDict[Tuple[str, str], Tuple[Dict[str, Any], Dict]] = OrderedDict()
+        self.parts: Dict[Tuple[str, str], int] = {}
+
+    def set_schema(self, stream: str, config: Dict, stream_data: Dict, schema: Dict = {}) -> None:
+        '''`set_schemas` alternative, the schema is applied to the open files of the stream and to the partitions opened later'''
+        self.schemas[stream] = schema
+        # NOTE: the stream closure closes the files of its partitions
+        stream_data.setdefault(stream, {})
+
+        for (writer_stream, _), (partition_config, partition_data) in self.writers.items():
+            if writer_stream == stream:
+                self.set_schemas(stream, partition_config, partition_data, schema)
+
+    def _open(self, stream: str, template: str) -> Tuple[Dict[str, Any], Dict]:
+        partition_config: Dict[str, Any] = self.config | {'path_template': template}
+        if self.config.get('memory_buffer') is not None:
+            partition_config['memory_buffer'] = self.config['memory_buffer'] / self.max_open_partitions
+
+        part: int = self.parts.pop((stream, template), 0) + 1
+        relative_path: str = _get_relative_path(stream=stream, config=partition_config, date_time=partition_config['date_time'], part=part)
+        partition_data: Dict = {stream: {
+            'part': part,
+            'path': {part: {'relative_path': relative_path, 'absolute_path': partition_config['work_path'] / relative_path}},
+            'file_data': []}}
+        partition_data[stream]['path'][part]['absolute_path'].unlink(missing_ok=True)
+        self.set_schemas(stream, partition_config, partition_data, self.schemas.get(stream, {}))
+
+        return partition_config, partition_data
+
+    async def _close(self, stream: str, template: str) -> None:
+        partition_config, partition_data = self.writers.pop((stream, template))
+        await self.writeline(stream, partition_data, partition_config)
+        self.parts[(stream, template)] = partition_data[stream]['part']
+
+    async def get(self, stream: str, record: Dict) -> Tuple[Dict[str, Any], Dict]:
+        '''Partition config and stream data of the record, the least recently written file being closed when too many are open'''
+        template: str = partition_template(self.config['path_template'], record)
+        writer: Optional[Tuple[Dict[str, Any], Dict]] = self.writers.get((stream, template))
+        if writer is not None:
+            self.writers.move_to_end((stream, template))
+            return writer
+
+        if len(self.writers) >= self.max_open_partitions:
+            least_recent: Tuple[str, str] = next(iter(self.writers))
+            LOGGER.debug('Least recently written partition %s of stream %s closed', least_recent[1], least_recent[0])
+            await self._close(*least_recent)
+
+        self.writers[(stream, template)] = self._open(stream, template)
+        return self.writers[(stream, template)]
+
+    async def close(self, stream: str) -> None:
+        '''Close the files of the stream partitions'''
+        for writer_stream, template in [key for key in self.writers if key[0] == stream]:
+            await self._close(writer_stream, template)
@@ -0,0 +1,153 @@
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from asyncio import Future, Lock, to_thread, wrap_future
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+import marshal
+import pickle
+
+from .serializer import append, compress_data, compress_records, in_memory
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+# NOTE: config options of the serialization and compression, sent to the worker processes
+WORKER_OPTIONS: Tuple[str, ...] = ('compression', 'compression_level', 'json_serializer', 'passthrough')
+BATCH_RECORDS: int = 10000
+
+
+def dump_batch(records: List) -> bytes:
+    '''Records batch handed over to the worker processes, `marshal` being several times faster than `pickle` for the JSON values'''
+    try:
+        return b'm' + marshal.dumps(records)
+    except ValueError:
+        # NOTE: e.g. the `Decimal` or `datetime` values, serialized by the `default=str` of the serializers
+        return b'p' + pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_batch(data: Any) -> List:
+    '''Records batch of the `dump_batch` bytes, or memoryview'''
+    return marshal.loads(data[1:]) if data[:1] == b'm' else pickle.loads(data[1:])
+
+
+def share_batch(records: List, passthrough: bool = False) -> Tuple[SharedMemory, int]:
+    '''Shared memory block of the records batch, and its size.
+
+    The `passthrough` records, already serialized, are copied as they are, to be compressed from the block by the worker process.
+    '''
+    data: bytes = b''.join(records) if passthrough else dump_batch(records)
+    shared_memory = SharedMemory(create=True, size=max(len(data), 1))
+    shared_memory.buf[:len(data)] = data  # type: ignore[index]
+    return shared_memory, len(data)
+
+
+def compress_batch(name: str, size: int, options: Dict[str, Any]) -> Tuple[int, bytes]:
+    '''Serialize and compress the records batch read from the `name` shared memory block, in a worker process.
+
+    The batch is read from the block without being copied, the `passthrough` one being compressed as it is.
+
+    Returns
+    -------
+    out : tuple[int, bytes]
+        The serialized size, and the batch compressed as a complete member or frame appended to the file.
+    '''
+    shared_memory = SharedMemory(name)
+    try:
+        # NOTE: the view is released before the block is closed
+        with shared_memory.buf[:size] as data:  # type: ignore[index]
+            if options.get('passthrough'):
+                return size, compress_data(options, data)
+            records: List = load_batch(data)
+    finally:
+        shared_memory.close()
+
+    return compress_records(options, records)
+
+
+class CompressionPool:
+    '''Process pool serializing and compressing the record batches, available as `config['compression_pool']`.
+
+    The records written are cut into batches of `batch_records` records, handed over to the worker processes through shared memory blocks,
+    so the serialization and compression of every stream run on `processes` cores instead of the one of the event loop.
+    The worker processes read the batches from the shared memory blocks without copying them, and compress the `passthrough` ones as they are.
+    Each batch is compressed as an independent member or frame, appended to its file, or its buffer with `upload_from_memory`,
+    in the order the batches are written,
+    at most 2 batches per process being in flight. The codecs of third party packages are loaded by their entry point.
+
+    Parameters
+    ----------
+    config : dict
+        configuration dictionary
+    processes : int
+        number of worker processes
+    batch_records : int
+        maximum number of records of a batch
+    '''
+
+    def __init__(self, config: Dict[str, Any], processes: int, batch_records: int = BATCH_RECORDS) -> None:
+        self.config: Dict[str, Any] = config
+        self.options: Dict[str, Any] = {key: config[key] for key in WORKER_OPTIONS if key in config}
+        self.processes: int = max(processes, 1)
+        self.batch_records: int = max(batch_records, 1)
+        self.executor: ProcessPoolExecutor = ProcessPoolExecutor(max_workers=self.processes, mp_context=get_context('spawn'))
+        self.batches: Deque[Tuple[Dict, Future, SharedMemory]] = deque()
+        self.pending: Dict[Path, int] = {}
+        # NOTE: the batches are appended in order, by one coroutine at a time
+        self.lock: Lock = Lock()
+
+    def __enter__(self) -> 'CompressionPool':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _submit(self, file_metadata: Dict, records: List) -> None:
+        shared_memory, size = share_batch(records, self.options.get('passthrough', False))
+
+        future: Future = wrap_future(self.executor.submit(compress_batch, shared_memory.name, size, self.options))
+        self.batches.append((file_metadata, future, shared_memory))
+        self.pending[file_metadata['absolute_path']] = self.pending.get(file_metadata['absolute_path'], 0) + 1
+
+    async def _write_next(self) -> None:
+        file_metadata, future, shared_memory = self.batches.popleft()
+        try:
+            size, data = await future
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+        self.pending[file_metadata['absolute_path']] -= 1
+        if not self.pending[file_metadata['absolute_path']]:
+            del self.pending[file_metadata['absolute_path']]
+
+        if in_memory(self.config, file_metadata):
+            file_metadata.setdefault('buffer', bytearray()).extend(data)
+        else:
+            await to_thread(append, file_metadata['absolute_path'], data)
+        # NOTE: uncompressed size of the file, used by the `bytes_in` metric
+        file_metadata['size'] = file_metadata.get('size', 0) + size
+
+    async def write(self, file_metadata: Dict, records: List) -> None:
+        '''Compress the `records` of the file by batches in the worker processes, and append the batches already compressed to their file'''
+        for index in range(0, len(records), self.batch_records):
+            self._submit(file_metadata, records[index:index + self.batch_records])
+
+            async with self.lock:
+                while self.batches and (self.batches[0][1].done() or len(self.batches) > 2 * self.processes):
+                    await self._write_next()
+
+    async def flush(self, file_metadata: Optional[Dict] = None) -> None:
+        '''Append the batches of the file, of every file by default, once compressed'''
+        async with self.lock:
+            while self.batches and (file_metadata is None or file_metadata['absolute_path'] in self.pending):
+                await self._write_next()
+
+    def close(self) -> None:
+        for _, future, shared_memory in self.batches:
+            future.cancel()
+            shared_memory.close()
+            shared_memory.unlink()
+        self.batches.clear()
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,168 @@
+from typing import Any, Dict, List, Optional
+from pathlib import Path
+from hashlib import sha1
+from threading import Lock
+from time import time
+import json
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+MANIFEST_DIR: str = '.multipart'
+MULTIPART_ABORT_AGE: float = 24 * 60 * 60
+
+
+class UploadManifest:
+    '''State of an in-progress multipart upload of a local file, saved in the `work_dir`.
+
+    The manifest records the upload ID and the ETag of each completed part, so the upload of a file left by an interrupted run
+    is resumed by sending only the missing parts. It is saved again, atomically, each time a part is completed.
+
+    Parameters
+    ----------
+    path : Path
+        manifest file path
+    data : dict
+        manifest content: the `bucket`, `key`, local file `path` and `size`, `part_size`, `checksum_algorithm`, and once started the `upload_id`,
+        `initiated` timestamp, and completed `parts` ETags and `checksums` by part number
+    '''
+
+    def __init__(self, path: Path, data: Dict[str, Any]) -> None:
+        self.path: Path = path
+        self.data: Dict[str, Any] = data
+        self.lock: Lock = Lock()
+
+    @classmethod
+    def create(cls, config: Dict[str, Any], file_metadata: Dict[str, Any], part_size: int) -> 'UploadManifest':
+        return cls(manifest_path(config, file_metadata['relative_path']), {
+            'bucket': config.get('s3_bucket'),
+            'key': file_metadata['relative_path'],
+            'path': str(file_metadata['absolute_path']),
+            'size': file_metadata['absolute_path'].stat().st_size if file_metadata['absolute_path'].exists() else None,
+            'part_size': part_size,
+            'checksum_algorithm': _checksum_algorithm(config)})
+
+    @classmethod
+    def load(cls, path: Path) -> Optional['UploadManifest']:
+        try:
+            return cls(path, json.loads(path.read_text(encoding='utf-8')))
+        except (OSError, ValueError) as error:
+            LOGGER.warning('Invalid multipart upload manifest %s: %s', path, error)
+            return None
+
+    @property
+    def upload_id(self) -> Optional[str]:
+        return self.data.get('upload_id')
+
+    @property
+    def part_size(self) -> int:
+        return self.data['part_size']
+
+    @property
+    def parts(self) -> Dict[int, str]:
+        return {int(number): etag for number, etag in self.data.get('parts', {}).items()}
+
+    @property
+    def checksums(self) -> Dict[int, str]:
+        return {int(number): checksum for number, checksum in self.data.get('checksums', {}).items()}
+
+    @property
+    def age(self) -> float:
+        return time() - self.data.get('initiated', time())
+
+    def file_metadata(self) -> Dict[str, Any]:
+        return {'absolute_path': Path(self.data['path']), 'relative_path': self.data['key']}
+
+    def save(self) -> None:
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path: Path = self.path.with_name(self.path.name + '.tmp')
+            temp_path.write_text(json.dumps(self.data), encoding='utf-8')
+            temp_path.replace(self.path)
+
+    def start(self, upload_id: str) -> None:
+        self.data |= {'upload_id': upload_id, 'initiated': time(), 'parts': {}, 'checksums': {}}
+        self.save()
+
+    def add_part(self, part_number: int, etag: str, checksum: Optional[str] = None) -> None:
+        with self.lock:
+            self.data['parts'][f'{part_number}'] = etag
+            if checksum:
+                self.data.setdefault('checksums', {})[f'{part_number}'] = checksum
+        self.save()
+
+    def set_parts(self, parts: Dict[int, Dict[str, Any]]) -> None:
+        '''Parts uploaded as listed by S3, their checksum being kept when listed, or read from the manifest otherwise'''
+        with self.lock:
+            checksums: Dict[int, str] = self.checksums | {number: checksum for number, part in parts.items() if (checksum := part_checksum(part))}
+            self.data['parts'] = {f'{number}': part['ETag'] for number, part in sorted(parts.items())}
+            self.data['checksums'] = {f'{number}': checksum for number, checksum in sorted(checksums.items()) if number in parts}
+        self.save()
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def _checksum_algorithm(config: Dict[str, Any]) -> str:
+    return f"{config.get('checksum_algorithm', 'none')}".lower() or 'none'
+
+
+def manifest_path(config: Dict[str, Any], key: str) -> Path:
+    return Path(config['work_path'], MANIFEST_DIR, sha1(f"{config.get('s3_bucket')}/{key}".encode('utf-8')).hexdigest() + '.json')
+
+
+def get_manifest(config: Dict[str, Any], file_metadata: Dict[str, Any], part_size: int) -> Optional[UploadManifest]:
+    '''Manifest of the `file_metadata` upload: the one left by a previous run if any, a new one otherwise.
+
+    None if the resumable uploads are disabled by the `multipart_resume` config option.
+    '''
+    if not config.get('multipart_resume', True) or 'work_path' not in config:
+        return None
+
+    path: Path = manifest_path(config, file_metadata['relative_path'])
+    manifest: Optional[UploadManifest] = UploadManifest.load(path) if path.exists() else None
+
+    return manifest if manifest and manifest.upload_id else UploadManifest.create(config, file_metadata, part_size)
+
+
+def resumable(config: Dict[str, Any], manifest: UploadManifest) -> Optional[bool]:
+    '''Whether the upload left by a previous run is resumed (True), aborted (False) or left as is (None).
+
+    The uploads older than `multipart_abort_age` seconds, of a file modified since, or with another `checksum_algorithm`, are aborted.
+    The ones of a missing file are left to the run uploading it, until they are old enough to be aborted.
+    '''
+    if manifest.age >= config.get('multipart_abort_age', MULTIPART_ABORT_AGE) \
+            or manifest.data.get('checksum_algorithm', 'none') != _checksum_algorithm(config):
+        return False
+    if not Path(manifest.data['path']).exists():
+        return None
+    return Path(manifest.data['path']).stat().st_size == manifest.data.get('size')
+
+
+def part_checksum(part: Dict[str, Any]) -> Optional[str]:
+    '''Checksum value of a part listed by S3, e.g. its `ChecksumSHA256`, None if it has none'''
+    return next((value for key, value in part.items() if key.startswith('Checksum') and value), None)
+
+
+def uploaded_parts(manifest: UploadManifest, listed_parts: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    '''Parts already uploaded, as listed by S3 with their ETag and checksum, with the expected size'''
+    size: int = manifest.data['size']
+    return {
+        part['PartNumber']: part for part in listed_parts
+        if part['Size'] == min(manifest.part_size, size - (part['PartNumber'] - 1) * manifest.part_size)}
+
+
+def pending_uploads(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    '''Files of the multipart uploads left in progress in the `work_dir` by a previous run, to be resumed or aborted'''
+    if config.get('local', False) or not config.get('multipart_resume', True) or 'work_path' not in config \
+            or not Path(config['work_path'], MANIFEST_DIR).is_dir():
+        return []
+
+    uploads: List[Dict[str, Any]] = []
+    for path in sorted(Path(config['work_path'], MANIFEST_DIR).glob('*.json')):
+        manifest: Optional[UploadManifest] = UploadManifest.load(path)
+        if manifest and manifest.upload_id and manifest.data.get('bucket') == config.get('s3_bucket'):
+            LOGGER.info('Multipart upload %s of %s left in progress by a previous run', manifest.upload_id, manifest.data['path'])
+            uploads.append(manifest.file_metadata())
+
+    return uploads
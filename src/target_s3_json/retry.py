@@ -0,0 +1,188 @@
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, Tuple
+from asyncio import sleep as async_sleep
+from collections import OrderedDict
+from threading import Condition, Lock
+from itertools import count
+from random import uniform
+from time import sleep
+
+if TYPE_CHECKING:
+    from botocore.exceptions import ClientError
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+RETRY_MAX_ATTEMPTS: int = 5
+RETRY_BASE_DELAY: float = 0.5
+RETRY_MAX_DELAY: float = 20
+
+# NOTE: https://docs.aws.amazon.com/AmazonS3/latest/API/ErrorResponses.html
+THROTTLING_CODES = {'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'TooManyRequestsException', 'RequestThrottled'}
+TRANSIENT_CODES = {'InternalError', 'ServiceUnavailable', 'RequestTimeout', 'RequestTimeoutException', 'BadDigest', 'IncompleteBody'}
+
+
+def _status_code(error: 'ClientError') -> int:
+    return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+
+
+def is_throttling(error: BaseException) -> bool:
+    '''S3 asks to slow down the requests rate: `SlowDown` errors, HTTP 503 and 429 responses'''
+    # NOTE: only the failed requests import botocore, already loaded by the client sending them
+    from botocore.exceptions import ClientError
+
+    return isinstance(error, ClientError) and (error.response.get('Error', {}).get('Code') in THROTTLING_CODES or _status_code(error) in {429, 503})
+
+
+def is_retryable(error: BaseException) -> bool:
+    '''Throttling, server side and network errors are worth retrying, the other errors are not going away'''
+    from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+    if isinstance(error, ClientError):
+        return is_throttling(error) or error.response.get('Error', {}).get('Code') in TRANSIENT_CODES or _status_code(error) >= 500
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+class AdaptiveConcurrency:
+    '''Additive increase, multiplicative decrease limit of the requests sent at the same time to an S3 prefix.
+
+    The limit is halved on each throttling error, then raised by one request for each window of `limit` successful requests.
+
+    Parameters
+    ----------
+    max_concurrency : int
+        initial and maximum number of requests sent at the same time
+    name : str
+        prefix name, used by the log messages
+    '''
+
+    def __init__(self, max_concurrency: int, name: str = '') -> None:
+        self.max_concurrency: int = max(max_concurrency, 1)
+        self.name: str = name
+        self.limit: float = self.max_concurrency
+        self.inflight: int = 0
+        self.condition: Condition = Condition()
+
+    def try_acquire(self) -> bool:
+        with self.condition:
+            if self.inflight < int(self.limit):
+                self.inflight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        with self.condition:
+            self.condition.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+
+    async def acquire_async(self, interval: float = 0.05) -> None:
+        while not self.try_acquire():
+            await async_sleep(interval)
+
+    def release(self, succeeded: bool = True, throttled: bool = False) -> None:
+        with self.condition:
+            self.inflight -= 1
+            limit: float = self.limit
+            if throttled:
+                self.limit = max(self.limit / 2, 1)
+            elif succeeded:
+                self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+            self.condition.notify_all()
+
+        if int(self.limit) < int(limit):
+            LOGGER.warning('S3 throttling on %s, concurrency lowered to %d', self.name, self.limit)
+        elif int(self.limit) > int(limit):
+            LOGGER.debug('S3 concurrency on %s raised to %d', self.name, self.limit)
+
+
+# NOTE: the limits of the least recently used prefixes are dropped, e.g. those of the partitions no longer written
+MAX_LIMITS: int = 1024
+_limits: 'OrderedDict[Tuple[str, int], AdaptiveConcurrency]' = OrderedDict()
+_limits_lock: Lock = Lock()
+
+
+def get_concurrency(name: str, max_concurrency: int) -> AdaptiveConcurrency:
+    '''Concurrency limit shared by every request sent to the `name` prefix, kept for the `MAX_LIMITS` most recently used prefixes'''
+    with _limits_lock:
+        concurrency: AdaptiveConcurrency = _limits.setdefault((name, max_concurrency), AdaptiveConcurrency(max_concurrency, name))
+        _limits.move_to_end((name, max_concurrency))
+        while len(_limits) > MAX_LIMITS:
+            _limits.popitem(last=False)
+        return concurrency
+
+
+class Retry:
+    '''S3 requests retry policy, with full jitter exponential backoff.
+
+    Each request is retried alone, e.g. a failed part is sent again without restarting the whole object upload.
+    Only the throttling, server side and network errors are retried, the throttling ones also lower the `concurrency` limit.
+
+    Parameters
+    ----------
+    max_attempts : int
+        maximum number of attempts of each request
+    base_delay : float
+        the delay before the attempt `n` is drawn between 0 and `base_delay * 2 ** n` seconds
+    max_delay : float
+        maximum delay between two attempts in seconds
+    concurrency : AdaptiveConcurrency, optional
+        limit of the requests sent at the same time
+    on_retry : Callable, optional
+        called with the error of each retried request
+    '''
+
+    def __init__(self, max_attempts: int = RETRY_MAX_ATTEMPTS, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+                 concurrency: Optional[AdaptiveConcurrency] = None, on_retry: Optional[Callable[[BaseException], None]] = None) -> None:
+        self.max_attempts: int = max(max_attempts, 1)
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.concurrency: Optional[AdaptiveConcurrency] = concurrency
+        self.on_retry: Optional[Callable[[BaseException], None]] = on_retry
+
+    def delay(self, attempt: int) -> float:
+        return uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _retry(self, error: Exception, attempt: int, request: str) -> float:
+        if attempt >= self.max_attempts or not is_retryable(error):
+            raise error
+
+        if self.on_retry:
+            self.on_retry(error)
+        delay: float = self.delay(attempt)
+        LOGGER.info('%s request failed with %s, attempt %d of %d in %.2fs', request, error, attempt + 1, self.max_attempts, delay)
+        return delay
+
+    def call(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        for attempt in count(1):
+            if self.concurrency:
+                self.concurrency.acquire()
+            succeeded: bool = False
+            throttled: bool = False
+            try:
+                response: Any = function(*args, **kwargs)
+                succeeded = True
+                return response
+            except Exception as error:
+                throttled = is_throttling(error)
+                delay: float = self._retry(error, attempt, getattr(function, '__name__', 'S3'))
+            finally:
+                if self.concurrency:
+                    self.concurrency.release(succeeded, throttled)
+            sleep(delay)
+
+    async def call_async(self, function: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        for attempt in count(1):
+            if self.concurrency:
+                await self.concurrency.acquire_async()
+            succeeded: bool = False
+            throttled: bool = False
+            try:
+                response: Any = await function(*args, **kwargs)
+                succeeded = True
+                return response
+            except Exception as error:
+                throttled = is_throttling(error)
+                delay: float = self._retry(error, attempt, getattr(function, '__name__', 'S3'))
+            finally:
+                if self.concurrency:
+                    self.concurrency.release(succeeded, throttled)
+            await async_sleep(delay)
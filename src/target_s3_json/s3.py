@@ -4,21 +4,30 @@ from functools import partial
 from pathlib import Path
 import argparse
 import json
-import gzip
-import lzma
-from typing import Callable, Dict, Any, List, TextIO
-from asyncio import to_thread
-from concurrent.futures import ThreadPoolExecutor, Future
-
-import backoff
-from boto3.session import Session
-from botocore.exceptions import ClientError
-from botocore.client import BaseClient
-
-from target.stream import Loader
-from target import file
+import re
+from typing import TYPE_CHECKING, Callable, Dict, Any, Iterable, List, Optional, TextIO, Tuple
+from asyncio import get_running_loop
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
 from target.file import config_file, save_json
 
+from .checksum import get_checksum
+from .codec import Codec, get_codec, open_func as codec_open_func
+from .flush import rotate_file
+from .multipart import MultipartUpload, MultipartWriter, MIN_PART_SIZE, PART_SIZE
+from .partition import partition_fields
+from .resume import UploadManifest, get_manifest, resumable, uploaded_parts
+from .retry import Retry, get_concurrency, is_throttling, RETRY_BASE_DELAY, RETRY_MAX_ATTEMPTS, RETRY_MAX_DELAY
+from .scheduler import MAX_INFLIGHT_FILES
+from .serializer import get_serializer, write
+from .stream import Loader
+
+if TYPE_CHECKING:
+    from boto3.session import Session
+    from botocore.client import BaseClient
+
 from target._logger import get_logger
 LOGGER = get_logger()
 
@@ -28,6 +37,9 @@ def _log_backoff_attempt(details: Dict) -> None:
 
 
 def _retry_pattern() -> Callable:
+    import backoff
+    from botocore.exceptions import ClientError
+
     return backoff.on_exception(
         backoff.expo,
         ClientError,
@@ -41,28 +53,28 @@ def config_compression(config_default: Dict) -> Dict:
         'compression': 'none'
     } | config_default
 
-    if f"{config.get('compression')}".lower() == 'gzip':
-        config['open_func'] = gzip.compress
-        config['path_template'] = config['path_template'] + '.gz'
+    if config.get('output_format', 'jsonl') == 'parquet':
+        from .parquet import config_parquet
 
-    elif f"{config.get('compression')}".lower() == 'lzma':
-        config['open_func'] = lzma.compress
-        config['path_template'] = config['path_template'] + '.xz'
+        return config_parquet(config)
 
-    elif f"{config.get('compression')}".lower() in {'', 'none'}:
-        config['open_func'] = open
-
-    else:
-        raise NotImplementedError(
-            "Compression type '{}' is not supported. "
-            "Expected: 'none', 'gzip', or 'lzma'"
-            .format(f"{config.get('compression')}".lower()))
+    codec: Codec = get_codec(config)  # NOTE: raise NotImplementedError for unknown codecs
+    config['path_template'] = config['path_template'] + codec.extension
+    config['open_func'] = open if codec.extension == '' else codec_open_func(config)
 
     return config
 
 
-@_retry_pattern()
-def create_session(config: Dict) -> Session:
+def create_session(config: Dict) -> 'Session':
+    # NOTE: the backoff decorator is applied on the call, so boto3 is only imported once an S3 session is needed
+    return _retry_pattern()(_create_session)(config)
+
+
+def _create_session(config: Dict) -> 'Session':
+    from boto3.session import Session
+    from botocore.credentials import RefreshableCredentials
+    from botocore.session import get_session as get_botocore_session
+
     LOGGER.debug('Attempting to create AWS session')
 
     # NOTE: Get the required parameters from config file and/or environment variables
@@ -77,7 +89,7 @@ def create_session(config: Dict) -> Session:
 
     # NOTE: AWS credentials based authentication
     if aws_access_key_id and aws_secret_access_key:
-        aws_session: Session = Session(
+        aws_session: 'Session' = Session(
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
             aws_session_token=aws_session_token)
@@ -88,19 +100,69 @@ def create_session(config: Dict) -> Session:
     # NOTE: AWS credentials based authentication assuming specific IAM role
     if role_arn:
         role_name = role_arn.split('/', 1)[1]
-        sts: BaseClient = aws_session.client('sts', **endpoint_params)
-        resp = sts.assume_role(RoleArn=role_arn, RoleSessionName=f'role-name={role_name}-profile={aws_profile}')
-        credentials = {
-            'aws_access_key_id': resp['Credentials']['AccessKeyId'],
-            'aws_secret_access_key': resp['Credentials']['SecretAccessKey'],
-            'aws_session_token': resp['Credentials']['SessionToken'],
-        }
-        aws_session = Session(**credentials)
+        sts: 'BaseClient' = aws_session.client('sts', **endpoint_params)
+
+        def assume_role() -> Dict[str, str]:
+            LOGGER.debug(f'Assuming role {role_name}')
+            resp = sts.assume_role(RoleArn=role_arn, RoleSessionName=f'role-name={role_name}-profile={aws_profile}')
+            return {
+                'access_key': resp['Credentials']['AccessKeyId'],
+                'secret_key': resp['Credentials']['SecretAccessKey'],
+                'token': resp['Credentials']['SessionToken'],
+                'expiry_time': resp['Credentials']['Expiration'].isoformat(),
+            }
+
+        # NOTE: the role is assumed again before the credentials expire, so the jobs may outlive the STS session duration
+        botocore_session = get_botocore_session()
+        botocore_session._credentials = RefreshableCredentials.create_from_metadata(
+            metadata=assume_role(), refresh_using=assume_role, method='sts-assume-role')
+        aws_session = Session(botocore_session=botocore_session)
         LOGGER.info(f'Creating s3 session with role {role_name}')
 
     return aws_session
 
 
+def pool_size(config: Dict[str, Any]) -> int:
+    '''Size of the client connection pool, one connection for each part uploaded at the same time by default'''
+    return config.get('max_pool_connections') or max(
+        10, config.get('max_inflight_files', MAX_INFLIGHT_FILES) * config.get('part_concurrency', 4))
+
+
+CLIENT_KEYS: Tuple[str, ...] = ('aws_access_key_id', 'aws_secret_access_key', 'aws_session_token', 'aws_profile', 'aws_endpoint_url', 'role_arn')
+_clients: Dict[Tuple, 'BaseClient'] = {}
+_clients_lock: Lock = Lock()
+
+
+def get_client(config: Dict[str, Any]) -> 'BaseClient':
+    '''boto3 S3 client, cached by credentials, endpoint and pool size.
+
+    The boto3 clients are thread-safe, so a single client, and its connection pool, is shared by every stream and upload thread.
+    '''
+    from botocore.config import Config
+
+    key: Tuple = tuple(config.get(item) for item in CLIENT_KEYS) + (pool_size(config),)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = create_session(config).client(
+                's3',
+                # NOTE: the requests are retried by the `Retry` policy of the uploads
+                config=Config(max_pool_connections=pool_size(config), retries={'total_max_attempts': 1}),
+                **({'endpoint_url': config.get('aws_endpoint_url')} if config.get('aws_endpoint_url') else {}))
+        return _clients[key]
+
+
+def clear_clients() -> None:
+    with _clients_lock:
+        _clients.clear()
+
+
+def s3_client(config: Dict[str, Any]) -> 'BaseClient':
+    '''S3 client of the `config`, created by the first upload so the records are read without waiting for boto3 to load'''
+    if config.get('client') is None:
+        config['client'] = get_client(config)
+    return config['client']
+
+
 def get_encryption_args(config: Dict[str, Any]) -> tuple:
     if config.get('encryption_type', 'none').lower() == "none":
         # NOTE: No encryption config (defaults to settings on the bucket):
@@ -121,47 +183,172 @@ def get_encryption_args(config: Dict[str, Any]) -> tuple:
     return encryption_desc, encryption_args
 
 
-@_retry_pattern()
-def put_object(config: Dict[str, Any], file_metadata: Dict, stream_data: List) -> None:
-    encryption_desc, encryption_args = get_encryption_args(config)
+def get_compressor(config: Dict[str, Any]) -> Any:
+    return get_codec(config).compressor(config)
+
+
+def get_retry(config: Dict[str, Any], file_metadata: Dict) -> Retry:
+    '''Retry policy of the file upload requests.
+
+    The concurrency limit is shared by every upload to the same S3 prefix, the level at which S3 scales and throttles the requests rate.
+    '''
+    prefix: str = file_metadata['relative_path'].rpartition('/')[0]
+
+    def on_retry(error: BaseException) -> None:
+        if config.get('metrics'):
+            config['metrics'].increment('retries', stream=file_metadata.get('stream'))
+            if is_throttling(error):
+                config['metrics'].increment('throttles', stream=file_metadata.get('stream'))
+
+    return Retry(
+        max_attempts=config.get('retry_max_attempts', RETRY_MAX_ATTEMPTS),
+        base_delay=config.get('retry_base_delay', RETRY_BASE_DELAY),
+        max_delay=config.get('retry_max_delay', RETRY_MAX_DELAY),
+        concurrency=get_concurrency(f"s3://{config.get('s3_bucket')}/{prefix}", pool_size(config)),
+        on_retry=on_retry)
 
-    config['client'].put_object(
-        Body=config['open_func'](  # NOTE: stream compression with gzip.compress, lzma.compress
-            b''.join(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n' for record in stream_data)),
-        Bucket=config.get('s3_bucket'),
-        Key=file_metadata['relative_path'],
-        **encryption_args.get('ExtraArgs', {}))
 
+def writer_args(config: Dict[str, Any], file_metadata: Dict, retry: Retry, manifest: Optional[UploadManifest] = None) -> Dict[str, Any]:
+    '''Arguments of the `MultipartWriter` and `AioMultipartWriter` sending the file to S3, but the client'''
+    return {
+        'bucket': config['s3_bucket'],
+        'key': file_metadata['relative_path'],
+        'part_size': manifest.part_size if manifest else config.get('part_size', PART_SIZE),
+        'max_concurrency': config.get('part_concurrency', 4),
+        'extra_args': get_encryption_args(config)[1].get('ExtraArgs', {}),
+        'retry': retry,
+        'manifest': manifest,
+        'checksum': get_checksum(config)}
+
+
+def object_uploaded(config: Dict[str, Any], file_metadata: Dict, output: MultipartUpload, start: float) -> None:
+    '''Sizes, ETag and checksum of the records sent by `put_object`'''
+    file_metadata |= {'size': output.size, 'compressed_size': output.compressed_size, 'etag': output.etag, 'checksum': output.object_checksum}
+
+    if config.get('metrics'):
+        config['metrics'].upload(file_metadata.get('stream'), output.size, output.compressed_size, perf_counter() - start)
     LOGGER.info("%s uploaded to bucket %s at %s%s",
-                file_metadata['absolute_path'].as_posix(), config.get('s3_bucket'), file_metadata['relative_path'], encryption_desc)
+                file_metadata['absolute_path'].as_posix(), config.get('s3_bucket'), file_metadata['relative_path'], get_encryption_args(config)[0])
+
+
+def put_object(config: Dict[str, Any], file_metadata: Dict, stream_data: Iterable) -> None:
+    start: float = perf_counter()
+    # NOTE: records are serialised and compressed one at a time, then sent by multipart upload parts of `part_size` bytes
+    retry: Retry = get_retry(config, file_metadata)
+    with MultipartWriter(s3_client(config), compressor=get_compressor(config), **writer_args(config, file_metadata, retry)) as output:
+        output.writelines(map(get_serializer(config), stream_data))
+    object_uploaded(config, file_metadata, output, start)
+
+
+def _list_parts(client: 'BaseClient', **kwargs: Any) -> List[Dict]:
+    return [part for page in client.get_paginator('list_parts').paginate(**kwargs) for part in page.get('Parts', [])]
+
 
+def upload_args(config: Dict[str, Any], file_metadata: Dict, manifest: UploadManifest) -> Dict[str, Any]:
+    '''Arguments of the requests on the multipart upload left in progress by a previous run'''
+    return {'Bucket': config.get('s3_bucket'), 'Key': file_metadata['relative_path'], 'UploadId': manifest.upload_id}
 
-@_retry_pattern()
-def upload_file(config: Dict[str, Any], file_metadata: Dict) -> None:
-    if not config.get('local', False) and (file_metadata['absolute_path'].stat().st_size if file_metadata['absolute_path'].exists() else 0) > 0:
-        encryption_desc, encryption_args = get_encryption_args(config)
 
-        config['client'].upload_file(
-            file_metadata['absolute_path'].as_posix(),
-            config.get('s3_bucket'),
-            file_metadata['relative_path'],
-            **encryption_args)
+def upload_resumed(manifest: UploadManifest, parts: List[Dict]) -> UploadManifest:
+    '''Manifest of the upload resumed, the parts listed by S3 being the reference'''
+    # NOTE: some parts may have been completed after the last manifest save
+    manifest.set_parts(uploaded_parts(manifest, parts))
+    LOGGER.info('Multipart upload %s of %s resumed with %d parts already uploaded', manifest.upload_id, manifest.data['path'], len(manifest.parts))
+    return manifest
 
-        LOGGER.info('%s uploaded to bucket %s at %s%s',
-                    file_metadata['absolute_path'].as_posix(), config.get('s3_bucket'), file_metadata['relative_path'], encryption_desc)
 
-        if config.get('remove_file', True):
-            # NOTE: Remove the local file(s)
-            file_metadata['absolute_path'].unlink()  # missing_ok=False
+def upload_restarted(config: Dict[str, Any], file_metadata: Dict, manifest: UploadManifest, error: Optional[Exception] = None) -> UploadManifest:
+    '''Manifest of a new upload, the one left in progress being aborted, or not found on S3 with the `error`'''
+    if error is None:
+        LOGGER.warning('Multipart upload %s of %s left by a previous run aborted', manifest.upload_id, manifest.data['path'])
+    elif getattr(error, 'response', {}).get('Error', {}).get('Code') == 'NoSuchUpload':
+        LOGGER.warning('Multipart upload %s of %s left by a previous run not found', manifest.upload_id, manifest.data['path'])
+    else:
+        raise error
+
+    manifest.remove()
+    return UploadManifest.create(config, file_metadata, max(config.get('part_size', PART_SIZE), MIN_PART_SIZE))
+
+
+def resume_upload(config: Dict[str, Any], file_metadata: Dict, retry: Retry) -> Optional[UploadManifest]:
+    '''Manifest of the file multipart upload, once the one left in progress by a previous run is resumed or aborted'''
+    from botocore.exceptions import ClientError
+
+    manifest: Optional[UploadManifest] = get_manifest(config, file_metadata, max(config.get('part_size', PART_SIZE), MIN_PART_SIZE))
+    if manifest is None or manifest.upload_id is None:
+        return manifest
+
+    resume: Optional[bool] = resumable(config, manifest)
+    try:
+        if resume:
+            return upload_resumed(manifest, retry.call(_list_parts, config['client'], **upload_args(config, file_metadata, manifest)))
+        elif resume is None:
+            return None
+
+        retry.call(config['client'].abort_multipart_upload, **upload_args(config, file_metadata, manifest))
+    except ClientError as error:
+        return upload_restarted(config, file_metadata, manifest, error)
+
+    return upload_restarted(config, file_metadata, manifest)
+
+
+def upload_size(file_metadata: Dict, buffer: Optional[bytearray] = None) -> int:
+    return len(buffer) if buffer is not None else file_metadata['absolute_path'].stat().st_size if file_metadata['absolute_path'].exists() else 0
+
+
+def file_uploaded(config: Dict[str, Any], file_metadata: Dict, output: MultipartUpload, buffer: Optional[bytearray] = None) -> None:
+    '''ETag and checksum of the file sent by `upload_file`, the local file being then removed'''
+    file_metadata |= {'etag': output.etag, 'checksum': output.object_checksum}
+
+    LOGGER.info('%s uploaded%s to bucket %s at %s%s', file_metadata['absolute_path'].as_posix(), ' from memory' if buffer is not None else '',
+                config.get('s3_bucket'), file_metadata['relative_path'], get_encryption_args(config)[0])
+
+    if config.get('remove_file', True) and buffer is None:
+        # NOTE: Remove the local file(s)
+        file_metadata['absolute_path'].unlink()  # missing_ok=False
+
+
+def upload_file(config: Dict[str, Any], file_metadata: Dict, buffer: Optional[bytearray] = None) -> None:
+    if config.get('local', False):
+        return
+
+    s3_client(config)
+    retry: Retry = get_retry(config, file_metadata)
+    # NOTE: the uploads from memory are not resumed, their data being lost with the process
+    manifest: Optional[UploadManifest] = None if buffer is not None else resume_upload(config, file_metadata, retry)
 
+    if upload_size(file_metadata, buffer) > 0:
+        # NOTE: same as the `aiobotocore` backend, the file is sent by parts retried one at a time
+        with MultipartWriter(config['client'], **writer_args(config, file_metadata, retry, manifest)) as output:
+            if buffer is not None:
+                output.write_buffer(memoryview(buffer))
+            else:
+                output.write_file(file_metadata['absolute_path'])
+        file_uploaded(config, file_metadata, output, buffer)
 
-async def upload_thread(config: Dict[str, Any], file_metadata: Dict) -> Future:
 
-    return await to_thread(
-        *([config['executor'].submit] if config.get('thread_pool', True) else []),
-        upload_file,
-        config,
-        file_metadata)
+async def upload(config: Dict[str, Any], file_metadata: Dict) -> None:
+    # NOTE: the file buffered in memory is taken over by the upload on the event loop, so a spill to the `work_dir` meanwhile finds it gone
+    buffer: Optional[bytearray] = file_metadata.pop('buffer', None)
+    size: int = upload_size(file_metadata, buffer)
+    file_metadata['compressed_size'] = size
+    start: float = perf_counter()
+
+    if config.get('upload_backend') == 'aiobotocore':
+        from .aio import upload_file as aio_upload_file
+
+        await aio_upload_file(config, file_metadata, buffer)
+    else:
+        await get_running_loop().run_in_executor(
+            config['executor'] if config.get('thread_pool', True) else None, upload_file, config, file_metadata, buffer)
+
+    if config.get('metrics') and size > 0 and not config.get('local', False):
+        config['metrics'].upload(file_metadata.get('stream'), file_metadata.get('size'), size, perf_counter() - start)
+
+
+async def upload_thread(config: Dict[str, Any], file_metadata: Dict) -> None:
+    # NOTE: blocks while the `UploadScheduler` queue is full
+    await config['scheduler'].submit(file_metadata)
 
 
 def config_s3(config_default: Dict[str, Any], datetime_format: Dict[str, str] = {
@@ -183,6 +370,40 @@ def config_s3(config_default: Dict[str, Any], datetime_format: Dict[str, str] =
             .replace('{timestamp}', '{date_time%s}' % datetime_format['date_time_format']) \
             .replace('{date}', '{date_time%s}' % datetime_format['date_format'])
 
+    if config_default.get('output_format', 'jsonl') not in {'jsonl', 'parquet'}:
+        raise NotImplementedError(
+            "Output format '{}' is not supported. "
+            "Expected: 'jsonl' or 'parquet'"
+            .format(config_default.get('output_format')))
+
+    partitioned: bool = len(partition_fields(config_default.get('path_template', ''))) > 0
+    if config_default.get('passthrough') and (config_default.get('add_metadata_columns') or config_default.get('output_format') == 'parquet' or partitioned):
+        raise NotImplementedError(
+            "The 'passthrough' mode writes the records as received. "
+            "Expected: no `add_metadata_columns`, the 'jsonl' output format and no record fields in the `path_template`")
+
+    if partitioned and not re.search(r'\{(part|uuid)[}!:]', config_default['path_template']):
+        raise NotImplementedError(
+            "Partitioned path template '{}' is not supported. "
+            "Expected: a `part` or `uuid` field, naming the next file of a partition written again once closed"
+            .format(config_default['path_template']))
+
+    if (config_default.get('max_object_age_seconds') or config_default.get('max_records')) \
+            and not re.search(r'\{(part|uuid)[}!:]', config_default.get('path_template', '')):
+        raise NotImplementedError(
+            "Path template '{}' is not supported with `max_object_age_seconds` or `max_records`. "
+            "Expected: a `part` or `uuid` field, naming the next file of a rotated stream"
+            .format(config_default.get('path_template')))
+
+    get_serializer(config_default)  # NOTE: raise NotImplementedError for unknown serializers
+    get_checksum(config_default)  # NOTE: raise NotImplementedError for unknown checksum algorithms
+
+    if config_default.get('upload_backend', 'boto3') not in {'boto3', 'aiobotocore'}:
+        raise NotImplementedError(
+            "Upload backend '{}' is not supported. "
+            "Expected: 'boto3' or 'aiobotocore'"
+            .format(config_default.get('upload_backend')))
+
     missing_params = {'s3_bucket'} - set(config_default.keys())
     if missing_params:
         raise Exception(f'Config is missing required settings: {missing_params}')
@@ -195,51 +416,19 @@ def main(lines: TextIO = sys.stdin) -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', help='Config file', required=True)
     args = parser.parse_args()
-    config = file.config_compression(config_file(config_s3(json.loads(Path(args.config).read_text(encoding='utf-8')))))
-    save_s3: Callable = partial(save_json, post_processing=upload_thread)
-    client: BaseClient = create_session(config).client('s3', **({'endpoint_url': config.get('aws_endpoint_url')}
-                                                       if config.get('aws_endpoint_url') else {}))
-
-    with ThreadPoolExecutor() as executor:
-        Loader(config | {'client': client, 'executor': executor}, writeline=save_s3).run(lines)
-
-
-# from io import BytesIO
-# from pyarrow import parquet
-# from pyarrow.json import read_json
-# import pandas
-# def write_parquet(config: Dict[str, Any], file_meta: Dict, file_data: List) -> None:
-#     s3_fs: S3FileSystem = S3FileSystem(anon=False, s3_additional_kwargs={'ACL': 'bucket-owner-full-control'}, asynchronous=False)
-
-#     # NOTE: Create parquet file using Pandas
-#     pandas.json_normalize(file_data).to_parquet(path = file_meta['absolute_path'], filesystem = s3_fs)
-#     # NOTE: Synchronous Alternative without df middle step, read_json not yet as efficient as pandas. Worth keeping on check.
-#     with BytesIO(b''.join(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n' for record in file_data)) as data:
-#         parquet.write_table(read_json(data), file_meta['relative_path'], filesystem=s3_fs)
-
-
-# NOTE: https://github.com/aws/aws-cli/issues/3784
-# async def search(client: BaseClient, bucket: str, prefix: str, regex_path: str) -> Generator:
-#     '''
-#     perform a flat listing of the files within a bucket
-#     '''
-#     regex_pattern: Pattern = compile(regex_path)
-
-#     paginator = client.get_paginator('list_objects_v2')
-#     files_metadata = paginator.paginate(Bucket=bucket, Prefix=prefix)
-#     for file_path in map(lambda x: x.get('Key', ''), await to_thread(files_metadata.search, 'Contents')):
-#         if match(regex_pattern, file_path):
-#             yield file_path
-
-
-# async def sync(
-#     start_date: datetime = eval(config.get('date_time', 'datetime.now().astimezone(timezone.utc)'))
-#     client: BaseClient, semaphore: Semaphore, source_bucket: str, source_key: str, target_bucket: str, target_key: str, overwrite: bool = False) -> None:
-#     await gather(*[shield(search(client, semaphore, source_bucket, source_key, target_bucket, target_root + source_key.removeprefix(source_root), overwrite))
-#         async for source_key in search(client, source_bucket, source_root, source_regexp)])
-#     async with semaphore:
-#         if not overwrite and 'Contents' in client.list_objects_v2(Bucket=target_bucket, Prefix=target_key, MaxKeys=1):
-#             LOGGER.debug(f'S3 Bucket Sync - "s3://{target_bucket}/{target_key}" already exists.')
-#         else:
-#             await to_thread(client.copy, {'Bucket': source_bucket, 'Key': source_key}, target_bucket, target_key)
-#             LOGGER.info(f'S3 Bucket Sync - "s3://{source_bucket}/{source_key}" to "s3://{target_bucket}/{target_key}" copy completed.')
+    config = config_compression(config_file(config_s3(json.loads(Path(args.config).read_text(encoding='utf-8')))))
+    loader_args: Dict[str, Callable] = {
+        'writeline': partial(save_json, save=write, post_processing=upload_thread),
+        'rotate': partial(rotate_file, save=write, post_processing=upload_thread)}
+    if config.get('output_format') == 'parquet':
+        from .parquet import set_schema, save_parquet, write_row_group, close_file
+
+        loader_args = {
+            'set_schemas': set_schema,
+            'writeline': partial(save_parquet, post_processing=upload_thread),
+            'spill': write_row_group,
+            'rotate': partial(close_file, post_processing=upload_thread)}
+
+    with ThreadPoolExecutor(max_workers=config.get('max_inflight_files', MAX_INFLIGHT_FILES)) as executor:
+        # NOTE: the client is created once the first file is ready to upload, the aiobotocore one by the `Loader` on the running event loop
+        Loader(config | {'client': None, 'executor': executor}, upload=upload, **loader_args).run(lines)
@@ -0,0 +1,107 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from pathlib import Path
+from asyncio import Task, create_task, wait, FIRST_COMPLETED
+from heapq import heappush, heappop
+from itertools import count
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+MAX_INFLIGHT_FILES: int = 8
+
+
+class UploadScheduler:
+    '''Bounded upload scheduler.
+
+    The files submitted are uploaded oldest first, with at most `max_inflight_files` files and `max_inflight_bytes` bytes in flight.
+    Once a limit is reached, the files submitted are queued, the next upload being the oldest queued file.
+    Submitting a file while `max_inflight_files` files are queued blocks the caller until an upload completes,
+    so the `Loader` stops reading the input stream instead of piling up files in the `work_dir`.
+
+    The first upload error is raised to the caller by the next `submit`, or by `drain` once every upload is completed, the others being logged.
+    Each error is raised once.
+
+    Parameters
+    ----------
+    upload : Callable
+        coroutine function uploading the file described by the `file_metadata` argument
+    max_inflight_files : int
+        maximum number of files uploaded at the same time
+    max_inflight_bytes : int, optional
+        maximum number of bytes uploaded at the same time. A larger file is still uploaded alone.
+    '''
+
+    def __init__(self, upload: Callable[[Dict], Awaitable[Any]],
+                 max_inflight_files: int = MAX_INFLIGHT_FILES, max_inflight_bytes: Optional[int] = None) -> None:
+        self.upload: Callable[[Dict], Awaitable[Any]] = upload
+        self.max_inflight_files: int = max(max_inflight_files, 1)
+        self.max_inflight_bytes: Optional[int] = max_inflight_bytes
+
+        self.pending: List[Tuple[float, int, int, Dict]] = []
+        self.inflight: Dict[Task, int] = {}
+        self.scheduled: Set[Path] = set()
+        self.errors: List[BaseException] = []
+        self.sequence = count()
+
+    @property
+    def inflight_bytes(self) -> int:
+        return sum(self.inflight.values())
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.pending) + len(self.inflight)
+
+    def _available(self, size: int) -> bool:
+        if not self.inflight:
+            return True
+        if len(self.inflight) >= self.max_inflight_files:
+            return False
+        return self.max_inflight_bytes is None or self.inflight_bytes + size <= self.max_inflight_bytes
+
+    def _dispatch(self) -> None:
+        # NOTE: the pending heap is ordered by file modification time, the oldest files go first
+        while self.pending and self._available(self.pending[0][2]):
+            _, _, size, file_metadata = heappop(self.pending)
+            task: Task = create_task(self.upload(file_metadata))  # type: ignore
+            self.inflight[task] = size
+            task.add_done_callback(self._done)
+
+    def _done(self, task: Task) -> None:
+        del self.inflight[task]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors.append(task.exception())  # type: ignore
+        self._dispatch()
+
+    def _raise(self) -> None:
+        if self.errors:
+            # NOTE: the errors are raised once, so the `drain` of the caller cleanup doesn't raise them again
+            errors, self.errors = self.errors, []
+            for error in errors[1:]:
+                LOGGER.error('Upload failed: %r', error)
+            raise errors[0]
+
+    async def submit(self, file_metadata: Dict) -> None:
+        self._raise()
+
+        # NOTE: a file is uploaded once, even when the stream closure submits it several times
+        if file_metadata['absolute_path'] in self.scheduled:
+            return
+        self.scheduled.add(file_metadata['absolute_path'])
+
+        stat = file_metadata['absolute_path'].stat() if file_metadata['absolute_path'].exists() else None
+        # NOTE: the files buffered in memory by `upload_from_memory` are not written to the `work_dir`
+        size: int = stat.st_size if stat else len(file_metadata.get('buffer') or b'')
+        heappush(self.pending, (stat.st_mtime if stat else 0.0, next(self.sequence), size, file_metadata))
+        self._dispatch()
+
+        # NOTE: backpressure, the caller waits while the queue is full, the queued files being uploaded oldest first
+        while len(self.pending) > self.max_inflight_files:
+            await wait(set(self.inflight), return_when=FIRST_COMPLETED)
+
+        self._raise()
+
+    async def drain(self) -> None:
+        while self.inflight:
+            await wait(set(self.inflight))
+
+        self._raise()
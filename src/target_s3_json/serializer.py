@@ -0,0 +1,171 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from asyncio import to_thread
+from functools import lru_cache
+from math import isfinite
+from pathlib import Path
+import json
+
+from .codec import get_codec
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+Serializer = Callable[[Any], bytes]
+
+
+def json_dumps(record: Any) -> bytes:
+    '''Standard library serializer, the `target-core` JSON Lines format'''
+    return json.dumps(record, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+
+
+def json_dumps_compact(record: Any) -> bytes:
+    '''Standard library serializer without whitespace, the `orjson` format, which differs from the `target-core` one'''
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+
+
+def _non_finite(value: Any) -> bool:
+    '''Whether the value holds a NaN or infinite float'''
+    if isinstance(value, float):
+        return not isfinite(value)
+    if isinstance(value, dict):
+        return any(map(_non_finite, value.values()))
+    if isinstance(value, (list, tuple)):
+        return any(map(_non_finite, value))
+    return False
+
+
+@lru_cache(maxsize=None)
+def _orjson_serializer() -> Serializer:
+    try:
+        import orjson
+    except ImportError:
+        LOGGER.warning("The 'orjson' serializer requires the orjson package: pip install target-s3-jsonl[orjson]. Using the standard library instead.")
+        return json_dumps_compact
+
+    # NOTE: the date and time values are passed to the `str` default, same as the standard library serializer
+    option: int = orjson.OPT_APPEND_NEWLINE | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def orjson_dumps(record: Any) -> bytes:
+        try:
+            line: bytes = orjson.dumps(record, default=str, option=option)
+        except orjson.JSONEncodeError:
+            # NOTE: the integers over 64 bits are not supported by orjson
+            return json_dumps_compact(record)
+        # NOTE: the NaN and infinite floats are written as null by orjson, as NaN and Infinity by the standard library
+        if b'null' in line and _non_finite(record):
+            return json_dumps_compact(record)
+        return line
+
+    return orjson_dumps
+
+
+def raw_record(record: bytes) -> bytes:
+    '''Records read by the `passthrough` mode, already serialized'''
+    return record
+
+
+SERIALIZERS: Dict[str, Callable[[], Serializer]] = {
+    'json': lambda: json_dumps,
+    'orjson': _orjson_serializer,
+}
+
+
+def get_serializer(config: Dict[str, Any]) -> Serializer:
+    '''Function serializing a record into a UTF-8 encoded JSON line, selected by the `json_serializer` config option'''
+    if config.get('passthrough'):
+        return raw_record
+
+    name: str = f"{config.get('json_serializer', 'json')}".lower()
+    if name not in SERIALIZERS:
+        raise NotImplementedError(
+            "JSON serializer '{}' is not supported. "
+            "Expected: {}"
+            .format(name, ', '.join(f"'{item}'" for item in SERIALIZERS)))
+
+    return SERIALIZERS[name]()
+
+
+def _writelines(output_file: Any, lines: Iterable[bytes]) -> int:
+    size: int = 0
+    for line in lines:
+        size += output_file.write(line)
+    return size
+
+
+def in_memory(config: Dict[str, Any], file_metadata: Dict) -> bool:
+    '''Whether the file is buffered in memory and uploaded from there, with `upload_from_memory` and until spilled to the `work_dir`'''
+    return bool(config.get('upload_from_memory')) and not config.get('local', False) and config.get('file_size') is None \
+        and not file_metadata.get('spilled')
+
+
+def compress_data(config: Dict[str, Any], data: Any) -> bytes:
+    '''Serialized records, bytes or memoryview, compressed as a complete member or frame of the `compression` codec'''
+    compressor: Any = get_codec(config).compressor(config)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_records(config: Dict[str, Any], records: Iterable) -> Tuple[int, bytes]:
+    '''Serialized size, and records compressed as a complete member or frame of the `compression` codec'''
+    data: bytes = b''.join(map(get_serializer(config), records))
+    return len(data), compress_data(config, data)
+
+
+def append(path: Path, data: bytearray) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as output_file:
+        output_file.write(data)
+
+
+def written_records(config: Dict[str, Any], file_metadata: Dict, records: List) -> None:
+    '''Remove the duplicate records about to be written to the file with a `dedup`, then count those left in the `manifest`'''
+    if config.get('dedup') is not None:
+        config['dedup'].deduplicate(file_metadata.get('stream'), config, records)
+
+    if config.get('manifest'):
+        for record in records:
+            config['manifest'].record(file_metadata, record)
+
+
+async def write(config: Dict[str, Any], file_metadata: Dict, stream_data: List) -> None:
+    '''`target.file.write` alternative writing the records serialized by the `json_serializer` as bytes.
+
+    With a `compression_pool`, the records are serialized and compressed by its worker processes.
+    With `upload_from_memory`, the compressed records are appended to the file `buffer` in memory instead of the file.
+    With a `dedup`, only the last version of each key of the records is written.
+    '''
+    written_records(config, file_metadata, stream_data)
+
+    if config.get('compression_pool') is not None:
+        if any(stream_data):
+            records: List = stream_data[:]
+            del stream_data[:]
+            await config['compression_pool'].write(file_metadata, records)
+
+    elif any(stream_data):
+        if in_memory(config, file_metadata):
+            size, data = await to_thread(compress_records, config, stream_data)
+            file_metadata.setdefault('buffer', bytearray()).extend(data)
+        else:
+            file_metadata['absolute_path'].parent.mkdir(parents=True, exist_ok=True)
+
+            with config['open_func'](file_metadata['absolute_path'], 'ab') as output_file:
+                size = await to_thread(_writelines, output_file, map(get_serializer(config), stream_data))
+
+        # NOTE: uncompressed size of the file, used by the `bytes_in` metric
+        file_metadata['size'] = file_metadata.get('size', 0) + size
+
+        del stream_data[:]
+
+
+async def write_buffer(stream: str, stream_data: Dict, config: Dict[str, Any]) -> None:
+    '''Write the buffered records of the stream to its file, and the file buffered in memory to the `work_dir`'''
+    file_info: Dict = stream_data[stream]
+    file_metadata: Dict = file_info['path'][file_info['part']]
+    if in_memory(config, file_metadata):
+        file_metadata['spilled'] = True
+        buffer: Optional[bytearray] = file_metadata.pop('buffer', None)
+        if buffer:
+            # NOTE: written at once, so an upload starting meanwhile finds either the buffer or the complete file
+            append(file_metadata['absolute_path'], buffer)
+
+    await write(config, file_metadata, file_info['file_data'])
@@ -0,0 +1,456 @@
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+from asyncio import Lock, Task, create_task, run, to_thread
+from contextlib import AsyncExitStack
+from decimal import getcontext
+from functools import partial
+from itertools import chain, islice, repeat
+from json import JSONDecodeError, JSONDecoder, loads
+from json.decoder import scanstring  # type: ignore[attr-defined]
+import re
+import sys
+
+from jsonschema import Draft4Validator, FormatChecker
+from target import stream
+from target.file import set_schema, save_json
+from target.stream import (
+    _add_metadata_columns_to_schema, _add_metadata_values_to_record, _all_precisions, _remove_metadata_values_from_record, emit_state)
+
+from .dedup import Deduplicator
+from .flush import FlushScheduler, FLUSH_INTERVAL, rotate_file
+from .manifest import OutputManifest
+from .memory import MemoryBudget
+from .metrics import Metrics, METRICS_INTERVAL
+from .partition import PartitionWriters, partition_fields, MAX_OPEN_PARTITIONS
+from .resume import pending_uploads
+from .scheduler import UploadScheduler, MAX_INFLIGHT_FILES
+from .serializer import write_buffer
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# NOTE: RECORD message fields in the order written by `singer-python`
+RECORD_PREFIX = re.compile(r'[ \t\n\r]*\{[ \t\n\r]*"type"[ \t\n\r]*:[ \t\n\r]*"RECORD"[ \t\n\r]*,'
+                           r'[ \t\n\r]*"stream"[ \t\n\r]*:[ \t\n\r]*"((?:[^"\\]|\\.)*)"[ \t\n\r]*,'
+                           r'[ \t\n\r]*"record"[ \t\n\r]*:[ \t\n\r]*')
+DECODER = JSONDecoder()
+# NOTE: the binary input is read by blocks of up to `read_block_size` bytes, and the text inputs by batches of lines
+READ_BLOCK_SIZE: int = 1024 * 1024
+BATCH_LINES: int = 1000
+
+
+class BlockReader:
+    '''Lines of a binary input, read by blocks of `block_size` bytes.
+
+    Each block is cut after its last newline, then decoded and split at once, instead of reading and decoding the lines one at a time.
+    A line longer than a block is read over several blocks. The lines are returned without their newline.
+
+    Parameters
+    ----------
+    lines : BinaryIO
+        binary input, e.g. `sys.stdin.buffer`
+    block_size : int
+        maximum number of bytes read at once
+    '''
+
+    def __init__(self, lines: BinaryIO, block_size: int = READ_BLOCK_SIZE) -> None:
+        self.lines: BinaryIO = lines
+        self.block_size: int = max(block_size, 1)
+        # NOTE: `read1` returns the bytes already sent by the tap, instead of waiting for a whole block
+        self.read: Callable[[int], bytes] = getattr(lines, 'read1', lines.read)
+        self.buffer: bytearray = bytearray()
+
+    def _split(self, block: bytes) -> Optional[List[str]]:
+        # NOTE: the newline byte is never part of a multibyte UTF-8 character, so the blocks are decoded on their own
+        end: int = block.rfind(b'\n')
+        if end < 0:
+            self.buffer += block
+            return None
+
+        self.buffer += block[:end]
+        lines: List[str] = self.buffer.decode('utf-8').split('\n')
+        self.buffer[:] = block[end + 1:]
+        return lines
+
+    def _rest(self) -> List[List[str]]:
+        lines: List[List[str]] = [[self.buffer.decode('utf-8')]] if self.buffer else []
+        self.buffer.clear()
+        return lines
+
+    def batches(self) -> Iterator[List[str]]:
+        '''Lines of each block read'''
+        while block := self.read(self.block_size):
+            if (lines := self._split(block)) is not None:
+                yield lines
+        yield from self._rest()
+
+    async def abatches(self) -> AsyncIterator[List[str]]:
+        '''Lines of each block read by a thread, so the event loop keeps running while the tap is quiet'''
+        while block := await to_thread(self.read, self.block_size):
+            if (lines := self._split(block)) is not None:
+                yield lines
+        for lines in self._rest():
+            yield lines
+
+    def __iter__(self) -> Iterator[str]:
+        return chain.from_iterable(self.batches())
+
+
+async def batch_lines(lines: Iterable[str], size: int = BATCH_LINES) -> AsyncIterator[List[str]]:
+    iterator: Iterator[str] = iter(lines)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def parse_envelope(line: str) -> Tuple[Dict, Optional[str]]:
+    '''Parse the Singer message fields, except the `record` returned as its original JSON text.
+
+    The record is scanned by the C JSON decoder to find where it ends, the fields before it being matched at once
+    for the `singer-python` RECORD messages. It's neither validated, transformed nor serialized again.
+
+    Returns
+    -------
+    out : tuple[dict, str]
+        The message without its `record`, and the record JSON text, None if the message has no record.
+    '''
+    prefix = RECORD_PREFIX.match(line)
+    if prefix is not None:
+        # NOTE: fast path, the record is scanned to find where it ends, and only the remaining fields are parsed
+        end: int = DECODER.raw_decode(line, prefix.end())[1]
+        index = WHITESPACE.match(line, end).end()  # type: ignore[union-attr]
+        message: Dict = loads('{' + (line[index + 1:] if line[index:index + 1] == ',' else line[index:]))
+        if not message and line[index:index + 1] == ',':
+            raise JSONDecodeError('Expecting property name enclosed in double quotes', line, index + 1)
+        return {'type': 'RECORD', 'stream': scanstring(line, prefix.start(1))[0]} | message, line[prefix.end():end]
+
+    message = {}
+    record: Optional[str] = None
+
+    index = WHITESPACE.match(line, 0).end()  # type: ignore[union-attr]
+    if line[index:index + 1] != '{':
+        raise JSONDecodeError('Expecting a JSON object', line, index)
+    index = WHITESPACE.match(line, index + 1).end()  # type: ignore[union-attr]
+
+    while line[index:index + 1] != '}':
+        if line[index:index + 1] != '"':
+            raise JSONDecodeError('Expecting property name enclosed in double quotes', line, index)
+        key, index = scanstring(line, index + 1)
+
+        index = WHITESPACE.match(line, index).end()  # type: ignore[union-attr]
+        if line[index:index + 1] != ':':
+            raise JSONDecodeError("Expecting ':' delimiter", line, index)
+        index = WHITESPACE.match(line, index + 1).end()  # type: ignore[union-attr]
+
+        value, end = DECODER.raw_decode(line, index)
+        if key == 'record':
+            record = line[index:end]
+        else:
+            message[key] = value
+
+        index = WHITESPACE.match(line, end).end()  # type: ignore[union-attr]
+        if line[index:index + 1] == ',':
+            index = WHITESPACE.match(line, index + 1).end()  # type: ignore[union-attr]
+        elif line[index:index + 1] != '}':
+            raise JSONDecodeError("Expecting ',' delimiter", line, index)
+
+    return message, record
+
+
+def parse_line(line: str, passthrough: bool = False) -> Tuple[Dict, Optional[str], str]:
+    try:
+        message, record = parse_envelope(line) if passthrough else (loads(line), None)
+    except JSONDecodeError:
+        LOGGER.error(f'Unable to parse:\n{line}')
+        raise
+    return message, record, line
+
+
+def parse_lines(batch: List[str], passthrough: bool = False) -> Iterable[Tuple[Dict, Optional[str], str]]:
+    '''Messages of a batch of lines, with the `record` JSON text of the `passthrough` mode, and their line.
+
+    The batch is decoded by a single `json.loads` call instead of one call per line.
+    A batch with an invalid line is decoded one line at a time, so the lines before it are processed first and its error reported.
+    '''
+    if not passthrough:
+        try:
+            messages: Optional[List] = loads('[' + ','.join(batch) + ']')
+        except JSONDecodeError:
+            messages = None
+        # NOTE: a line of several comma separated values changes the messages count
+        if messages is not None and len(messages) == len(batch):
+            return zip(messages, repeat(None), batch)
+
+    return map(partial(parse_line, passthrough=passthrough), batch)
+
+
+class Loader(stream.Loader):  # type: ignore[misc]
+    '''`target-core` stream `Loader` managing the life cycle of the resources bound to the event loop.
+
+    When an `upload` coroutine function is provided, the files are uploaded through an `UploadScheduler`
+    available as `config['scheduler']`, and every upload is completed before the event loop closes.
+
+    With the `passthrough` config option, the records are written as received from the tap, without being validated nor serialized again.
+
+    The runtime `Metrics` are available as `config['metrics']`.
+
+    With the `manifest_key` or `manifest_stream_key` config options, the uploaded files are listed by an `OutputManifest`,
+    available as `config['manifest']`, and uploaded once every file is uploaded.
+
+    When the `path_template` contains record fields, e.g. `{stream}/dt={record.event_date}/{date_time}_{part}.json`,
+    the records are written to the files of their partition by `PartitionWriters`, with at most `max_open_partitions` files open.
+
+    With the `memory_budget` config option, the records buffered by every stream share a `MemoryBudget`, available as `config['memory']`.
+    Once over budget, the largest buffers are written to their file by `spill`.
+
+    With the `compression_processes` config option, the records are serialized and compressed by a `CompressionPool`,
+    available as `config['compression_pool']`.
+
+    With the `aiobotocore` upload backend, the client is created by `connect` once the first file is ready to upload.
+
+    With the `max_object_age_seconds` or `max_records` config options, the files are closed and post processed by `rotate`
+    once too old or large enough, by a `FlushScheduler` available as `config['flush']`.
+
+    With the `deduplicate_records` config option, the buffered records are deduplicated by the `key_properties` of their stream
+    before being written, by a `Deduplicator` available as `config['dedup']`.
+    '''
+
+    def __init__(self,
+                 config: Dict,
+                 set_schemas: Callable = set_schema,
+                 writeline: Callable = save_json,
+                 upload: Optional[Callable[[Dict[str, Any], Dict], Awaitable[Any]]] = None,
+                 spill: Callable[[str, Dict, Dict[str, Any]], Awaitable[Any]] = write_buffer,
+                 rotate: Callable[[str, Dict, Dict[str, Any]], Awaitable[Any]] = rotate_file) -> None:
+        self.partitions: Optional[PartitionWriters] = None
+        if partition_fields(config.get('path_template', '')):
+            self.partitions = PartitionWriters(config, set_schemas, writeline, config.get('max_open_partitions', MAX_OPEN_PARTITIONS))
+            set_schemas = self.partitions.set_schema
+
+        super().__init__(config, set_schemas=set_schemas, writeline=self.count_record)
+        self.save_record: Callable = writeline
+        self.config['metrics'] = Metrics(self.config)
+        self.upload: Optional[Callable[[Dict[str, Any], Dict], Awaitable[Any]]] = upload
+        self.stack: Optional[AsyncExitStack] = None
+        self.client_lock: Optional[Lock] = None
+        if upload is not None and (self.config.get('manifest_key') or self.config.get('manifest_stream_key')):
+            self.config['manifest'] = OutputManifest(self.config)
+        if self.config.get('memory_budget'):
+            self.config['memory'] = MemoryBudget(self.config['memory_budget'], spill)
+            self.config['metrics'].sample('buffered_bytes', lambda: self.config['memory'].size)
+            self.config['metrics'].sample('spilled_bytes', lambda: self.config['memory'].spilled_bytes)
+        if self.config.get('max_object_age_seconds') or self.config.get('max_records'):
+            self.config['flush'] = FlushScheduler(
+                rotate, self.open_files, self.config.get('max_object_age_seconds'), self.config.get('max_records'))
+        if self.config.get('deduplicate_records'):
+            self.config['dedup'] = Deduplicator()
+
+    async def count_record(self, stream: str, stream_data: Dict, config: Dict[str, Any], record: Optional[Any] = None) -> None:
+        if self.partitions is None:
+            await self.save_record(stream, stream_data, config, record)
+        elif record is None:
+            await self.partitions.close(stream)
+        else:
+            # NOTE: the record is written to the file of its partition
+            config, stream_data = await self.partitions.get(stream, record)
+            await self.save_record(stream, stream_data, config, record)
+
+        if record is None:
+            if config.get('memory'):
+                config['memory'].release()
+            if config.get('flush') and self.partitions is None:
+                config['flush'].close(stream, stream_data)
+            return
+
+        # NOTE: the stream of the file is used to tag the upload metrics, the records being listed by the `manifest` once written
+        stream_data[stream]['path'][stream_data[stream]['part']]['stream'] = stream
+        config['metrics'].increment('records_in', stream=stream)
+        if config.get('memory'):
+            await config['memory'].add(stream, stream_data, config, record)
+        if config.get('flush'):
+            await config['flush'].record(stream, stream_data, config)
+
+    def open_files(self) -> Iterator[Tuple[str, Dict, Dict[str, Any]]]:
+        '''Stream, stream data and config of the files open, those of the partitions included'''
+        for name, file_info in getattr(self, 'stream_data', {}).items():
+            # NOTE: the records of the partitioned streams are written to the files of their partitions
+            if 'path' in file_info:
+                yield name, self.stream_data, self.config
+        if self.partitions is not None:
+            for (name, _), (config, stream_data) in self.partitions.writers.items():
+                yield name, stream_data, config
+
+    async def writelines(self, lines: Iterable[str]) -> Tuple[Optional[Any], Dict[Any, Any]]:
+        '''`target-core` lines processing, the lines being parsed by batches, those of a `BlockReader` by block.
+
+        The `lock` is held while a batch is processed, the `FlushScheduler` rotating the files by age in between.
+        '''
+        passthrough: bool = self.config.get('passthrough', False)
+        # NOTE: created on the running event loop, the locks created before it being bound to another loop with Python 3.9
+        self.lock: Lock = Lock()
+        batches: AsyncIterator[List[str]] = lines.abatches() if isinstance(lines, BlockReader) else batch_lines(lines)
+        flush: Optional[FlushScheduler] = self.config.get('flush')
+        timer: Optional[Task] = None
+        if flush is not None and flush.max_object_age_seconds:
+            timer = create_task(flush.run(self.lock, min(flush.max_object_age_seconds / 2, FLUSH_INTERVAL)))
+
+        self.state = None
+        stream: Optional[str] = None
+        schemas: Dict = {}
+        validators: Dict = {}
+        self.stream_data: Dict = {}
+
+        try:
+            async for batch in batches:
+                async with self.lock:
+                    if flush is not None:
+                        flush.raise_error()
+
+                    for line, record, raw_line in parse_lines(batch, passthrough):
+                        message_type = line.get('type')
+                        if message_type == 'SCHEMA':
+                            if 'stream' not in line:
+                                raise Exception(f"Line is missing required key 'stream': {raw_line}")
+
+                            if not self.config.get('asynchronous', True) and stream is not None:
+                                await self.writeline(stream, self.stream_data, self.config)
+
+                            stream = line['stream']
+                            if 'key_properties' not in line:
+                                raise Exception('key_properties field is required')
+                            schemas[stream] = line
+                            if self.config.get('dedup') is not None:
+                                self.config['dedup'].set_key_properties(stream, line['key_properties'])
+
+                            if not passthrough:
+                                if self.config.get('add_metadata_columns'):
+                                    _add_metadata_columns_to_schema(line)
+
+                                getcontext().prec = max(_all_precisions(line['schema']), default=max(1, getcontext().prec))
+                                LOGGER.debug('Setting decimal precision to {}'.format(getcontext().prec))
+
+                                # NOTE: prevent exception *** jsonschema.exceptions.UnknownType: Unknown type 'SCHEMA' for validator.
+                                line.pop('type')
+                                validators[stream] = Draft4Validator(line, format_checker=FormatChecker())
+                            LOGGER.debug('Setting schema for {}'.format(stream))
+
+                            self.set_schemas(stream, self.config, self.stream_data, schemas[stream])
+
+                        elif message_type == 'RECORD':
+                            if 'stream' not in line or (record is None and 'record' not in line):
+                                raise Exception(f"Line is missing required key 'stream' or 'record': {raw_line}")
+                            stream = line['stream']
+
+                            if stream not in schemas:
+                                raise Exception(f'A record for stream {stream} was encountered before a corresponding schema')
+
+                            if passthrough:
+                                # NOTE: the record is saved as its original UTF-8 encoded JSON line
+                                await self.writeline(stream, self.stream_data, self.config, (record + '\n').encode('utf-8'))  # type: ignore[operator]
+                            else:
+                                validators[stream].validate(line['record'])
+                                record_to_load: Dict = _add_metadata_values_to_record(line, {}, self.config['date_time']) \
+                                    if self.config.get('add_metadata_columns') \
+                                    else _remove_metadata_values_from_record(line)
+                                await self.writeline(stream, self.stream_data, self.config, record_to_load)
+
+                            self.state = None
+
+                        elif message_type == 'STATE':
+                            LOGGER.debug('Setting state to %s', line['value'])
+                            self.state = line['value']
+
+                        elif message_type == 'ACTIVATE_VERSION':
+                            LOGGER.debug(f'ACTIVATE_VERSION {raw_line}')
+
+                        else:
+                            LOGGER.warning('Unknown line type "{}" in line "{}"'.format(line.get('type'), line))
+
+            async with self.lock:
+                # NOTE: the rotation error stored after the last batch
+                if flush is not None:
+                    flush.raise_error()
+
+                for stream in self.stream_data:
+                    await self.writeline(stream, self.stream_data, self.config)
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        return self.state, self.stream_data
+
+    def run(self, lines: TextIO = sys.stdin) -> None:
+        # NOTE: the lines are read by blocks from the binary buffer of the input
+        run(self.sync(BlockReader(lines.buffer, self.config.get('read_block_size', READ_BLOCK_SIZE))))
+
+        emit_state(self.state)
+        LOGGER.debug('Completed successfully')
+
+    async def sync(self, lines: Iterable[str]) -> None:
+
+        async with AsyncExitStack() as stack:
+            self.stack = stack
+            # NOTE: created on the running event loop, like the `lock` of `writelines`
+            self.client_lock = Lock()
+            stack.callback(self.config['metrics'].close)
+            if self.config.get('metrics_interval', METRICS_INTERVAL):
+                stack.callback(create_task(self.config['metrics'].run(self.config.get('metrics_interval', METRICS_INTERVAL))).cancel)
+
+            # NOTE: the records are written by batches appended to the file, except with a `file_size`, and in the parquet files
+            if self.config.get('compression_processes') and self.config.get('file_size') is None and self.config.get('output_format') != 'parquet':
+                from .pool import CompressionPool, BATCH_RECORDS
+
+                self.config['compression_pool'] = stack.enter_context(CompressionPool(
+                    self.config, self.config['compression_processes'], self.config.get('compression_batch_records', BATCH_RECORDS)))
+
+            if self.upload is None:
+                await super().sync(lines)
+                if self.config.get('compression_pool'):
+                    await self.config['compression_pool'].flush()
+                return
+
+            scheduler: Callable[[], UploadScheduler] = partial(
+                UploadScheduler,
+                self.upload_file,
+                max_inflight_files=self.config.get('max_inflight_files', MAX_INFLIGHT_FILES),
+                max_inflight_bytes=self.config.get('max_inflight_bytes'))
+            self.config['scheduler'] = scheduler()
+            self.config['metrics'].sample('queue_depth', lambda: self.config['scheduler'].queue_depth)
+            self.config['metrics'].sample('inflight_bytes', lambda: self.config['scheduler'].inflight_bytes)
+            try:
+                # NOTE: the uploads left in progress by an interrupted run are completed first, so the files of this run
+                # written to the same paths are uploaded by their own scheduler once the previous ones are removed
+                for file_metadata in pending_uploads(self.config):
+                    await self.config['scheduler'].submit(file_metadata)
+                await self.config['scheduler'].drain()
+
+                self.config['scheduler'] = scheduler()
+                await super().sync(lines)
+            finally:
+                # NOTE: every upload is completed, and its errors raised, before the client connection pool is closed
+                await self.config['scheduler'].drain()
+
+            if self.config.get('manifest'):
+                await self.config['manifest'].save(self.send)
+
+    async def connect(self) -> None:
+        '''Create the `aiobotocore` client on the running event loop, closed with it, so no S3 client is created before the first upload'''
+        if self.config.get('upload_backend') != 'aiobotocore' or self.config.get('local', False):
+            return
+
+        async with self.client_lock:  # type: ignore[union-attr]
+            if self.config.get('client') is None:
+                from .aio import create_client
+
+                self.config['client'] = await self.stack.enter_async_context(create_client(self.config))  # type: ignore[union-attr]
+
+    async def send(self, config: Dict[str, Any], file_metadata: Dict) -> None:
+        await self.connect()
+        await self.upload(config, file_metadata)  # type: ignore[misc]
+
+    async def upload_file(self, file_metadata: Dict) -> None:
+        if self.config.get('compression_pool'):
+            # NOTE: the file is complete once the batches compressed by the worker processes are written
+            await self.config['compression_pool'].flush(file_metadata)
+        await self.send(self.config, file_metadata)
+        if self.config.get('manifest'):
+            self.config['manifest'].add(file_metadata)
@@ -0,0 +1,248 @@
+from typing import Any, Callable, Dict, List, Optional, Pattern, Set, Tuple
+from asyncio import Semaphore, Task, create_task, gather, get_running_loop, run, sleep
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from re import compile
+from time import perf_counter
+import argparse
+import json
+
+from botocore.client import BaseClient
+
+from .multipart import MAX_PARTS
+from .retry import Retry
+from .s3 import config_s3, get_client, get_encryption_args, get_retry
+
+from target._logger import get_logger
+LOGGER = get_logger()
+
+SYNC_CONCURRENCY: int = 32
+LISTING_CONCURRENCY: int = 8
+LISTING_DEPTH: int = 1
+# NOTE: CopyObject limit, the larger objects are copied by parts
+MAX_COPY_OBJECT_SIZE: int = 5 * 1024 ** 3
+COPY_PART_SIZE: int = 256 * 1024 ** 2
+PROGRESS_INTERVAL: float = 60
+
+
+def parse_url(url: str) -> Tuple[str, str]:
+    '''Bucket and key prefix of an `s3://bucket/prefix` URL'''
+    if not url.startswith('s3://'):
+        raise ValueError(f"Invalid S3 URL '{url}'. Expected: 's3://bucket/prefix'")
+    bucket, _, prefix = url.removeprefix('s3://').partition('/')
+    return bucket, prefix
+
+
+def list_objects(client: BaseClient, retry: Retry, bucket: str, prefix: str, delimiter: Optional[str] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    '''Objects and common prefixes under the `prefix`, each page request retried alone'''
+    objects: List[Dict[str, Any]] = []
+    prefixes: List[str] = []
+    kwargs: Dict[str, Any] = {'Bucket': bucket, 'Prefix': prefix} | ({'Delimiter': delimiter} if delimiter else {})
+    while True:
+        page: Dict[str, Any] = retry.call(client.list_objects_v2, **kwargs)
+        objects.extend(page.get('Contents', []))
+        prefixes.extend(item['Prefix'] for item in page.get('CommonPrefixes', []))
+        if not page.get('IsTruncated'):
+            return objects, prefixes
+        kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+
+def is_synced(source: Dict[str, Any], target: Optional[Dict[str, Any]], compare: str = 'etag') -> bool:
+    '''Whether the `target` object is already a copy of the `source` one.
+
+    The sizes are always compared, the ETags too with the `etag` comparison,
+    unless one of them is a multipart upload ETag, which is not the MD5 digest of the content.
+    '''
+    if target is None or source['Size'] != target['Size']:
+        return False
+    return compare == 'size' or source['ETag'] == target['ETag'] or '-' in source['ETag'] + target['ETag']
+
+
+class BucketSync:
+    '''Server side copy of the objects under an S3 prefix to another bucket or prefix.
+
+    The source and target prefixes are split into their sub "folders" down to `depth` levels, each listed concurrently.
+    The objects are then copied with `CopyObject`, or `UploadPartCopy` above `multipart_threshold` bytes,
+    at most `concurrency` at the same time. The objects already found in the target are skipped.
+
+    Parameters
+    ----------
+    config : dict
+        target config, providing the credentials, `encryption_type` and retry options
+    source : str
+        source `s3://bucket/prefix` URL
+    target : str
+        target `s3://bucket/prefix` URL
+    regex : str, optional
+        only the source keys matching this regular expression are copied
+    depth : int
+        number of "folder" levels listed concurrently
+    concurrency : int
+        maximum number of copies at the same time
+    compare : str
+        `etag` or `size`, how the existing target objects are compared to the source ones
+    overwrite : bool
+        copy the objects even if they are already in the target
+    multipart_threshold : int
+        size in bytes above which the objects are copied by parts
+    '''
+
+    def __init__(self, config: Dict[str, Any], source: str, target: str, regex: Optional[str] = None, depth: int = LISTING_DEPTH,
+                 concurrency: int = SYNC_CONCURRENCY, compare: str = 'etag', overwrite: bool = False,
+                 multipart_threshold: int = MAX_COPY_OBJECT_SIZE) -> None:
+        if compare not in {'etag', 'size'}:
+            raise NotImplementedError(
+                "Comparison '{}' is not supported. "
+                "Expected: 'etag' or 'size'"
+                .format(compare))
+
+        self.config: Dict[str, Any] = config
+        self.source_bucket, self.source_prefix = parse_url(source)
+        self.target_bucket, self.target_prefix = parse_url(target)
+        self.regex: Optional[Pattern] = compile(regex) if regex else None
+        self.depth: int = depth
+        self.concurrency: int = max(concurrency, 1)
+        self.compare: str = compare
+        self.overwrite: bool = overwrite
+        self.multipart_threshold: int = min(multipart_threshold, MAX_COPY_OBJECT_SIZE)
+        self.extra_args: Dict[str, Any] = get_encryption_args(config)[1].get('ExtraArgs', {})
+
+        self.copied: int = 0
+        self.copied_bytes: int = 0
+        self.skipped: int = 0
+        self.failed: int = 0
+        self.start: float = perf_counter()
+
+    def _retry(self, bucket: str, key: str) -> Retry:
+        return get_retry(self.config | {'s3_bucket': bucket}, {'relative_path': key})
+
+    async def _run(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await get_running_loop().run_in_executor(self.executor, partial(function, *args, **kwargs))
+
+    def target_key(self, key: str) -> str:
+        return self.target_prefix + key.removeprefix(self.source_prefix)
+
+    def copy_object(self, source: Dict[str, Any]) -> None:
+        key: str = self.target_key(source['Key'])
+        retry: Retry = self._retry(self.target_bucket, key)
+        copy_source: Dict[str, str] = {'Bucket': self.source_bucket, 'Key': source['Key']}
+
+        if source['Size'] <= self.multipart_threshold:
+            retry.call(self.client.copy_object, CopySource=copy_source, CopySourceIfMatch=source['ETag'], Bucket=self.target_bucket, Key=key,
+                       **self.extra_args)
+            return
+
+        # NOTE: the object metadata is copied by `CopyObject` only
+        head: Dict[str, Any] = retry.call(self.client.head_object, Bucket=self.source_bucket, Key=source['Key'], IfMatch=source['ETag'])
+        upload_id: str = retry.call(
+            self.client.create_multipart_upload, Bucket=self.target_bucket, Key=key, Metadata=head.get('Metadata', {}),
+            **({'ContentType': head['ContentType']} if head.get('ContentType') else {}), **self.extra_args)['UploadId']
+        part_size: int = max(COPY_PART_SIZE, -(-source['Size'] // MAX_PARTS))
+        parts: List[Dict[str, Any]] = []
+        try:
+            for part_number, offset in enumerate(range(0, source['Size'], part_size), 1):
+                response: Dict[str, Any] = retry.call(
+                    self.client.upload_part_copy, CopySource=copy_source, CopySourceIfMatch=source['ETag'],
+                    CopySourceRange=f"bytes={offset}-{min(offset + part_size, source['Size']) - 1}",
+                    Bucket=self.target_bucket, Key=key, UploadId=upload_id, PartNumber=part_number)
+                parts.append({'ETag': response['CopyPartResult']['ETag'], 'PartNumber': part_number})
+            retry.call(self.client.complete_multipart_upload, Bucket=self.target_bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+        except Exception:
+            retry.call(self.client.abort_multipart_upload, Bucket=self.target_bucket, Key=key, UploadId=upload_id)
+            raise
+
+    async def copy(self, source: Dict[str, Any]) -> None:
+        try:
+            await self._run(self.copy_object, source)
+        except Exception as error:
+            self.failed += 1
+            LOGGER.error('S3 Bucket Sync - "s3://%s/%s" copy failed: %s', self.source_bucket, source['Key'], error)
+        else:
+            self.copied += 1
+            self.copied_bytes += source['Size']
+            LOGGER.debug('S3 Bucket Sync - "s3://%s/%s" to "s3://%s/%s" copy completed',
+                         self.source_bucket, source['Key'], self.target_bucket, self.target_key(source['Key']))
+        finally:
+            self.copies.release()
+
+    async def sync_prefix(self, prefix: str, depth: int) -> None:
+        '''List the source and target `prefix` at the same time, copy the missing objects, then sync the sub "folders" concurrently'''
+        delimiter: Optional[str] = '/' if depth > 0 else None
+        async with self.listings:
+            (sources, prefixes), (targets, _) = await gather(
+                self._run(list_objects, self.client, self._retry(self.source_bucket, prefix), self.source_bucket, prefix, delimiter),
+                self._run(list_objects, self.client, self._retry(self.target_bucket, self.target_key(prefix)), self.target_bucket,
+                          self.target_key(prefix), delimiter))
+
+        existing: Dict[str, Dict[str, Any]] = {item['Key']: item for item in targets}
+        for source in sources:
+            if self.regex and not self.regex.search(source['Key']):
+                continue
+            if not self.overwrite and is_synced(source, existing.get(self.target_key(source['Key'])), self.compare):
+                self.skipped += 1
+                continue
+            # NOTE: the copies are started as the listing goes, at most `concurrency` at the same time
+            await self.copies.acquire()
+            task: Task = create_task(self.copy(source))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        await gather(*(self.sync_prefix(item, depth - 1) for item in prefixes))
+
+    def log(self, message: str = 'in progress') -> None:
+        duration: float = perf_counter() - self.start
+        LOGGER.info('S3 Bucket Sync %s - %d objects, %d bytes copied in %.1fs (%.1f MiB/s, %.1f objects/s), %d skipped, %d failed',
+                    message, self.copied, self.copied_bytes, duration, self.copied_bytes / 1024 ** 2 / duration if duration else 0,
+                    self.copied / duration if duration else 0, self.skipped, self.failed)
+
+    async def progress(self, interval: float = PROGRESS_INTERVAL) -> None:
+        '''Log the throughput every `interval` seconds'''
+        while True:
+            await sleep(interval)
+            self.log()
+
+    async def run(self, progress_interval: float = PROGRESS_INTERVAL) -> None:
+        self.config.setdefault('max_pool_connections', self.concurrency + 2 * LISTING_CONCURRENCY)
+        self.client: BaseClient = self.config.get('client') or get_client(self.config)
+        self.copies: Semaphore = Semaphore(self.concurrency)
+        self.listings: Semaphore = Semaphore(LISTING_CONCURRENCY)
+        self.tasks: Set[Task] = set()
+        self.start = perf_counter()
+
+        progress: Task = create_task(self.progress(progress_interval))
+        with ThreadPoolExecutor(max_workers=self.concurrency + 2 * LISTING_CONCURRENCY) as self.executor:
+            try:
+                await self.sync_prefix(self.source_prefix, self.depth)
+                await gather(*self.tasks)
+            finally:
+                progress.cancel()
+
+        self.log('completed')
+        if self.failed:
+            raise RuntimeError(f'S3 Bucket Sync - {self.failed} objects failed to be copied')
+
+
+def main() -> None:
+    '''Bucket sync command'''
+    parser = argparse.ArgumentParser(description='Copy the objects under an S3 prefix to another bucket or prefix, server side.')
+    parser.add_argument('-c', '--config', help='Config file', required=True)
+    parser.add_argument('source', help='Source s3://bucket/prefix URL')
+    parser.add_argument('target', help='Target s3://bucket/prefix URL')
+    parser.add_argument('--regex', help='Only copy the source keys matching this regular expression')
+    parser.add_argument('--depth', type=int, default=LISTING_DEPTH, help='Number of "folder" levels listed concurrently')
+    parser.add_argument('--concurrency', type=int, default=SYNC_CONCURRENCY, help='Maximum number of copies at the same time')
+    parser.add_argument('--compare', choices=('etag', 'size'), default='etag', help='How the existing target objects are compared to the source ones')
+    parser.add_argument('--overwrite', action='store_true', help='Copy the objects even if they are already in the target')
+    parser.add_argument('--multipart-threshold', type=int, default=MAX_COPY_OBJECT_SIZE, help='Size in bytes above which the objects are copied by parts')
+    parser.add_argument('--progress-interval', type=float, default=PROGRESS_INTERVAL, help='Seconds between the throughput log messages')
+    args = parser.parse_args()
+
+    config: Dict[str, Any] = json.loads(Path(args.config).read_text(encoding='utf-8'))
+    config = config_s3({'s3_bucket': parse_url(args.target)[0]} | config)
+    run(BucketSync(config, args.source, args.target, args.regex, args.depth, args.concurrency, args.compare, args.overwrite,
+                   args.multipart_threshold).run(args.progress_interval))
+
+
+if __name__ == '__main__':
+    main()
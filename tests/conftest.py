@@ -7,6 +7,9 @@ import argparse
 import json
 
 from pytest import fixture
+from moto.server import ThreadedMotoServer
+
+from target_s3_json.s3 import clear_clients
 
 
 def clear_dir(dir_path):
@@ -15,6 +18,24 @@ def clear_dir(dir_path):
     dir_path.rmdir()
 
 
+@fixture(autouse=True)
+def clients():
+    '''The cached clients are not shared between the tests'''
+
+    yield
+    clear_clients()
+
+
+@fixture(scope='session')
+def s3_server():
+    '''Local moto S3 server, used by the clients not patched by the moto `mock_s3` decorators'''
+
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    yield f'http://127.0.0.1:{server._server.port}'  # type: ignore
+    server.stop()
+
+
 @fixture
 def patch_datetime(monkeypatch):
 
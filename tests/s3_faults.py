@@ -0,0 +1,221 @@
+'''Fault injecting S3 stand-in, used by the load and recovery tests.
+
+A local HTTP proxy in front of the moto S3 server, delaying, throttling, or dropping the requests on their way,
+so the uploads and their retry policy are run against the failures of a real S3 endpoint under load.
+'''
+from typing import Any, Callable, Counter, Dict, List, Optional, Set, Tuple
+from collections import Counter as counter
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Lock, Thread
+from time import monotonic, sleep
+from urllib.parse import parse_qs, urlsplit
+import socket
+import struct
+
+CHUNK_SIZE: int = 64 * 1024
+# NOTE: the request bodies, the parts of the multipart uploads
+DATA_OPERATIONS: Set[str] = {'PutObject', 'UploadPart'}
+HOP_HEADERS: Set[str] = {'connection', 'keep-alive', 'transfer-encoding', 'content-length'}
+SLOW_DOWN: bytes = b'<?xml version="1.0" encoding="UTF-8"?>\n' \
+    b'<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>'
+
+
+def s3_operation(method: str, path: str) -> str:
+    '''S3 API operation of the path style request'''
+    url = urlsplit(path)
+    query: Dict[str, List[str]] = parse_qs(url.query, keep_blank_values=True)
+    has_key: bool = '/' in url.path.strip('/')
+
+    if method == 'PUT':
+        return 'UploadPart' if 'partNumber' in query else 'PutObject' if has_key else 'CreateBucket'
+    if method == 'POST':
+        return 'CreateMultipartUpload' if 'uploads' in query else 'CompleteMultipartUpload' if 'uploadId' in query else 'Post'
+    if method == 'DELETE':
+        return 'AbortMultipartUpload' if 'uploadId' in query else 'DeleteObject'
+    if method == 'HEAD':
+        return 'HeadObject'
+    return 'ListParts' if 'uploadId' in query else 'ListMultipartUploads' if 'uploads' in query else 'GetObject' if has_key else 'ListObjects'
+
+
+class Bandwidth:
+    '''Link of `rate` bytes per second, shared by every connection'''
+
+    def __init__(self, rate: Optional[float] = None) -> None:
+        self.rate: Optional[float] = rate
+        self.available: float = 0
+        self.lock: Lock = Lock()
+
+    def transfer(self, size: int) -> None:
+        '''Wait for the `size` bytes to go through the link'''
+        if not self.rate:
+            return
+        with self.lock:
+            self.available = max(self.available, monotonic()) + size / self.rate
+            end: float = self.available
+        sleep(max(end - monotonic(), 0))
+
+
+class Faults:
+    '''Faults injected in the requests of the `operations`.
+
+    Parameters
+    ----------
+    latency : float
+        seconds waited before each request is processed, every operation included
+    bandwidth : float, optional
+        bytes per second of the link shared by the request and response bodies, unlimited by default
+    slow_down_rate : float
+        probability of a request answered by a 503 `SlowDown` error, once its body is received
+    drop_rate : float
+        probability of a request whose connection is dropped halfway through its body, without response
+    script : list[str], optional
+        faults injected first, in order: `slow_down`, `drop`, or None for no fault
+    operations : set[str]
+        S3 operations faulted, the requests sending data by default
+    seed : int
+        seed of the random faults
+    '''
+
+    def __init__(self, latency: float = 0, bandwidth: Optional[float] = None, slow_down_rate: float = 0, drop_rate: float = 0,
+                 script: Optional[List[Optional[str]]] = None, operations: Set[str] = DATA_OPERATIONS, seed: int = 0) -> None:
+        self.latency: float = latency
+        self.bandwidth: Bandwidth = Bandwidth(bandwidth)
+        self.slow_down_rate: float = slow_down_rate
+        self.drop_rate: float = drop_rate
+        self.script: List[Optional[str]] = list(script or [])
+        self.operations: Set[str] = operations
+        self.random: Random = Random(seed)
+        self.lock: Lock = Lock()
+
+    def draw(self, operation: str) -> Optional[str]:
+        '''Fault injected in the next request of the `operation`'''
+        if operation not in self.operations:
+            return None
+        with self.lock:
+            if self.script:
+                return self.script.pop(0)
+            value: float = self.random.random()
+        return 'slow_down' if value < self.slow_down_rate else 'drop' if value < self.slow_down_rate + self.drop_rate else None
+
+
+class FaultyS3:
+    '''Local S3 endpoint injecting `Faults` in the requests forwarded to the `upstream` S3 server, e.g. `ThreadedMotoServer`.
+
+    The outcome of every request is counted by operation in `stats`, e.g. `stats['UploadPart', 'slow_down']`,
+    and the request body bytes received in `stats['bytes', 'in']`.
+    The requests sent with a chunked transfer encoding are not supported.
+
+    Parameters
+    ----------
+    upstream : str
+        URL of the S3 server the requests are forwarded to
+    faults : Faults, optional
+        faults injected, none by default. Can be replaced while running.
+    '''
+
+    def __init__(self, upstream: str, faults: Optional[Faults] = None) -> None:
+        self.upstream: Tuple[str, int] = (urlsplit(upstream).hostname, urlsplit(upstream).port)  # type: ignore[assignment]
+        self.faults: Faults = faults or Faults()
+        self.stats: Counter[Tuple[str, str]] = counter()
+        self.stats_lock: Lock = Lock()
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread: Optional[Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_address[1]}'
+
+    def count(self, operation: str, outcome: str, value: int = 1) -> None:
+        with self.stats_lock:
+            self.stats[operation, outcome] += value
+
+    def injected(self, outcome: str) -> int:
+        '''Number of the `slow_down` or `drop` faults injected'''
+        return sum(value for (_, name), value in self.stats.items() if name == outcome)
+
+    def __enter__(self) -> 'FaultyS3':
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self) -> Callable[..., BaseHTTPRequestHandler]:
+        proxy: FaultyS3 = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _read(self, size: int, bandwidth: Bandwidth) -> bytes:
+                body: bytearray = bytearray()
+                while len(body) < size:
+                    chunk: bytes = self.rfile.read(min(CHUNK_SIZE, size - len(body)))
+                    if not chunk:
+                        break
+                    bandwidth.transfer(len(chunk))
+                    body += chunk
+                proxy.count('bytes', 'in', len(body))
+                return bytes(body)
+
+            def _write(self, data: bytes, bandwidth: Bandwidth) -> None:
+                for start in range(0, len(data), CHUNK_SIZE):
+                    bandwidth.transfer(len(data[start:start + CHUNK_SIZE]))
+                    self.wfile.write(data[start:start + CHUNK_SIZE])
+
+            def _respond(self, status: int, headers: List[Tuple[str, str]], body: bytes, bandwidth: Bandwidth) -> None:
+                self.send_response(status)
+                for name, value in headers:
+                    if name.lower() not in HOP_HEADERS:
+                        self.send_header(name, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self._write(body, bandwidth)
+
+            def _proxy(self) -> None:
+                operation: str = s3_operation(self.command, self.path)
+                faults: Faults = proxy.faults
+                if 'Transfer-Encoding' in self.headers:
+                    self.send_error(501, 'Chunked transfer encoding not supported')
+                    return
+
+                fault: Optional[str] = faults.draw(operation)
+                sleep(faults.latency)
+                size: int = int(self.headers.get('Content-Length', 0))
+
+                if fault == 'drop':
+                    # NOTE: the connection is reset halfway through the body, the request never reaching S3
+                    self._read(size // 2, faults.bandwidth)
+                    proxy.count(operation, 'drop')
+                    self.close_connection = True
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                    return
+
+                body: bytes = self._read(size, faults.bandwidth)
+                if fault == 'slow_down':
+                    proxy.count(operation, 'slow_down')
+                    self._respond(503, [('Content-Type', 'application/xml')], SLOW_DOWN, faults.bandwidth)
+                    return
+
+                connection: HTTPConnection = HTTPConnection(*proxy.upstream)
+                try:
+                    connection.request(self.command, self.path, body, {
+                        name: value for name, value in self.headers.items() if name.lower() not in HOP_HEADERS | {'expect'}})
+                    response = connection.getresponse()
+                    data: bytes = response.read()
+                finally:
+                    connection.close()
+                proxy.count(operation, 'ok')
+                self._respond(response.status, response.getheaders(), data, faults.bandwidth)
+
+            do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _proxy
+
+        return Handler
@@ -0,0 +1,370 @@
+'''Tests for the target_s3_json.aio module'''
+# Standard library imports
+import sys
+from asyncio import run, sleep
+from contextlib import asynccontextmanager
+from hashlib import sha256
+import gzip
+import json
+from datetime import datetime, timedelta, timezone
+from os import urandom
+from pathlib import Path
+from threading import current_thread, main_thread
+from uuid import uuid4
+
+# Third party imports
+from pytest import fixture, raises
+import boto3
+from botocore.exceptions import ClientError, NoCredentialsError
+
+# Package imports
+from target.file import config_file
+from target_s3_json import aio
+from target_s3_json.aio import AioMultipartWriter, REFRESH_TIMEOUT, create_client, credentials_metadata, put_object, upload_file
+from target_s3_json.checksum import CHECKSUMS, composite_checksum, encode
+from target_s3_json.metrics import Metrics
+from target_s3_json.multipart import MultipartUpload, MIN_PART_SIZE
+from target_s3_json.resume import UploadManifest, manifest_path
+from target_s3_json.s3 import main
+from target_s3_json.stream import Loader
+
+
+@fixture
+def config_raw(temp_path, s3_server):
+    '''Use custom configuration set'''
+
+    return {
+        's3_bucket': f'bucket-{uuid4()}',
+        'aws_access_key_id': 'ACCESS-KEY',
+        'aws_secret_access_key': 'SECRET',
+        'aws_endpoint_url': s3_server,
+        'upload_backend': 'aiobotocore',
+        'add_metadata_columns': False,
+        'work_dir': f'{temp_path}/tests/output',
+        'memory_buffer': 2000000,
+        'compression': 'none',
+        'timezone_offset': 0,
+        'path_template': '{stream}-{date_time}.json'
+    }
+
+
+@fixture
+def s3_client(config_raw):
+    '''boto3 client used to check the uploads'''
+
+    client = boto3.client(
+        's3', region_name='us-east-1', endpoint_url=config_raw['aws_endpoint_url'],
+        aws_access_key_id='ACCESS-KEY', aws_secret_access_key='SECRET')
+    client.create_bucket(Bucket=config_raw['s3_bucket'])
+
+    return client
+
+
+async def test_create_client(monkeypatch, config_raw, s3_client):
+    '''TEST : the aiobotocore client uses the config settings'''
+
+    async with create_client(config_raw) as client:
+        await client.put_object(Bucket=config_raw['s3_bucket'], Key='Eddy is', Body=b'awesome!')
+
+    assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key='Eddy is')['Body'].read() == b'awesome!'
+
+    # NOTE: the assumed role credentials are refreshed by the aiobotocore client
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    role_credentials = []
+    monkeypatch.setattr(aio, 'credentials_metadata', lambda credentials: role_credentials.append(credentials) or credentials_metadata(credentials))
+    async with create_client(config_raw | {'role_arn': 'arn:aws:iam::123456789012:role/TestAssumeRole', 'max_inflight_files': 4}) as client:
+        assert client.meta.config.max_pool_connections == 16
+        credentials = client._request_signer._credentials
+        access_key = (await credentials.get_frozen_credentials()).access_key
+        assert credentials._expiry_time > datetime.now(timezone.utc) + timedelta(seconds=REFRESH_TIMEOUT)
+
+        # NOTE: fetched again from the botocore credentials every minute, the role being assumed again once they expire
+        credentials._expiry_time = datetime.now(timezone.utc)
+        assert (await credentials.get_frozen_credentials()).access_key == access_key
+        role_credentials[0]._expiry_time = credentials._expiry_time = datetime.now(timezone.utc)
+        assert (await credentials.get_frozen_credentials()).access_key != access_key
+
+        await client.put_object(Bucket=config_raw['s3_bucket'], Key='Eddy is', Body=b'refreshed!')
+
+    assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key='Eddy is')['Body'].read() == b'refreshed!'
+
+    # NOTE: no credentials found at all
+    monkeypatch.setattr('boto3.session.Session.get_credentials', lambda self: None)
+    with raises(NoCredentialsError):
+        async with create_client(config_raw):
+            pass
+
+
+async def test_aio_multipart_writer(config_raw, s3_client):
+    '''TEST : the parts are uploaded by tasks on the event loop'''
+
+    bucket: str = config_raw['s3_bucket']
+    lines = [urandom(1024 ** 2 // 2).hex().encode('ascii') + b'\n' for _ in range(12)]
+
+    async with create_client(config_raw) as client:
+        async with AioMultipartWriter(client, bucket, 'dummy/small.json') as output:
+            await output.writelines(lines[:2])
+
+        assert output.upload_id is None
+        assert s3_client.get_object(Bucket=bucket, Key='dummy/small.json')['Body'].read() == b''.join(lines[:2])
+
+        async with AioMultipartWriter(client, bucket, 'dummy/large.json', part_size=MIN_PART_SIZE, max_concurrency=2) as output:
+            for index, line in enumerate(lines):
+                await output.write(line)
+                assert len(output.parts) == (index + 1) // 5
+
+    assert len(output.parts) == 3
+    assert output.part_buffer.size == output.part_buffer.compressed_size == sum(map(len, lines))
+    assert s3_client.get_object(Bucket=bucket, Key='dummy/large.json')['Body'].read() == b''.join(lines)
+    assert 'Uploads' not in s3_client.list_multipart_uploads(Bucket=bucket)
+
+
+async def test_aio_multipart_writer_file(config_raw, s3_client, temp_path, monkeypatch):
+    '''TEST : the file is read on a worker thread, so the event loop keeps running'''
+
+    threads = set()
+    chunks = MultipartUpload._chunks
+
+    def read_chunks(self, input_file):
+        for item in chunks(self, input_file):
+            threads.add(current_thread())
+            yield item
+
+    monkeypatch.setattr(MultipartUpload, '_chunks', read_chunks)
+    body = urandom(MIN_PART_SIZE + 1024)
+    path = Path(temp_path) / 'large.bin'
+    path.write_bytes(body)
+
+    async with create_client(config_raw) as client:
+        async with AioMultipartWriter(client, config_raw['s3_bucket'], 'dummy/large.bin', part_size=MIN_PART_SIZE) as output:
+            await output.write_file(path)
+
+    assert len(output.parts) == 2
+    assert threads and main_thread() not in threads
+    assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key='dummy/large.bin')['Body'].read() == body
+
+
+async def test_aio_multipart_writer_abort(config_raw, s3_client, monkeypatch):
+    '''TEST : a failure aborts the multipart upload'''
+
+    bucket: str = config_raw['s3_bucket']
+
+    async with create_client(config_raw) as client:
+        with raises(ValueError):
+            async with AioMultipartWriter(client, bucket, 'dummy/broken.json', part_size=MIN_PART_SIZE) as output:
+                await output.write(urandom(MIN_PART_SIZE))
+                raise ValueError('Broken stream')
+
+        assert output.upload_id is not None
+        assert 'Uploads' not in s3_client.list_multipart_uploads(Bucket=bucket)
+
+        monkeypatch.setattr('target_s3_json.multipart.MAX_PARTS', 1)
+        with raises(ValueError):
+            async with AioMultipartWriter(client, bucket, 'dummy/too_many_parts.json', part_size=MIN_PART_SIZE) as output:
+                await output.write(urandom(MIN_PART_SIZE))
+                await output.write(urandom(MIN_PART_SIZE))
+        monkeypatch.undo()
+
+        async def upload_part(**kwargs):
+            raise ClientError({'Error': {'Code': 'InternalError', 'Message': 'Part failure'}}, 'UploadPart')
+
+        monkeypatch.setattr(client, 'upload_part', upload_part)
+
+        with raises(ClientError):
+            async with AioMultipartWriter(client, bucket, 'dummy/failed.json', part_size=MIN_PART_SIZE, max_concurrency=1) as output:
+                await output.write(urandom(MIN_PART_SIZE))
+                await output.write(urandom(MIN_PART_SIZE))
+
+        with raises(ClientError):
+            async with AioMultipartWriter(client, bucket, 'dummy/failed.json', part_size=MIN_PART_SIZE) as output:
+                await output.write(urandom(MIN_PART_SIZE))
+
+    assert 'Uploads' not in s3_client.list_multipart_uploads(Bucket=bucket)
+    assert 'Contents' not in s3_client.list_objects_v2(Bucket=bucket)
+
+
+async def test_put_object(config_raw, s3_client):
+    '''TEST : simple asyncio put_object call'''
+
+    stream_data = [
+        {"c_pk": 1, "c_varchar": "1", "c_int": 1, "c_time": "04:00:00"},
+        {"c_pk": 2, "c_varchar": "2", "c_int": 2, "c_time": "07:15:00"},
+        {"c_pk": 3, "c_varchar": "3", "c_int": 3, "c_time": "23:00:03"}]
+    file_metadata = {
+        'absolute_path': Path('tests', 'resources', 'messages.json.gz'),
+        'relative_path': 'dummy/messages.json.gz'}
+
+    metrics = Metrics({})
+    async with create_client(config_raw) as client:
+        await put_object(config_raw | {'client': client, 'compression': 'gzip', 'metrics': metrics}, file_metadata, stream_data)
+
+    body = s3_client.get_object(Bucket=config_raw['s3_bucket'], Key=file_metadata['relative_path'])['Body'].read()
+    assert len(body) == 102
+    assert metrics.counters == {('bytes_in', None): 192, ('bytes_out', None): 102}
+    assert [json.loads(line) for line in gzip.decompress(body).splitlines()] == stream_data
+
+
+async def test_upload_file(config_raw, s3_client, temp_path):
+    '''TEST : simple asyncio upload_file call'''
+
+    temp_file: Path = Path(temp_path.join('temp_file.json'))
+    temp_file.write_bytes(Path('tests', 'resources', 'messages.json').read_bytes())
+    file_metadata = {
+        'absolute_path': temp_file,
+        'relative_path': 'dummy/messages.json'}
+
+    async with create_client(config_raw) as client:
+        await upload_file(config_raw | {'client': client, 'local': True}, file_metadata)
+        assert 'Contents' not in s3_client.list_objects_v2(Bucket=config_raw['s3_bucket'])
+
+        await upload_file(config_raw | {'client': client, 'remove_file': False}, file_metadata)
+        assert temp_file.exists()
+
+        await upload_file(config_raw | {'client': client, 'encryption_type': 'kms'}, file_metadata)
+        assert not temp_file.exists()
+
+    head = s3_client.head_object(Bucket=config_raw['s3_bucket'], Key=file_metadata['relative_path'])
+    assert head['ContentLength'] == 613
+    assert head['ServerSideEncryption'] == 'aws:kms'
+
+    # NOTE: the file buffered in memory
+    async with create_client(config_raw) as client:
+        await upload_file(config_raw | {'client': client}, {'absolute_path': temp_file, 'relative_path': 'dummy/memory.json'}, bytearray(b'{"id": 1}\n'))
+    assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key='dummy/memory.json')['Body'].read() == b'{"id": 1}\n'
+
+
+async def test_upload_file_resume(config_raw, s3_client, temp_path, monkeypatch):
+    '''TEST : an interrupted asyncio upload is resumed by sending only the missing parts'''
+
+    temp_file: Path = Path(temp_path.join('temp_file.json'))
+    body: bytes = urandom(MIN_PART_SIZE * 2 + 1024)
+    temp_file.write_bytes(body)
+    file_metadata = {'absolute_path': temp_file, 'relative_path': 'dummy/resumed.json'}
+
+    async with create_client(config_raw) as client:
+        config = config_raw | {'client': client, 'work_path': Path(temp_path.join('work')), 'part_size': MIN_PART_SIZE, 'part_concurrency': 1}
+        upload_part, sent = client.upload_part, []
+
+        async def interrupted_upload_part(**kwargs):
+            if kwargs['PartNumber'] == 2:
+                raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'UploadPart')
+            sent.append(kwargs['PartNumber'])
+            return await upload_part(**kwargs)
+
+        monkeypatch.setattr(client, 'upload_part', interrupted_upload_part)
+        with raises(ClientError):
+            await upload_file(config, file_metadata)
+        assert len(s3_client.list_multipart_uploads(Bucket=config_raw['s3_bucket'])['Uploads']) == 1
+
+        async def counted_upload_part(**kwargs):
+            sent.append(kwargs['PartNumber'])
+            return await upload_part(**kwargs)
+
+        monkeypatch.setattr(client, 'upload_part', counted_upload_part)
+        await upload_file(config, file_metadata)
+        assert sent == [1, 2, 3]
+
+        # NOTE: the uploads older than `multipart_abort_age` are aborted
+        upload_id = (await client.create_multipart_upload(Bucket=config_raw['s3_bucket'], Key='dummy/aborted.json'))['UploadId']
+        manifest = UploadManifest.create(config, {'absolute_path': temp_file, 'relative_path': 'dummy/aborted.json'}, MIN_PART_SIZE)
+        manifest.start(upload_id)
+        await upload_file(config | {'multipart_abort_age': 0}, {'absolute_path': temp_file, 'relative_path': 'dummy/aborted.json'})
+        assert not manifest.path.exists()
+
+        manifest.start('UNKNOWN-ID')
+        temp_file.write_bytes(body)
+        await upload_file(config, {'absolute_path': temp_file, 'relative_path': 'dummy/aborted.json'})
+        assert not manifest.path.exists()
+
+        manifest.start('UNKNOWN-ID')
+        await upload_file(config, {'absolute_path': temp_file, 'relative_path': 'dummy/aborted.json'})
+        assert manifest.path.exists()
+
+    assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key='dummy/resumed.json')['Body'].read() == body
+    assert 'Uploads' not in s3_client.list_multipart_uploads(Bucket=config_raw['s3_bucket'])
+
+
+async def test_upload_file_resume_unsaved_part(config_raw, s3_client, temp_path, monkeypatch):
+    '''TEST : a checksummed asyncio upload is resumed after a part was sent, but not saved in the manifest'''
+
+    temp_file: Path = Path(temp_path.join('temp_file.json'))
+    body: bytes = urandom(MIN_PART_SIZE * 2 + 1024)
+    temp_file.write_bytes(body)
+    file_metadata = {'absolute_path': temp_file, 'relative_path': 'dummy/unsaved.json'}
+
+    async with create_client(config_raw) as client:
+        config = config_raw | {'client': client, 'work_path': Path(temp_path.join('work')), 'part_size': MIN_PART_SIZE, 'part_concurrency': 1,
+                               'checksum_algorithm': 'sha256'}
+        upload_part = client.upload_part
+
+        async def interrupted_upload_part(**kwargs):
+            if kwargs['PartNumber'] == 2:
+                raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'UploadPart')
+            return await upload_part(**kwargs)
+
+        monkeypatch.setattr(client, 'upload_part', interrupted_upload_part)
+        with raises(ClientError):
+            await upload_file(config, file_metadata)
+
+        manifest = UploadManifest.load(manifest_path(config, 'dummy/unsaved.json'))
+        manifest.data |= {'parts': {}, 'checksums': {}}
+        manifest.save()
+
+        monkeypatch.setattr(client, 'upload_part', upload_part)
+        await upload_file(config, file_metadata)
+
+    assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key='dummy/unsaved.json')['Body'].read() == body
+    assert file_metadata['checksum'] == composite_checksum(
+        CHECKSUMS['sha256'], [encode(sha256(body[index:index + MIN_PART_SIZE]).digest()) for index in range(0, len(body), MIN_PART_SIZE)])
+    assert not manifest.path.exists()
+
+
+def test_loader_concurrent_uploads(monkeypatch, config_raw, s3_client, temp_path):
+    '''TEST : the concurrent uploads racing to create the client on the running event loop share it'''
+
+    files = []
+    for index in range(4):
+        path = Path(temp_path) / 'concurrent' / f'{index}.json'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'{"id": %d}\n' % index)
+        files.append({'absolute_path': path, 'relative_path': f'concurrent/{index}.json'})
+
+    clients = []
+
+    @asynccontextmanager
+    async def slow_client(config):
+        # NOTE: the other uploads wait for the client while it's created
+        await sleep(0.01)
+        async with create_client(config) as client:
+            clients.append(client)
+            yield client
+
+    async def sync(self, lines):
+        for file_metadata in files:
+            await self.config['scheduler'].submit(file_metadata)
+        assert len(self.config['scheduler'].inflight) == len(files)
+
+    # NOTE: the files are submitted at once, instead of being written from the input lines
+    monkeypatch.setattr('target.stream.Loader.sync', sync)
+    monkeypatch.setattr(aio, 'create_client', slow_client)
+    # NOTE: the Loader is created before the event loop is started, as by `main`
+    loader = Loader(config_file(config_raw) | {'client': None}, upload=upload_file)
+    run(loader.sync([]))
+
+    assert len(clients) == 1
+    for index in range(4):
+        assert s3_client.get_object(Bucket=config_raw['s3_bucket'], Key=f'concurrent/{index}.json')['Body'].read() == b'{"id": %d}\n' % index
+
+
+def test_main(capsys, patch_datetime, patch_sys_stdin, patch_argument_parser, config_raw, s3_client, state, file_metadata):
+    '''TEST : main call with the aiobotocore upload backend'''
+
+    main(lines=sys.stdin)
+
+    captured = capsys.readouterr()
+    assert captured.out == json.dumps(state) + '\n'
+
+    for stream, content_length in (('tap_dummy_test-test_table_one', 42), ('tap_dummy_test-test_table_two', 150), ('tap_dummy_test-test_table_three', 192)):
+        assert not file_metadata[stream]['path'][1]['absolute_path'].exists()
+        head = s3_client.head_object(Bucket=config_raw['s3_bucket'], Key=file_metadata[stream]['path'][1]['relative_path'])
+        assert head['ContentLength'] == content_length
@@ -0,0 +1,56 @@
+'''Tests for the target_s3_json.checksum module'''
+# Standard library imports
+import hashlib
+import sys
+import zlib
+from base64 import b64encode
+
+# Third party imports
+from pytest import raises
+
+# Package imports
+from target_s3_json.checksum import CHECKSUMS, composite_checksum, encode, get_checksum
+
+
+def test_get_checksum():
+    '''TEST : checksum algorithm of the config'''
+
+    assert get_checksum({}) is None
+    assert get_checksum({'checksum_algorithm': 'none'}) is None
+    assert get_checksum({'checksum_algorithm': 'CRC32C'}) == CHECKSUMS['crc32c']
+    assert get_checksum({'checksum_algorithm': 'sha256'}).parameter == 'ChecksumSHA256'
+
+    with raises(NotImplementedError):
+        get_checksum({'checksum_algorithm': 'md5'})
+
+
+def test_checksums():
+    '''TEST : the incremental checksums digest'''
+
+    for name, digest in (
+            ('crc32', zlib.crc32(b'abcdef').to_bytes(4, 'big')),
+            ('crc32c', bytes.fromhex('53bceff1')),
+            ('sha1', hashlib.sha1(b'abcdef').digest()),
+            ('sha256', hashlib.sha256(b'abcdef').digest())):
+        hasher = CHECKSUMS[name].new()
+        hasher.update(b'abc')
+        hasher.update(b'def')
+        assert hasher.digest() == digest
+
+    assert encode(bytes.fromhex('53bceff1')) == 'U7zv8Q=='
+
+
+def test_crc32c_missing(monkeypatch):
+    '''TEST : the crc32c package is required by the CRC32C checksum'''
+
+    monkeypatch.setitem(sys.modules, 'crc32c', None)
+    with raises(ImportError, match='pip install target-s3-jsonl\\[crc32c\\]'):
+        CHECKSUMS['crc32c'].new()
+
+
+def test_composite_checksum():
+    '''TEST : multipart upload checksum of the part checksums'''
+
+    parts = [hashlib.sha256(b'abc').digest(), hashlib.sha256(b'def').digest()]
+    assert composite_checksum(CHECKSUMS['sha256'], [encode(part) for part in parts]) == \
+        b64encode(hashlib.sha256(b''.join(parts)).digest()).decode('ascii') + '-2'
@@ -0,0 +1,106 @@
+'''Tests for the target_s3_json.codec module'''
+# Standard library imports
+import gzip
+import lzma
+import sys
+import zlib
+from os import urandom
+from pathlib import Path
+
+# Third party imports
+from pytest import raises
+import zstandard
+
+# Package imports
+from target_s3_json import codec
+from target_s3_json.codec import CODECS, Codec, ParallelGzipCompressor, get_codec, open_func, register_codec
+from target_s3_json.multipart import NoCompressor
+
+
+def test_get_codec():
+    '''TEST : the codecs are selected by the compression config option'''
+
+    assert get_codec({}) == CODECS['none']
+    assert get_codec({'compression': ''}) == CODECS['none']
+    assert get_codec({'compression': 'GZIP'}).extension == '.gz'
+    assert isinstance(get_codec({'compression': 'none'}).compressor({}), NoCompressor)
+    assert isinstance(get_codec({'compression': 'lzma'}).compressor({'compression_level': 1}), lzma.LZMACompressor)
+
+    with raises(NotImplementedError):
+        get_codec({'compression': 'dummy'})
+
+
+def test_register_codec(monkeypatch, temp_path):
+    '''TEST : third party codecs registration'''
+
+    monkeypatch.setattr(codec, 'CODECS', CODECS.copy())
+
+    register_codec('Deflate', '.deflate', lambda config: zlib.compressobj(config.get('compression_level', 6)))
+    assert get_codec({'compression': 'deflate'}).extension == '.deflate'
+
+    temp_file: Path = Path(temp_path.join('temp_file.json.deflate'))
+    with open_func({'compression': 'deflate'})(temp_file, 'wb') as output_file:
+        output_file.write(b'{"c_pk": 1}\n')
+    assert zlib.decompress(temp_file.read_bytes()) == b'{"c_pk": 1}\n'
+
+
+def test_register_codec_entry_point(monkeypatch):
+    '''TEST : third party codecs registration through the entry points'''
+
+    class EntryPoint:
+        name = 'Brotli'
+
+        def load(self):
+            return Codec('.br', lambda config: NoCompressor())
+
+    class EntryPoints(dict):
+
+        def select(self, group):
+            return [EntryPoint()] if group == 'target_s3_json.codecs' else []
+
+    monkeypatch.setattr(codec, 'CODECS', CODECS.copy())
+    monkeypatch.setattr(codec, 'entry_points', EntryPoints)
+    assert get_codec({'compression': 'brotli'}).extension == '.br'
+
+    # NOTE: Python 3.9 entry points dictionary
+    monkeypatch.setattr(codec, 'CODECS', CODECS.copy())
+    monkeypatch.setattr(codec, 'entry_points', lambda: {'target_s3_json.codecs': [EntryPoint()]})
+    assert get_codec({'compression': 'brotli'}).extension == '.br'
+
+
+def test_zstd_compressor(monkeypatch):
+    '''TEST : zstandard compression level and threads'''
+
+    compressor = get_codec({'compression': 'zstd'}).compressor({'compression_level': 19, 'compression_workers': 2})
+    data = compressor.compress(b'{"c_pk": 1}\n' * 1000) + compressor.flush()
+    assert zstandard.ZstdDecompressor().decompressobj().decompress(data) == b'{"c_pk": 1}\n' * 1000
+
+    monkeypatch.setitem(sys.modules, 'zstandard', None)
+    with raises(ImportError):
+        get_codec({'compression': 'zstd'}).compressor({})
+
+
+def test_parallel_gzip_compressor():
+    '''TEST : block parallel gzip compression produces a standard gzip stream'''
+
+    compressor = get_codec({'compression': 'gzip'}).compressor({'compression_workers': 2, 'compression_block_size': 1024})
+    assert isinstance(compressor, ParallelGzipCompressor)
+
+    lines = [urandom(100).hex().encode('ascii') + b'\n' for _ in range(1000)]
+    data = b''.join(compressor.compress(line) for line in lines) + compressor.flush()
+
+    assert gzip.decompress(data) == b''.join(lines)
+    # NOTE: one gzip member per block of at least 1024 bytes
+    assert 100 < data.count(b'\x1f\x8b\x08\x00') <= len(b''.join(lines)) // 1024
+    assert len(compressor.blocks) == 0
+    assert compressor.executor is None
+
+    # NOTE: empty stream
+    compressor = ParallelGzipCompressor()
+    assert gzip.decompress(compressor.compress(b'') + compressor.flush()) == b''
+
+    # NOTE: bounded number of blocks in memory
+    compressor = ParallelGzipCompressor(level=1, workers=1, block_size=1)
+    data = b''.join(compressor.compress(line) for line in lines)
+    assert len(compressor.blocks) <= 2
+    assert gzip.decompress(data + compressor.flush()) == b''.join(lines)
@@ -0,0 +1,115 @@
+'''Tests for the target_s3_json.compact module'''
+# Standard library imports
+import gzip
+import json
+import sys
+from os import urandom
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture, raises
+from moto import mock_s3
+import boto3
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+# Package imports
+from target_s3_json.compact import compact, compacted_key, list_objects, main, plan
+from target_s3_json.multipart import MIN_PART_SIZE
+
+
+@fixture
+def client():
+    '''S3 client with a moto bucket'''
+
+    with mock_s3():
+        client: BaseClient = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='bucket')
+        yield client
+
+
+@fixture
+def objects(client):
+    '''Small gzip objects, a larger one, and objects not to compact'''
+
+    bodies = {
+        'stream/a-1.json.gz': gzip.compress(b'{"c_pk": 1}\n'),
+        'stream/a-2.json.gz': gzip.compress(b'{"c_pk": 2}\n'),
+        'stream/a-3.json.gz': gzip.compress(urandom(MIN_PART_SIZE // 4).hex().encode('ascii') + b'\n', compresslevel=0),
+        'stream/a-4.json.gz': gzip.compress(b'{"c_pk": 4}\n'),
+        'stream/a-5.json.gz': gzip.compress(urandom(MIN_PART_SIZE).hex().encode('ascii') + b'\n', compresslevel=0),
+        'stream/a-6.json.gz': gzip.compress(b'{"c_pk": 6}\n'),
+        'stream/a-7.parquet': b'PAR1',
+        'other/b-1.json.gz': gzip.compress(b'{"c_pk": 1}\n'),
+    }
+    for key, body in bodies.items():
+        client.put_object(Bucket='bucket', Key=key, Body=body)
+
+    return bodies
+
+
+def test_plan():
+    '''TEST : the objects are batched by directory up to the target size'''
+
+    objects = [{'Key': key, 'Size': size} for key, size in (
+        ('a/1.json', 10), ('a/2.json', 10), ('a/3.json', 10), ('a/4.json', 25), ('b/1.json', 1), ('b/2.json', 1), ('c/1.json', 1))]
+
+    assert [[item['Key'] for item in batch] for batch in plan(objects, target_size=30)] == [
+        ['a/1.json', 'a/2.json', 'a/3.json'], ['b/1.json', 'b/2.json']]
+    assert compacted_key(objects[:3], '.json') == 'a/1-compacted-3.json'
+
+
+def test_compact(caplog, client, objects):
+    '''TEST : the small objects are concatenated into a valid gzip object, then deleted'''
+
+    config = {'client': client, 's3_bucket': 'bucket', 'compression': 'gzip'}
+    assert [item['Key'] for item in list_objects(client, 'bucket', 'stream/', '.json.gz')] == [f'stream/a-{index}.json.gz' for index in range(1, 7)]
+
+    assert compact(config, 'stream/', dry_run=True) == [('stream/a-1-compacted-6.json.gz', 6)]
+    assert len(list_objects(client, 'bucket', '', '.json.gz')) == 7
+
+    assert compact(config, 'stream/') == [('stream/a-1-compacted-6.json.gz', 6)]
+
+    body = client.get_object(Bucket='bucket', Key='stream/a-1-compacted-6.json.gz')['Body'].read()
+    assert body == b''.join(objects[f'stream/a-{index}.json.gz'] for index in range(1, 7))
+    assert gzip.decompress(body) == b''.join(gzip.decompress(objects[f'stream/a-{index}.json.gz']) for index in range(1, 7))
+
+    # NOTE: the larger object is copied server side, after the first bytes topping up the previous part
+    assert f"{len(objects['stream/a-5.json.gz']) - (MIN_PART_SIZE - len(b''.join(objects[f'stream/a-{index}.json.gz'] for index in range(1, 5))))} of" \
+        in caplog.text
+    assert [item['Key'] for item in client.list_objects_v2(Bucket='bucket')['Contents']] == [
+        'other/b-1.json.gz', 'stream/a-1-compacted-6.json.gz', 'stream/a-7.parquet']
+
+    with raises(NotImplementedError):
+        compact(config | {'output_format': 'parquet'}, 'stream/')
+
+
+def test_compact_changed_source(client, objects, monkeypatch):
+    '''TEST : the compaction is aborted when a source object changes'''
+
+    config = {'client': client, 's3_bucket': 'bucket', 'compression': 'gzip'}
+    list_objects_v2 = client.list_objects_v2
+
+    def changed_objects(**kwargs):
+        response = list_objects_v2(**kwargs)
+        client.put_object(Bucket='bucket', Key='stream/a-2.json.gz', Body=gzip.compress(b'{"c_pk": 22}\n'))
+        return response
+
+    monkeypatch.setattr(client, 'get_paginator', lambda name: type('Paginator', (), {'paginate': staticmethod(lambda **kwargs: [changed_objects(**kwargs)])}))
+
+    with raises(ClientError):
+        compact(config, 'stream/')
+
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket='bucket')
+    assert len(list_objects_v2(Bucket='bucket', Prefix='stream/')['Contents']) == 7
+
+
+def test_main(monkeypatch, client, objects, temp_path):
+    '''TEST : compaction command'''
+
+    config_path = Path(temp_path.join('config.json'))
+    config_path.write_text(json.dumps({'s3_bucket': 'bucket', 'compression': 'gzip'}), encoding='utf-8')
+    monkeypatch.setattr(sys, 'argv', ['target-s3-compact', '--config', str(config_path), '--prefix', 'other/', '--suffix', '.json.gz'])
+    main()
+
+    assert 'other/b-1.json.gz' in [item['Key'] for item in client.list_objects_v2(Bucket='bucket')['Contents']]
@@ -0,0 +1,83 @@
+'''Tests for the target_s3_json.dedup module'''
+# Standard library imports
+from functools import partial
+
+# Third party imports
+from pytest import mark
+
+# Package imports
+from target.file import config_file, save_json
+from target_s3_json.dedup import Deduplicator, record_key
+from target_s3_json.metrics import Metrics
+from target_s3_json.serializer import json_dumps, write
+from target_s3_json.stream import Loader
+
+SCHEMA = '{"type": "SCHEMA", "stream": "users", "key_properties": ["id"], ' \
+    '"schema": {"type": "object", "properties": {"id": {"type": "integer"}, "name": {"type": "string"}}}}'
+
+
+def record(index: int, name: str) -> str:
+    return '{"type": "RECORD", "stream": "users", "record": {"id": %d, "name": "%s"}}' % (index, name)
+
+
+@mark.parametrize('record, key_properties, key', [
+    ({'id': 1, 'name': 'a'}, ['id'], (1,)),
+    ({'id': 1, 'name': 'a'}, ['name', 'id'], ('a', 1)),
+    ({'id': {'b': 2, 'a': 1}}, ['id'], ('{"a": 1, "b": 2}',)),
+    ({'name': 'a'}, ['id'], None),
+    (b'{"id": 1, "name": "a"}', ['id'], (1,)),
+    (b'[1]', ['id'], None),
+])
+def test_record_key(record, key_properties, key):
+    '''TEST : the key values, the nested ones by their JSON text'''
+
+    assert record_key(record, key_properties) == key
+
+
+def test_deduplicate(config):
+    '''TEST : only the last version of each key is kept, at its position'''
+
+    config = config | {'metrics': Metrics(config)}
+    dedup = Deduplicator()
+    records = [{'id': 1, 'name': 'a'}, {'id': 2}, {'name': 'c'}, {'id': 1, 'name': 'b'}, {'name': 'c'}, {'id': 3}]
+
+    # NOTE: the records of a stream without key properties are kept
+    dedup.deduplicate('users', config, records)
+    dedup.set_key_properties('users', [])
+    dedup.deduplicate('users', config, records)
+    assert len(records) == 6
+
+    dedup.set_key_properties('users', ['id'])
+    dedup.deduplicate('users', config, records)
+    assert records == [{'id': 2}, {'name': 'c'}, {'id': 1, 'name': 'b'}, {'name': 'c'}, {'id': 3}]
+    assert config['metrics'].counters[('dedup_records', 'users')] == 1
+    assert config['metrics'].counters[('dedup_bytes', 'users')] == len(json_dumps({'id': 1, 'name': 'a'}))
+
+    dedup.deduplicate('users', config, records)
+    assert config['metrics'].counters[('dedup_records', 'users')] == 1
+
+
+def test_deduplicate_passthrough(config):
+    '''TEST : the records kept as their JSON line are decoded for their key, the bytes removed being their length'''
+
+    config = config | {'passthrough': True, 'metrics': Metrics(config)}
+    dedup = Deduplicator()
+    dedup.set_key_properties('users', ['id'])
+    records = [b'{"id": 1, "name": "a"}\n', b'{"id": 1, "name": "b"}\n', b'{"id": 2}\n']
+
+    dedup.deduplicate('users', config, records)
+    assert records == [b'{"id": 1, "name": "b"}\n', b'{"id": 2}\n']
+    assert config['metrics'].counters[('dedup_bytes', 'users')] == len(b'{"id": 1, "name": "a"}\n')
+
+
+@mark.parametrize('passthrough', [False, True])
+async def test_loader_deduplicate(config_raw, passthrough):
+    '''TEST : the duplicate records of the buffer are removed before being written'''
+
+    config = config_file(config_raw | {'open_func': open, 'deduplicate_records': True, 'passthrough': passthrough})
+    loader = Loader(config, writeline=partial(save_json, save=write))
+    await loader.sync([SCHEMA, record(1, 'a'), record(2, 'b'), record(1, 'c'), record(2, 'd'), record(3, 'e')])
+
+    assert loader.stream_data['users']['path'][1]['absolute_path'].read_text(encoding='utf-8').splitlines() == \
+        ['{"id": 1, "name": "c"}', '{"id": 2, "name": "d"}', '{"id": 3, "name": "e"}']
+    assert config['metrics'].counters[('dedup_records', 'users')] == 2
@@ -0,0 +1,179 @@
+'''Tests for the target_s3_json.flush module'''
+# Standard library imports
+from asyncio import Lock, create_task, sleep
+from functools import partial
+import os
+
+# Third party imports
+from pytest import raises
+
+# Package imports
+from target.file import config_file, save_json, set_schema
+from target_s3_json import flush
+from target_s3_json.flush import FlushScheduler, rotate_file
+from target_s3_json.metrics import Metrics
+from target_s3_json.s3 import upload_thread
+from target_s3_json.serializer import write
+from target_s3_json.stream import BlockReader, Loader
+
+SCHEMA = b'{"type": "SCHEMA", "stream": "users", "key_properties": ["id"], "schema": {"type": "object", "properties": {"id": {"type": "integer"}}}}\n'
+
+
+def record(index: int) -> bytes:
+    return b'{"type": "RECORD", "stream": "users", "record": {"id": %d}}\n' % index
+
+
+async def test_rotate_file(config_raw):
+    '''TEST : the buffered records are written and post processed, then the stream continues with the next part'''
+
+    config = config_file(config_raw | {'open_func': open, 'path_template': '{stream}-{part}.json'})
+    stream_data = {}
+    set_schema('users', config, stream_data)
+    stream_data['users']['file_data'].extend([{'id': 1}, {'id': 2}])
+    processed = []
+
+    async def post_processing(config, file_metadata):
+        processed.append(file_metadata['relative_path'])
+
+    await rotate_file('users', stream_data, config, post_processing=post_processing)
+
+    assert processed == ['users-1.json']
+    assert stream_data['users']['path'][1]['absolute_path'].read_text(encoding='utf-8') == '{"id": 1}\n{"id": 2}\n'
+    assert stream_data['users']['part'] == 2
+    assert stream_data['users']['path'][2]['relative_path'] == 'users-2.json'
+    assert stream_data['users']['file_data'] == []
+
+
+async def test_flush_scheduler(monkeypatch, config_raw):
+    '''TEST : the files are rotated by records count and by age'''
+
+    config = config_file(config_raw | {'path_template': '{stream}-{part}.json'})
+    config['metrics'] = Metrics(config)
+    stream_data = {}
+    set_schema('users', config, stream_data)
+    rotated = []
+
+    async def rotate(stream, stream_data, config):
+        rotated.append(stream_data[stream]['part'])
+        stream_data[stream]['part'] += 1
+        stream_data[stream]['path'][stream_data[stream]['part']] = {}
+
+    now = [100.0]
+    monkeypatch.setattr(flush, 'monotonic', lambda: now[0])
+    scheduler = FlushScheduler(rotate, lambda: [('users', stream_data, config)], max_object_age_seconds=10, max_records=3)
+
+    for _ in range(4):
+        await scheduler.record('users', stream_data, config)
+    assert rotated == [1]
+    assert stream_data['users']['path'][2] == {'opened_at': 100.0, 'record_count': 1}
+
+    # NOTE: the age is counted from the first record of the file
+    now[0] = 109.0
+    await scheduler.flush()
+    assert rotated == [1]
+    now[0] = 110.0
+    await scheduler.flush()
+    assert rotated == [1, 2]
+    assert config['metrics'].counters[('rotations', 'users')] == 2
+
+    # NOTE: an empty file, or the file of a closed stream, is not rotated
+    now[0] = 200.0
+    await scheduler.flush()
+    await scheduler.record('users', stream_data, config)
+    scheduler.close('users', stream_data)
+    now[0] = 300.0
+    await scheduler.flush()
+    assert rotated == [1, 2]
+
+
+async def test_flush_scheduler_error(config_raw):
+    '''TEST : the rotation errors are kept for the Loader to raise'''
+
+    config = config_file(config_raw | {'path_template': '{stream}-{part}.json', 'max_object_age_seconds': 0.01})
+    Loader(config, rotate=partial(rotate_file, save=write))
+    stream_data = {}
+    set_schema('users', config, stream_data)
+
+    async def rotate(stream, stream_data, config):
+        raise ValueError('Rotation failure')
+
+    scheduler = FlushScheduler(rotate, lambda: [('users', stream_data, config)], max_object_age_seconds=0.01)
+    await scheduler.record('users', stream_data, config)
+    await create_task(scheduler.run(Lock(), 0.01))
+
+    with raises(ValueError):
+        scheduler.raise_error()
+
+
+async def test_loader_flush_error(config_raw):
+    '''TEST : the rotation error stored after the last batch is raised once the input is closed'''
+
+    async def rotate(stream, stream_data, config):
+        raise ValueError('Rotation failure')
+
+    config = config_file(config_raw | {'open_func': open, 'path_template': '{stream}-{part}.json', 'max_object_age_seconds': 0.02})
+    loader = Loader(config, writeline=partial(save_json, save=write), rotate=rotate)
+
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, 'rb') as lines, open(write_fd, 'wb', buffering=0) as tap:
+        tap.write(SCHEMA + record(1))
+        task = create_task(loader.sync(BlockReader(lines)))
+        for _ in range(100):
+            if config['flush'].error is not None:
+                break
+            await sleep(0.01)
+
+        tap.close()
+        with raises(ValueError, match='Rotation failure'):
+            await task
+
+
+async def test_loader_max_object_age(config_raw):
+    '''TEST : the file of a quiet stream is uploaded once too old, while the input stays open'''
+
+    uploaded = []
+
+    async def upload(config, file_metadata):
+        uploaded.append(file_metadata['absolute_path'].read_text(encoding='utf-8'))
+
+    config = config_file(config_raw | {'open_func': open, 'path_template': '{stream}-{part}.json', 'max_object_age_seconds': 0.05})
+    loader = Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload,
+                    rotate=partial(rotate_file, save=write, post_processing=upload_thread))
+
+    read_fd, write_fd = os.pipe()
+    with open(read_fd, 'rb') as lines, open(write_fd, 'wb', buffering=0) as tap:
+        tap.write(SCHEMA + record(1) + record(2))
+        task = create_task(loader.sync(BlockReader(lines)))
+        for _ in range(100):
+            if uploaded:
+                break
+            await sleep(0.01)
+        assert uploaded == ['{"id": 1}\n{"id": 2}\n']
+
+        tap.write(record(3))
+        tap.close()
+        await task
+
+    assert uploaded == ['{"id": 1}\n{"id": 2}\n', '{"id": 3}\n']
+    assert config['metrics'].counters[('rotations', 'users')] == 1
+
+
+async def test_loader_max_records(config_raw):
+    '''TEST : the files of the stream and of its partitions are rotated once holding max_records records'''
+
+    uploaded = []
+
+    async def upload(config, file_metadata):
+        uploaded.append((file_metadata['relative_path'], file_metadata['absolute_path'].read_text(encoding='utf-8')))
+
+    for path_template, files in (
+            ('{stream}-{part}.json', [('users-1.json', '{"id": 1}\n{"id": 2}\n'), ('users-2.json', '{"id": 3}\n')]),
+            ('{stream}/dt={record.dt}-{part}.json', [
+                ('users/dt=__HIVE_DEFAULT_PARTITION__-1.json', '{"id": 1}\n{"id": 2}\n'), ('users/dt=__HIVE_DEFAULT_PARTITION__-2.json', '{"id": 3}\n')])):
+        uploaded.clear()
+        config = config_file(config_raw | {'open_func': open, 'path_template': path_template, 'max_records': 2})
+        await Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload,
+                     rotate=partial(rotate_file, save=write, post_processing=upload_thread)).sync(
+            [line.decode('utf-8') for line in (SCHEMA, record(1), record(2), record(3))])
+
+        assert sorted(uploaded) == files
@@ -0,0 +1,50 @@
+'''Tests for the target_s3_json package startup'''
+from pathlib import Path
+import subprocess
+import json
+import sys
+
+# NOTE: seconds, several times the import time of the target modules, jsonschema and target-core included
+IMPORT_BUDGET: float = 1.0
+S3_MODULES = ('boto3', 'botocore', 'backoff', 'aiobotocore')
+
+
+def run_python(code: str, **kwargs) -> str:
+    return subprocess.run([sys.executable, '-c', code], capture_output=True, check=True, text=True, **kwargs).stdout
+
+
+def test_import():
+    '''TEST : the S3 libraries are only imported once a client is needed, within the startup budget'''
+
+    output = json.loads(run_python(
+        'import json, sys, time\n'
+        'start = time.perf_counter()\n'
+        'import target_s3_json\n'
+        'package = time.perf_counter() - start\n'
+        'import target_s3_json.s3\n'
+        'print(json.dumps({"package": package, "s3": time.perf_counter() - start, "modules": sorted(sys.modules)}))\n'))
+
+    assert output['package'] < output['s3'] < IMPORT_BUDGET
+    assert not [module for module in output['modules'] if module.split('.')[0] in S3_MODULES]
+
+
+def test_main_local(temp_path):
+    '''TEST : the local mode never imports boto3'''
+
+    config = temp_path.join('config.json')
+    config.write_text(json.dumps({
+        'local': True,
+        's3_bucket': 'BUCKET',
+        'work_dir': f'{temp_path}/output',
+        'path_template': '{stream}-{date_time}.jsonl'}), encoding='utf-8')
+
+    output = run_python(
+        'import sys\n'
+        'from target_s3_json import main\n'
+        f'sys.argv = ["target-s3-json", "--config", {str(config)!r}]\n'
+        'main(sys.stdin)\n'
+        f'print(sorted(module for module in sys.modules if module.split(".")[0] in {S3_MODULES!r}))\n',
+        input=Path('tests', 'resources', 'messages.json').read_text(encoding='utf-8'))
+
+    assert output.splitlines()[-1] == '[]'
+    assert sorted(path.basename.split('-', 1)[0] for path in temp_path.join('output').listdir()) == ['locations', 'users']
@@ -0,0 +1,114 @@
+'''Tests for the target_s3_json.manifest module'''
+# Standard library imports
+import sys
+import json
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture
+
+# Package imports
+from target.file import config_file, save_json
+from target_s3_json.manifest import OutputManifest
+from target_s3_json.s3 import upload, upload_thread
+from target_s3_json.serializer import write
+from target_s3_json.stream import Loader
+
+
+@fixture
+def manifest(temp_path):
+    '''Manifest of a run writing two streams'''
+
+    return OutputManifest({
+        's3_bucket': 'bucket',
+        'work_path': Path(temp_path),
+        'date_time': datetime(2022, 4, 29, 6, 39, 38, tzinfo=timezone.utc),
+        'manifest_key': 'manifests/{date_time:%Y%m%dT%H%M%S}.json',
+        'manifest_stream_key': 'manifests/{stream}/{date_time:%Y%m%dT%H%M%S}.json',
+        'manifest_field': 'updated_at',
+        'checksum_algorithm': 'crc32c'})
+
+
+def test_output_manifest(caplog, manifest):
+    '''TEST : the files are listed with their record count, sizes, ETag and field range'''
+
+    file_one = {'relative_path': 'one/1.json', 'stream': 'one', 'size': 100, 'compressed_size': 40, 'etag': '"a"', 'checksum': 'Nks/tw=='}
+    for record in ({'updated_at': '2022-04-02'}, {'updated_at': '2022-04-01'}, {'updated_at': None}, {'updated_at': '2022-04-03'}):
+        manifest.record(file_one, record)
+    manifest.record(file_one, {'updated_at': 1})
+    assert "Field 'updated_at' value 1 not comparable with the range ['2022-04-01', '2022-04-03'] of one/1.json" in caplog.text
+
+    file_two = {'relative_path': 'two/1.json', 'stream': 'two', 'compressed_size': 10}
+    manifest.record(file_two, b'{"updated_at": "2022-04-01"}\n')
+    manifest.add(file_one)
+    manifest.add(file_two)
+    manifest.add({'relative_path': 'two/2.json', 'stream': 'two', 'compressed_size': 0})
+
+    manifests = manifest.manifests()
+    assert list(manifests) == ['manifests/20220429T063938.json', 'manifests/one/20220429T063938.json', 'manifests/two/20220429T063938.json']
+    assert manifests['manifests/20220429T063938.json'] == {
+        'bucket': 'bucket',
+        'date_time': '2022-04-29T06:39:38+00:00',
+        'checksum_algorithm': 'crc32c',
+        'field': 'updated_at',
+        'records': 6,
+        'size': 100,
+        'compressed_size': 50,
+        'files': [
+            {'key': 'one/1.json', 'stream': 'one', 'records': 5, 'size': 100, 'compressed_size': 40, 'etag': '"a"', 'checksum': 'Nks/tw==',
+             'min': '2022-04-01', 'max': '2022-04-03'},
+            {'key': 'two/1.json', 'stream': 'two', 'records': 1, 'size': None, 'compressed_size': 10, 'etag': None, 'checksum': None,
+             'min': None, 'max': None}]}
+    assert manifests['manifests/two/20220429T063938.json']['stream'] == 'two'
+    assert [item['key'] for item in manifests['manifests/two/20220429T063938.json']['files']] == ['two/1.json']
+
+
+async def test_output_manifest_save(manifest):
+    '''TEST : the manifests are written to the work_dir, then uploaded'''
+
+    uploaded = []
+
+    async def upload(config, file_metadata):
+        uploaded.append(json.loads(file_metadata['absolute_path'].read_text(encoding='utf-8')))
+
+    manifest.add({'relative_path': 'one/1.json', 'stream': 'one', 'records': 1, 'size': 10, 'compressed_size': 10})
+    await manifest.save(upload)
+
+    assert [item['files'][0]['key'] for item in uploaded] == ['one/1.json', 'one/1.json']
+
+
+def test_loader_manifest(patch_datetime, patch_sys_stdin, config_raw, file_metadata):
+    '''TEST : the Loader lists the files uploaded by the run'''
+
+    config = config_file(config_raw | {
+        'open_func': open, 'local': True, 'thread_pool': False, 'remove_file': False,
+        'manifest_key': 'manifest-{date_time:%Y%m%d}.json', 'manifest_field': 'c_pk'})
+    Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload).run(sys.stdin)
+
+    content = json.loads((config['work_path'] / 'manifest-20220429.json').read_text(encoding='utf-8'))
+    assert content['bucket'] is None
+    assert content['records'] == 6
+    assert [(item['key'], item['stream'], item['records'], item['min'], item['max']) for item in content['files']] == [
+        (file_metadata[stream]['path'][1]['relative_path'], stream, records, 1, records)
+        for stream, records in (('tap_dummy_test-test_table_one', 1), ('tap_dummy_test-test_table_three', 3), ('tap_dummy_test-test_table_two', 2))]
+    assert all(item['size'] == item['compressed_size'] == file_metadata[item['stream']]['path'][1]['absolute_path'].stat().st_size
+               for item in content['files'])
+
+
+async def test_loader_manifest_deduplicate(patch_datetime, config_raw):
+    '''TEST : the records listed are those written, once deduplicated, their field range included'''
+
+    config = config_file(config_raw | {
+        'open_func': open, 'local': True, 'thread_pool': False, 'remove_file': False, 'deduplicate_records': True,
+        'manifest_key': 'manifest-{date_time:%Y%m%d}.json', 'manifest_field': 'updated_at'})
+    loader = Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload)
+    await loader.sync([json.dumps({'type': 'SCHEMA', 'stream': 'users', 'key_properties': ['id'], 'schema': {'properties': {}}})] + [
+        json.dumps({'type': 'RECORD', 'stream': 'users', 'record': {'id': index % 2, 'updated_at': updated_at}})
+        for index, updated_at in enumerate((9, 0, 5, 3))])
+
+    content = json.loads((config['work_path'] / 'manifest-20220429.json').read_text(encoding='utf-8'))
+    assert content['records'] == 2
+    assert [(item['records'], item['min'], item['max']) for item in content['files']] == [(2, 3, 5)]
+    assert config['metrics'].counters[('dedup_records', 'users')] == 2
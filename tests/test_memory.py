@@ -0,0 +1,102 @@
+'''Tests for the target_s3_json.memory module'''
+# Standard library imports
+import sys
+import gzip
+import json
+from functools import partial
+from io import StringIO
+
+# Package imports
+from target.file import config_file, save_json
+from target_s3_json.codec import open_func
+from target_s3_json.memory import MemoryBudget, record_size
+from target_s3_json.s3 import upload_thread
+from target_s3_json.serializer import write, write_buffer
+from target_s3_json.stream import Loader
+
+
+def test_record_size():
+    '''TEST : the nested values included'''
+
+    assert record_size('abc') == sys.getsizeof('abc')
+    assert record_size({'a': [1, 'b']}) == sys.getsizeof({'a': [1, 'b']}) + sys.getsizeof('a') + sys.getsizeof([1, 'b']) \
+        + sys.getsizeof(1) + sys.getsizeof('b')
+
+
+async def test_memory_budget(config):
+    '''TEST : the largest buffers spilled once over budget'''
+
+    spilled = []
+
+    async def spill(stream, stream_data, config):
+        spilled.append((stream, len(stream_data[stream]['file_data'])))
+        del stream_data[stream]['file_data'][:]
+
+    record = {'id': 1}
+    memory = MemoryBudget(record_size(record) * 4, spill)
+    stream_data = {stream: {'part': 1, 'path': {1: {}}, 'file_data': []} for stream in ('a', 'b')}
+
+    for stream in 'aabab':
+        stream_data[stream]['file_data'].append(record := dict(record))
+        await memory.add(stream, stream_data, config, record)
+    assert spilled == [('a', 3)]
+    assert memory.size == record_size(record) * 2
+    assert memory.spilled_bytes == record_size(record) * 3
+
+    # NOTE: the records already written to their file are ignored
+    await memory.add('b', stream_data, config, {'id': 2})
+    assert memory.size == record_size(record) * 2
+
+    # NOTE: a buffer written to its file since only holds its last record
+    del stream_data['b']['file_data'][:]
+    stream_data['b']['file_data'].append(record := dict(record))
+    await memory.add('b', stream_data, config, record)
+    assert memory.size == record_size(record)
+
+    del stream_data['b']['file_data'][:]
+    memory.release()
+    assert memory.size == 0
+    assert not memory.buffers
+
+
+async def test_loader_memory_budget(config_raw):
+    '''TEST : the streams buffers spilled to their file, and the memory used sampled'''
+
+    lines = []
+    for stream in ('a', 'b'):
+        lines.append({'type': 'SCHEMA', 'stream': stream, 'key_properties': ['id'], 'schema': {'type': 'object', 'properties': {'id': {'type': 'integer'}}}})
+        lines += [{'type': 'RECORD', 'stream': stream, 'record': {'id': index, 'name': stream * index}} for index in range(50)]
+
+    config = config_file(config_raw | {'open_func': open, 'memory_budget': 2000})
+    loader = Loader(config, writeline=partial(save_json, save=write), spill=write_buffer)
+    await loader.sync(StringIO(''.join(json.dumps(line) + '\n' for line in lines)))
+
+    assert config['memory'].spilled_bytes > 0
+    assert config['memory'].size == 0
+    assert config['metrics'].samplers[('buffered_bytes', None)]() == 0
+    for stream in ('a', 'b'):
+        with loader.stream_data[stream]['path'][1]['absolute_path'].open(encoding='utf-8') as input_file:
+            assert [json.loads(line)['id'] for line in input_file] == list(range(50))
+
+
+async def test_loader_upload_from_memory(config_raw):
+    '''TEST : the files uploaded from memory, the largest ones spilled to the `work_dir` when over budget'''
+
+    uploaded = {}
+
+    async def upload(config, file_metadata):
+        buffer = file_metadata.pop('buffer', None)
+        uploaded[file_metadata['relative_path']] = (
+            buffer is not None, [json.loads(line)['id'] for line in gzip.decompress(buffer or file_metadata['absolute_path'].read_bytes()).splitlines()])
+
+    lines = []
+    for stream, count in (('small', 5), ('large', 200)):
+        lines.append({'type': 'SCHEMA', 'stream': stream, 'key_properties': ['id'], 'schema': {'type': 'object', 'properties': {'id': {'type': 'integer'}}}})
+        lines += [{'type': 'RECORD', 'stream': stream, 'record': {'id': index}} for index in range(count)]
+
+    config = config_file(config_raw | {'compression': 'gzip', 'path_template': '{stream}.json', 'open_func': open_func({'compression': 'gzip'}),
+                                       'upload_from_memory': True, 'memory_budget': 8000})
+    await Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload, spill=write_buffer) \
+        .sync(StringIO(''.join(json.dumps(line) + '\n' for line in lines)))
+
+    assert uploaded == {'small.json': (True, list(range(5))), 'large.json': (False, list(range(200)))}
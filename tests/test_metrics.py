@@ -0,0 +1,133 @@
+'''Tests for the target_s3_json.metrics module'''
+# Standard library imports
+import json
+import socket
+from asyncio import create_task, sleep
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture
+
+# Package imports
+from target_s3_json.metrics import Histogram, Metrics
+
+
+@fixture
+def statsd_server():
+    '''Local UDP socket receiving the StatsD datagrams'''
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(1)
+    yield server
+    server.close()
+
+
+def test_histogram():
+    '''TEST : cumulative histogram buckets'''
+
+    histogram = Histogram((1, 10, float('inf')))
+    for value in (0.5, 1, 5, 100):
+        histogram.observe(value)
+
+    assert histogram.cumulative_counts() == [2, 3, 4]
+    assert histogram.count == 4
+    assert histogram.sum == 106.5
+
+
+def test_metrics(caplog, temp_path, statsd_server):
+    '''TEST : the metrics are emitted as Singer METRIC log lines, Prometheus textfile and StatsD datagrams'''
+
+    prometheus_file = Path(temp_path.join('metrics', 'target.prom'))
+    metrics = Metrics({
+        'metrics_prometheus_file': str(prometheus_file),
+        'metrics_statsd_host': '127.0.0.1',
+        'metrics_statsd_port': statsd_server.getsockname()[1]})
+
+    metrics.increment('records_in', stream='my"stream')
+    metrics.increment('records_in', 2, stream='my"stream')
+    metrics.sample('queue_depth', lambda: 3)
+    metrics.upload('my"stream', 1000, 250, 0.2)
+    assert statsd_server.recv(1024) == b'target_s3_json.upload_duration_seconds:200|ms|#stream:my"stream'
+
+    metrics.emit()
+
+    assert 'METRIC: {"type": "counter", "metric": "records_in", "value": 3, "tags": {"stream": "my\\"stream"}}' in caplog.text
+    assert 'METRIC: {"type": "gauge", "metric": "compression_ratio", "value": 4.0, "tags": {"stream": "my\\"stream"}}' in caplog.text
+    assert 'METRIC: {"type": "gauge", "metric": "queue_depth", "value": 3, "tags": {}}' in caplog.text
+    histogram = json.loads(caplog.text.split('METRIC: ')[-1].split('\n')[0])
+    assert histogram['type'] == 'histogram'
+    assert histogram['value']['count'] == 1
+    assert histogram['value']['buckets']['0.25'] == 1
+
+    assert prometheus_file.read_text(encoding='utf-8').split('\n')[:6] == [
+        '# TYPE target_s3_json_bytes_in_total counter',
+        'target_s3_json_bytes_in_total{stream="my\\"stream"} 1000',
+        '# TYPE target_s3_json_bytes_out_total counter',
+        'target_s3_json_bytes_out_total{stream="my\\"stream"} 250',
+        '# TYPE target_s3_json_records_in_total counter',
+        'target_s3_json_records_in_total{stream="my\\"stream"} 3']
+    assert 'target_s3_json_queue_depth 3\n' in prometheus_file.read_text(encoding='utf-8')
+    assert 'target_s3_json_upload_duration_seconds_bucket{stream="my\\"stream",le="+Inf"} 1\n' in prometheus_file.read_text(encoding='utf-8')
+    assert 'target_s3_json_upload_duration_seconds_count{stream="my\\"stream"} 1\n' in prometheus_file.read_text(encoding='utf-8')
+
+    assert statsd_server.recv(1024).decode('utf-8').split('\n') == [
+        'target_s3_json.records_in:3|c|#stream:my"stream',
+        'target_s3_json.bytes_in:1000|c|#stream:my"stream',
+        'target_s3_json.bytes_out:250|c|#stream:my"stream',
+        'target_s3_json.compression_ratio:4|g|#stream:my"stream',
+        'target_s3_json.queue_depth:3|g']
+
+    # NOTE: the StatsD counters are sent as increments
+    metrics.increment('records_in', stream='my"stream')
+    metrics.close()
+    assert statsd_server.recv(1024).decode('utf-8').split('\n')[0] == 'target_s3_json.records_in:1|c|#stream:my"stream'
+    assert metrics.statsd.fileno() == -1
+
+
+def test_metrics_threads(temp_path):
+    '''TEST : the metrics updated by several threads while emitted lose no value'''
+
+    metrics = Metrics({'metrics_prometheus_file': f'{temp_path}/metrics.prom'})
+
+    def update(thread):
+        for index in range(2000):
+            metrics.increment('records_in', stream=f'stream_{thread}_{index % 100}')
+            metrics.upload(f'stream_{thread}', 10, 5, 0.1)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(update, thread) for thread in range(4)]
+        while not all(future.done() for future in futures):
+            metrics.emit()
+        for future in futures:
+            future.result()
+
+    assert sum(value for (name, _), value in metrics.counters.items() if name == 'records_in') == 8000
+    assert metrics.counters[('bytes_in', 'stream_0')] == 20000
+    assert sum(histogram.count for histogram in metrics.histograms.values()) == 8000
+
+
+def test_metrics_statsd_error(caplog, monkeypatch):
+    '''TEST : the StatsD errors are logged'''
+
+    metrics = Metrics({'metrics_statsd_host': '127.0.0.1'})
+
+    def sendto(data, address):
+        raise OSError('Network is unreachable')
+
+    monkeypatch.setattr(metrics, 'statsd', type('Socket', (), {'sendto': staticmethod(sendto), 'close': lambda self: None})())
+    metrics.observe('upload_duration_seconds', 1)
+    assert 'Unable to send the metrics to StatsD: Network is unreachable' in caplog.text
+
+
+async def test_metrics_run(caplog):
+    '''TEST : the metrics are emitted every interval'''
+
+    metrics = Metrics({})
+    metrics.increment('records_in')
+    task = create_task(metrics.run(0.01))
+    await sleep(0.05)
+    task.cancel()
+
+    assert caplog.text.count('"metric": "records_in"') >= 2
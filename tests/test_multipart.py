@@ -0,0 +1,208 @@
+'''Tests for the target_s3_json.multipart module'''
+# Standard library imports
+import gzip
+import hashlib
+import json
+import lzma
+import zlib
+from os import urandom
+
+# Third party imports
+from crc32c import crc32c
+from pytest import fixture, raises
+from moto import mock_s3
+import boto3
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+# Package imports
+from target_s3_json.checksum import CHECKSUMS, composite_checksum, encode
+from target_s3_json.multipart import MultipartUpload, MultipartWriter, NoCompressor, PartBuffer, MIN_PART_SIZE
+from target_s3_json.retry import Retry
+
+
+@fixture
+def client():
+    '''S3 client with a moto bucket'''
+
+    with mock_s3():
+        client: BaseClient = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='BUCKET')
+        yield client
+
+
+def test_no_compressor():
+    '''TEST : identity compressor'''
+
+    compressor = NoCompressor()
+    assert compressor.compress(b'data') == b'data'
+    assert compressor.flush() == b''
+
+
+def test_multipart_upload_abstract(client):
+    '''TEST : the upload state is only used by the writers sending the requests'''
+
+    with raises(TypeError):
+        MultipartUpload(client, 'BUCKET', 'dummy/abstract.json')
+
+
+def test_multipart_writer_small_object(client):
+    '''TEST : objects smaller than a part are sent with a single put_object call'''
+
+    with MultipartWriter(client, 'BUCKET', 'dummy/small.json', part_size=1) as output:
+        output.writelines([b'{"c_pk": 1}\n', b'{"c_pk": 2}\n'])
+
+    assert output.part_buffer.part_size == MIN_PART_SIZE
+    assert output.upload_id is None
+    assert output.size == output.compressed_size == 24
+    assert client.get_object(Bucket='BUCKET', Key='dummy/small.json')['Body'].read() == b'{"c_pk": 1}\n{"c_pk": 2}\n'
+    assert output.etag == client.head_object(Bucket='BUCKET', Key='dummy/small.json')['ETag']
+
+
+def test_multipart_writer_parts(client):
+    '''TEST : the parts are uploaded while the data is written'''
+
+    lines = [urandom(1024 ** 2 // 2).hex().encode('ascii') + b'\n' for _ in range(12)]
+
+    with MultipartWriter(client, 'BUCKET', 'dummy/large.json', part_size=MIN_PART_SIZE, max_concurrency=2) as output:
+        for index, line in enumerate(lines):
+            output.write(line)
+            # NOTE: every 5 lines of 1 MiB a new part is started
+            assert len(output.parts) == (index + 1) // 5
+            assert len(output.part_buffer.buffer) < MIN_PART_SIZE
+
+    assert len(output.parts) == 3
+    assert output.size == output.compressed_size == sum(map(len, lines))
+    assert client.get_object(Bucket='BUCKET', Key='dummy/large.json')['Body'].read() == b''.join(lines)
+    assert output.etag.endswith('-3"')
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket='BUCKET')
+
+
+def test_multipart_writer_compressor(client):
+    '''TEST : the compressed stream split across parts is a valid archive'''
+
+    lines = [json.dumps({'c_pk': index, 'c_varchar': urandom(512).hex()}).encode('utf-8') + b'\n' for index in range(12000)]
+
+    with MultipartWriter(client, 'BUCKET', 'dummy/large.json.gz', compressor=zlib.compressobj(9, zlib.DEFLATED, 31), part_size=MIN_PART_SIZE) as output:
+        output.writelines(lines)
+
+    assert len(output.parts) > 1
+    assert output.compressed_size < output.size
+    assert gzip.decompress(client.get_object(Bucket='BUCKET', Key='dummy/large.json.gz')['Body'].read()) == b''.join(lines)
+
+    with MultipartWriter(client, 'BUCKET', 'dummy/small.json.xz', compressor=lzma.LZMACompressor()) as output:
+        output.writelines(lines[:3])
+
+    assert lzma.decompress(client.get_object(Bucket='BUCKET', Key='dummy/small.json.xz')['Body'].read()) == b''.join(lines[:3])
+
+
+def test_multipart_writer_abort(client):
+    '''TEST : a failure while streaming aborts the multipart upload'''
+
+    def records():
+        yield urandom(MIN_PART_SIZE // 2).hex().encode('ascii')
+        raise ValueError('Broken stream')
+
+    with raises(ValueError):
+        with MultipartWriter(client, 'BUCKET', 'dummy/broken.json', part_size=MIN_PART_SIZE) as output:
+            output.writelines(records())
+
+    assert output.upload_id is not None
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket='BUCKET')
+    assert 'Contents' not in client.list_objects_v2(Bucket='BUCKET', Prefix='dummy/broken.json')
+
+
+def test_multipart_writer_part_error(client, monkeypatch):
+    '''TEST : a part upload failure aborts the multipart upload'''
+
+    def upload_part(**kwargs):
+        raise ClientError({'Error': {'Code': 'InternalError', 'Message': 'Part failure'}}, 'UploadPart')
+
+    monkeypatch.setattr(client, 'upload_part', upload_part)
+
+    with raises(ClientError):
+        with MultipartWriter(client, 'BUCKET', 'dummy/failed.json', part_size=MIN_PART_SIZE, max_concurrency=1) as output:
+            output.write(urandom(MIN_PART_SIZE))
+
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket='BUCKET')
+
+    # NOTE: the error is raised before the next part is sent
+    with raises(ClientError):
+        with MultipartWriter(client, 'BUCKET', 'dummy/failed.json', part_size=MIN_PART_SIZE, max_concurrency=1) as output:
+            output.write(urandom(MIN_PART_SIZE))
+            output.write(urandom(MIN_PART_SIZE))
+
+    assert len(output.parts) == 1
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket='BUCKET')
+
+
+def test_multipart_writer_part_retry(client, monkeypatch):
+    '''TEST : a throttled part is sent again alone'''
+
+    upload_part, attempts = client.upload_part, []
+
+    def throttled_upload_part(**kwargs):
+        attempts.append(kwargs['PartNumber'])
+        if attempts.count(kwargs['PartNumber']) == 1 and kwargs['PartNumber'] == 2:
+            raise ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}}, 'UploadPart')
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(client, 'upload_part', throttled_upload_part)
+    body = urandom(MIN_PART_SIZE * 2)
+
+    with MultipartWriter(client, 'BUCKET', 'dummy/retried.json', part_size=MIN_PART_SIZE, max_concurrency=1, retry=Retry(base_delay=0.001)) as output:
+        output.write(body[:MIN_PART_SIZE])
+        output.write(body[MIN_PART_SIZE:])
+
+    assert sorted(attempts) == [1, 2, 2]
+    assert client.get_object(Bucket='BUCKET', Key='dummy/retried.json')['Body'].read() == body
+
+
+def test_multipart_writer_checksum(client, monkeypatch):
+    '''TEST : the parts are sent with their checksum, computed while the data is compressed'''
+
+    requests = []
+    for method in ('put_object', 'create_multipart_upload', 'upload_part', 'complete_multipart_upload'):
+        monkeypatch.setattr(client, method, lambda function=getattr(client, method), **kwargs: requests.append(kwargs) or function(**kwargs))
+
+    with MultipartWriter(client, 'BUCKET', 'dummy/small.json', checksum=CHECKSUMS['sha256']) as output:
+        output.write(b'{"c_pk": 1}\n')
+
+    assert requests.pop()['ChecksumSHA256'] == output.object_checksum == encode(hashlib.sha256(b'{"c_pk": 1}\n').digest())
+
+    body = urandom(MIN_PART_SIZE * 2)
+    with MultipartWriter(client, 'BUCKET', 'dummy/large.json.gz', compressor=zlib.compressobj(1, zlib.DEFLATED, 31), part_size=MIN_PART_SIZE,
+                         checksum=CHECKSUMS['crc32c']) as output:
+        for index in range(0, len(body), 1024):
+            output.write(body[index:index + 1024])
+
+    assert gzip.decompress(client.get_object(Bucket='BUCKET', Key='dummy/large.json.gz')['Body'].read()) == body
+    assert requests[0]['ChecksumAlgorithm'] == 'CRC32C'
+    part_checksums = [encode(crc32c(request['Body']).to_bytes(4, 'big')) for request in requests[1:3]]
+    assert [request['ChecksumCRC32C'] for request in requests[1:3]] == part_checksums
+    assert [part['ChecksumCRC32C'] for part in requests[3]['MultipartUpload']['Parts']] == part_checksums
+    assert output.object_checksum == composite_checksum(CHECKSUMS['crc32c'], part_checksums)
+
+
+def test_part_buffer_checksum():
+    '''TEST : the checksum of each part is computed incrementally'''
+
+    part_buffer = PartBuffer(part_size=MIN_PART_SIZE, checksum=CHECKSUMS['sha1'])
+    assert part_buffer.write(b'a' * MIN_PART_SIZE) == b'a' * MIN_PART_SIZE
+    assert part_buffer.part_checksum == encode(hashlib.sha1(b'a' * MIN_PART_SIZE).digest())
+    part_buffer.write(b'b')
+    assert part_buffer.flush() == b'b'
+    assert part_buffer.part_checksum == encode(hashlib.sha1(b'b').digest())
+
+
+def test_multipart_writer_max_parts(client, monkeypatch):
+    '''TEST : the S3 parts count limit is enforced'''
+
+    monkeypatch.setattr('target_s3_json.multipart.MAX_PARTS', 1)
+
+    with raises(ValueError):
+        with MultipartWriter(client, 'BUCKET', 'dummy/too_many_parts.json', part_size=MIN_PART_SIZE) as output:
+            output.write(urandom(MIN_PART_SIZE))
+            output.write(urandom(MIN_PART_SIZE))
+
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket='BUCKET')
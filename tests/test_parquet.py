@@ -0,0 +1,232 @@
+'''Tests for the target_s3_json.parquet module'''
+# Standard library imports
+import sys
+import json
+from functools import partial
+from io import BytesIO
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture, raises
+import boto3
+import pyarrow
+from pyarrow import parquet
+from moto import mock_s3
+
+# Package imports
+from target.file import config_file
+from target_s3_json.parquet import arrow_schema, close_file, config_parquet, record_batch, save_parquet, set_schema
+from target_s3_json.s3 import config_compression, config_s3, main, upload_thread
+from target_s3_json.stream import Loader
+
+
+@fixture
+def config_raw(temp_path):
+    '''Use custom configuration set'''
+
+    return {
+        's3_bucket': 'BUCKET',
+        'aws_access_key_id': 'ACCESS-KEY',
+        'aws_secret_access_key': 'SECRET',
+        'output_format': 'parquet',
+        'add_metadata_columns': False,
+        'work_dir': f'{temp_path}/tests/output',
+        'compression': 'none',
+        'timezone_offset': 0,
+        'path_template': '{stream}-{date_time}.json'
+    }
+
+
+@fixture
+def config(patch_datetime, config_raw):
+    '''Use custom configuration set'''
+
+    return config_file(config_raw)
+
+
+@fixture
+def schema():
+    '''Singer JSON schema'''
+
+    return {
+        'type': 'object',
+        'properties': {
+            'c_pk': {'type': ['null', 'integer']},
+            'c_number': {'type': ['null', 'integer', 'number']},
+            'c_boolean': {'type': 'boolean'},
+            'c_varchar': {'type': ['null', 'string']},
+            'c_date_time': {'type': ['null', 'string'], 'format': 'date-time'},
+            'c_date': {'type': ['null', 'string'], 'format': 'date'},
+            'c_multi': {'type': ['null', 'string', 'integer']},
+            'c_object': {'type': ['null', 'object'], 'properties': {'c_date_time': {'type': 'string', 'format': 'date-time'}, 'c_int': {'type': 'integer'}}},
+            'c_json': {'type': ['null', 'object']},
+            'c_array': {'type': ['null', 'array'], 'items': {'type': 'string', 'format': 'date'}},
+            'c_any': {'anyOf': [{'type': 'string'}, {'type': 'integer'}]}}}
+
+
+def test_arrow_schema(schema):
+    '''TEST : the Singer JSON schema types are mapped to the Arrow types'''
+
+    assert arrow_schema(schema) == pyarrow.schema([
+        ('c_pk', pyarrow.int64()),
+        ('c_number', pyarrow.float64()),
+        ('c_boolean', pyarrow.bool_()),
+        ('c_varchar', pyarrow.string()),
+        ('c_date_time', pyarrow.timestamp('us', tz='UTC')),
+        ('c_date', pyarrow.date32()),
+        ('c_multi', pyarrow.string()),
+        ('c_object', pyarrow.struct([('c_date_time', pyarrow.timestamp('us', tz='UTC')), ('c_int', pyarrow.int64())])),
+        ('c_json', pyarrow.string()),
+        ('c_array', pyarrow.list_(pyarrow.date32())),
+        ('c_any', pyarrow.string())])
+
+    assert arrow_schema({}) == pyarrow.schema([])
+
+
+def test_record_batch(schema):
+    '''TEST : the JSON values are converted to the Arrow columns'''
+
+    batch = record_batch(arrow_schema(schema), [
+        {'c_pk': 1, 'c_number': 1, 'c_boolean': True, 'c_varchar': 'é', 'c_date_time': '2019-02-01T15:12:45.123Z', 'c_date': '2019-02-01',
+         'c_multi': 1, 'c_object': {'c_date_time': '2019-02-01 15:12:45+01:00', 'c_int': 1}, 'c_json': {'a': [1]}, 'c_array': ['2019-02-01'],
+         'c_any': 'a', 'c_dropped': 1},
+        {'c_boolean': False, 'c_date_time': '2019-02-01 15:12:45', 'c_object': {'c_int': 2}, 'c_array': None}])
+
+    assert batch.to_pylist() == [
+        {'c_pk': 1, 'c_number': 1.0, 'c_boolean': True, 'c_varchar': 'é', 'c_date_time': datetime(2019, 2, 1, 15, 12, 45, 123000, tzinfo=timezone.utc),
+         'c_date': date(2019, 2, 1), 'c_multi': '1', 'c_object': {'c_date_time': datetime(2019, 2, 1, 14, 12, 45, tzinfo=timezone.utc), 'c_int': 1},
+         'c_json': '{"a": [1]}', 'c_array': [date(2019, 2, 1)], 'c_any': 'a'},
+        {'c_pk': None, 'c_number': None, 'c_boolean': False, 'c_varchar': None, 'c_date_time': datetime(2019, 2, 1, 15, 12, 45, tzinfo=timezone.utc),
+         'c_date': None, 'c_multi': None, 'c_object': {'c_date_time': None, 'c_int': 2}, 'c_json': None, 'c_array': None, 'c_any': None}]
+
+
+def test_config_parquet(config_raw):
+    '''TEST : the parquet files extension and compression'''
+
+    config = config_compression(config_raw)
+    assert config['path_template'] == '{stream}-{date_time}.parquet'
+    assert config['parquet_compression'] == 'snappy'
+    assert config['open_func'] is open
+
+    assert config_parquet(config_raw | {'path_template': '{stream}.jsonl'})['path_template'] == '{stream}.jsonl.parquet'
+
+    with raises(NotImplementedError):
+        config_parquet(config_raw | {'compression': 'gzip'})
+
+    with raises(NotImplementedError):
+        config_parquet(config_raw | {'parquet_compression': 'dummy'})
+
+    with raises(NotImplementedError):
+        config_s3(config_raw | {'output_format': 'dummy'})
+
+
+def test_save_parquet(patch_datetime, patch_sys_stdin, config_raw):
+    '''TEST : the records are appended to the parquet files by row groups'''
+
+    uploaded = []
+
+    async def upload(config, file_metadata):
+        uploaded.append(file_metadata['relative_path'])
+
+    async def save_s3(stream, stream_data, config, record=None):
+        await save_parquet(stream, stream_data, config, record=record, post_processing=upload_thread)
+
+    loader = Loader(config_compression(config_file(config_raw | {'parquet_row_group_size': 2, 'parquet_compression': 'zstd'})),
+                    set_schemas=set_schema, writeline=save_s3, upload=upload)
+    loader.run(sys.stdin)
+
+    assert sorted(uploaded) == sorted(
+        f'tap_dummy_test-test_table_{name}-2022-04-29 06:39:38.321056+00:00.parquet' for name in ('one', 'two', 'three'))
+
+    file_metadata = loader.stream_data['tap_dummy_test-test_table_three']['path'][1]
+    parquet_file = parquet.ParquetFile(file_metadata['absolute_path'])
+    assert parquet_file.metadata.num_row_groups == 2
+    assert parquet_file.metadata.row_group(0).column(0).compression == 'ZSTD'
+    assert parquet_file.read().to_pylist() == [
+        {'c_pk': 1, 'c_varchar': '1', 'c_int': 1, 'c_time': '04:00:00'},
+        {'c_pk': 2, 'c_varchar': '2', 'c_int': 2, 'c_time': '07:15:00'},
+        {'c_pk': 3, 'c_varchar': '3', 'c_int': 3, 'c_time': '23:00:03'}]
+
+    table = parquet.read_table(loader.stream_data['tap_dummy_test-test_table_two']['path'][1]['absolute_path'])
+    assert table.schema.field('c_date').type == pyarrow.timestamp('us', tz='UTC')
+    assert table.column('c_date').to_pylist() == [
+        datetime(2019, 2, 1, 15, 12, 45, tzinfo=timezone.utc), datetime(2019, 2, 10, 2, 0, tzinfo=timezone.utc)]
+
+
+async def test_save_parquet_parts(config, schema):
+    '''TEST : a new file part is started over the `file_size`, and on a schema change'''
+
+    config = config_parquet(config | {'path_template': '{stream}-{part}.json', 'file_size': 1, 'parquet_row_group_size': 1})
+    stream_data = {}
+    closed = []
+
+    async def post_processing(config, file_metadata):
+        closed.append(file_metadata['relative_path'])
+
+    set_schema('stream', config, stream_data, {'schema': schema})
+    await save_parquet('stream', stream_data, config, {'c_pk': 1}, post_processing=post_processing)
+    await save_parquet('stream', stream_data, config, {'c_pk': 2}, post_processing=post_processing)
+    assert closed == ['stream-1.parquet']
+
+    # NOTE: no file size limit, the schema change alone closes the file
+    config.pop('file_size')
+    set_schema('stream', config, stream_data, {'schema': {'properties': {'c_pk': {'type': 'string'}}}})
+    await save_parquet('stream', stream_data, config, {'c_pk': '3'}, post_processing=post_processing)
+    await save_parquet('stream', stream_data, config, post_processing=post_processing)
+    # NOTE: the closed file is not processed twice
+    await save_parquet('stream', stream_data, config, post_processing=post_processing)
+    assert closed == ['stream-1.parquet', 'stream-2.parquet', 'stream-3.parquet']
+
+    assert parquet.read_table(stream_data['stream']['path'][2]['absolute_path']).column('c_pk').to_pylist() == [2]
+    assert parquet.read_table(stream_data['stream']['path'][3]['absolute_path']).column('c_pk').to_pylist() == ['3']
+
+
+async def test_save_parquet_rotation(config, schema):
+    '''TEST : the parquet file rotated with `max_records` is closed, the next record opening the next part'''
+
+    config = config_parquet(config | {'path_template': '{stream}-{part}.json', 'max_records': 2})
+    closed = []
+
+    async def upload(config, file_metadata):
+        closed.append(file_metadata['relative_path'])
+
+    async def save_s3(stream, stream_data, config, record=None):
+        await save_parquet(stream, stream_data, config, record=record, post_processing=upload_thread)
+
+    loader = Loader(config, set_schemas=set_schema, writeline=save_s3, upload=upload, rotate=partial(close_file, post_processing=upload_thread))
+    await loader.sync([json.dumps({'type': 'SCHEMA', 'stream': 'stream', 'key_properties': [], 'schema': schema})] + [
+        json.dumps({'type': 'RECORD', 'stream': 'stream', 'record': {'c_pk': index}}) for index in range(1, 4)])
+
+    assert closed == ['stream-1.parquet', 'stream-2.parquet']
+    assert parquet.read_table(loader.stream_data['stream']['path'][1]['absolute_path']).column('c_pk').to_pylist() == [1, 2]
+    assert parquet.read_table(loader.stream_data['stream']['path'][2]['absolute_path']).column('c_pk').to_pylist() == [3]
+
+
+async def test_save_parquet_deduplicate(config, schema):
+    '''TEST : the duplicate records of a row group are removed'''
+
+    config = config_parquet(config | {'deduplicate_records': True})
+    loader = Loader(config, set_schemas=set_schema, writeline=save_parquet)
+    await loader.sync([json.dumps({'type': 'SCHEMA', 'stream': 'stream', 'key_properties': ['c_pk'], 'schema': schema})] + [
+        json.dumps({'type': 'RECORD', 'stream': 'stream', 'record': {'c_pk': index % 2, 'c_varchar': f'{index}'}}) for index in range(4)])
+
+    table = parquet.read_table(loader.stream_data['stream']['path'][1]['absolute_path'])
+    assert table.column('c_pk').to_pylist() == [0, 1]
+    assert table.column('c_varchar').to_pylist() == ['2', '3']
+
+
+@mock_s3
+def test_main(capsys, patch_datetime, patch_sys_stdin, patch_argument_parser, config_raw, state):
+    '''TEST : the parquet files are uploaded'''
+
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=config_raw['s3_bucket'])
+
+    main(lines=sys.stdin)
+
+    assert capsys.readouterr().out == json.dumps(state) + '\n'
+    assert not any(Path(config_raw['work_dir']).glob('*.parquet'))
+
+    body = client.get_object(Bucket=config_raw['s3_bucket'], Key='tap_dummy_test-test_table_one-2022-04-29 06:39:38.321056+00:00.parquet')['Body'].read()
+    assert parquet.read_table(BytesIO(body)).to_pylist() == [{'c_pk': 1, 'c_varchar': '1', 'c_int': 1}]
@@ -0,0 +1,98 @@
+'''Tests for the target_s3_json.partition module'''
+# Standard library imports
+import json
+from functools import partial
+from io import StringIO
+
+# Third party imports
+from pytest import mark
+
+# Package imports
+from target.file import config_file, save_json
+from target_s3_json.partition import PartitionWriters, partition_fields, partition_template, partition_value, HIVE_DEFAULT_PARTITION
+from target_s3_json.s3 import upload_thread
+from target_s3_json.serializer import write
+from target_s3_json.stream import Loader
+
+
+def test_partition_fields():
+    '''TEST : the record fields of the path template'''
+
+    assert partition_fields('{stream}/{date_time}_{part}.json') == []
+    assert partition_fields('{stream}/dt={record.event_date}/region={record.address.region!s:.2}/{part}.json') == ['event_date', 'address.region']
+
+
+@mark.parametrize('value,conversion,format_spec,expected', [
+    ('2024-01-31', None, None, '2024-01-31'),
+    (7, None, '0>3', '007'),
+    ('eu-west', '!s', '.2', 'eu'),
+    ('a/b:c=d%', None, None, 'a%2Fb%3Ac%3Dd%25'),
+    ('{x}', None, None, '%7Bx}'),
+    (None, None, None, HIVE_DEFAULT_PARTITION),
+    ('', None, None, HIVE_DEFAULT_PARTITION),
+])
+def test_partition_value(value, conversion, format_spec, expected):
+    '''TEST : the record values escaped as the Hive partitions'''
+
+    assert partition_value(value, conversion, format_spec) == expected
+
+
+def test_partition_template():
+    '''TEST : the record fields replaced, the other fields kept for the file naming'''
+
+    template = '{stream}/dt={record.event_date}/region={record.address.region}/{date_time}_{part}.json'
+    assert partition_template(template, {'event_date': '2024-01-31', 'address': {'region': 'eu}'}}) \
+        == '{stream}/dt=2024-01-31/region=eu}}/{date_time}_{part}.json'
+    assert partition_template(template, {'address': 'eu'}) \
+        == f'{{stream}}/dt={HIVE_DEFAULT_PARTITION}/region={HIVE_DEFAULT_PARTITION}/{{date_time}}_{{part}}.json'
+
+
+async def test_partition_writers(config):
+    '''TEST : the least recently written partition is closed, and continued with the next part when written again'''
+
+    closed = []
+
+    async def writeline(stream, stream_data, config, record=None):
+        if record is None:
+            closed.append(stream_data[stream]['path'][stream_data[stream]['part']]['relative_path'])
+
+    partitions = PartitionWriters(config | {'path_template': '{stream}/k={record.k}/{part}.json'}, lambda *args: None, writeline, 2)
+    stream_data = {}
+    partitions.set_schema('s', config, stream_data, {'schema': {}})
+    assert stream_data == {'s': {}}
+
+    for key in ['a', 'b', 'a', 'c', 'b']:
+        partition_config, partition_data = await partitions.get('s', {'k': key})
+        assert partition_config['memory_buffer'] == config['memory_buffer'] / 2
+
+    assert closed == ['s/k=b/1.json', 's/k=a/1.json']
+    assert [partition_data['s']['path'][partition_data['s']['part']]['relative_path'] for _, partition_data in partitions.writers.values()] \
+        == ['s/k=c/1.json', 's/k=b/2.json']
+
+    await partitions.close('s')
+    assert closed == ['s/k=b/1.json', 's/k=a/1.json', 's/k=c/1.json', 's/k=b/2.json']
+    assert not partitions.writers
+
+
+async def test_loader_partitions(config_raw):
+    '''TEST : the records written to the files of their partition, with a bounded number of open files'''
+
+    uploaded = {}
+
+    async def upload(config, file_metadata):
+        with file_metadata['absolute_path'].open(encoding='utf-8') as input_file:
+            uploaded[file_metadata['relative_path']] = [json.loads(line)['id'] for line in input_file]
+
+    lines = [{'type': 'SCHEMA', 'stream': 'users', 'key_properties': ['id'], 'schema': {'type': 'object', 'properties': {'id': {'type': 'integer'}}}}]
+    lines += [{'type': 'RECORD', 'stream': 'users', 'record': {'id': index, 'region': region}} for index, region in enumerate('aabcab')]
+
+    config = config_file(config_raw | {'open_func': open, 'path_template': '{stream}/region={record.region}/{part}.json', 'max_open_partitions': 2})
+    await Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload) \
+        .sync(StringIO(''.join(json.dumps(line) + '\n' for line in lines)))
+
+    assert uploaded == {
+        'users/region=a/1.json': [0, 1],
+        'users/region=b/1.json': [2],
+        'users/region=c/1.json': [3],
+        'users/region=a/2.json': [4],
+        'users/region=b/2.json': [5]}
@@ -0,0 +1,120 @@
+'''Tests for the target_s3_json.pool module'''
+# Standard library imports
+import gzip
+import json
+from decimal import Decimal
+from functools import partial
+from io import StringIO
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+# Third party imports
+from pytest import raises
+
+# Package imports
+from target.file import config_file, save_json
+from target_s3_json.pool import CompressionPool, compress_batch, dump_batch, load_batch, share_batch
+from target_s3_json.s3 import upload_thread
+from target_s3_json.serializer import write
+from target_s3_json.stream import Loader
+
+
+def test_batch():
+    '''TEST : the JSON values marshaled, the other values pickled'''
+
+    assert dump_batch([{'a': [1, 'b']}])[:1] == b'm'
+    assert load_batch(dump_batch([{'a': [1, 'b']}])) == [{'a': [1, 'b']}]
+    assert dump_batch([{'a': Decimal('1.5')}])[:1] == b'p'
+    assert load_batch(dump_batch([{'a': Decimal('1.5')}])) == [{'a': Decimal('1.5')}]
+
+
+def test_compress_batch():
+    '''TEST : the batch is compressed from its shared memory block, the passthrough records as they are'''
+
+    for records, options in (([{'a': 1}, {'a': Decimal('1.5')}], {'compression': 'gzip'}),
+                             ([b'{"a": 1}\n', b'{"a": "1.5"}\n'], {'compression': 'gzip', 'passthrough': True})):
+        shared_memory, size = share_batch(records, options.get('passthrough', False))
+        try:
+            assert compress_batch(shared_memory.name, size, options)[0] == len(b'{"a": 1}\n{"a": "1.5"}\n')
+            assert gzip.decompress(compress_batch(shared_memory.name, size, options)[1]) == b'{"a": 1}\n{"a": "1.5"}\n'
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+
+async def test_compression_pool(temp_path):
+    '''TEST : the batches compressed by the worker processes, and appended to their file in order'''
+
+    files = [{'absolute_path': Path(temp_path) / 'pool' / f'{name}.json.gz'} for name in ('a', 'b')]
+    with CompressionPool({'compression': 'gzip', 'json_serializer': 'json'}, 2, batch_records=3) as pool:
+        for index in range(0, 20, 5):
+            for file_metadata in files:
+                await pool.write(file_metadata, [{'id': item, 'value': Decimal(item)} for item in range(index, index + 5)])
+        await pool.flush(files[0])
+        assert files[0]['absolute_path'] not in pool.pending
+        await pool.flush()
+        assert not pool.batches
+
+    for file_metadata in files:
+        with gzip.open(file_metadata['absolute_path'], 'rt', encoding='utf-8') as input_file:
+            assert [json.loads(line) for line in input_file] == [{'id': item, 'value': str(item)} for item in range(20)]
+        assert file_metadata['size'] == sum(len(json.dumps({'id': item, 'value': str(item)})) + 1 for item in range(20))
+
+    with CompressionPool({'compression': 'dummy'}, 1) as pool, raises(NotImplementedError):
+        await pool.write(files[0], [{'id': 1}])
+        await pool.flush()
+
+    # NOTE: the batches still in flight are cancelled, and their shared memory blocks released
+    with CompressionPool({'compression': 'gzip'}, 1) as pool:
+        await pool.write(files[0], [{'id': 1}])
+        shared_memory = pool.batches[0][2]
+    assert not pool.batches
+    with raises(FileNotFoundError):
+        SharedMemory(shared_memory.name)
+
+
+async def test_compression_pool_in_memory():
+    '''TEST : the passthrough batches are appended to the file buffer, with `upload_from_memory`'''
+
+    file_metadata = {'absolute_path': Path('memory.json.gz')}
+    with CompressionPool({'compression': 'gzip', 'passthrough': True, 'upload_from_memory': True}, 1) as pool:
+        await pool.write(file_metadata, [b'{"id": 1}\n', b'{"id": 2}\n'])
+        await pool.flush()
+
+    assert gzip.decompress(file_metadata['buffer']) == b'{"id": 1}\n{"id": 2}\n'
+    assert file_metadata['size'] == len(b'{"id": 1}\n{"id": 2}\n')
+    assert not file_metadata['absolute_path'].exists()
+
+
+async def test_compression_pool_uncompressed(temp_path):
+    '''TEST : the passthrough batches read from shared memory are appended as they are, without compression'''
+
+    file_metadata = {'absolute_path': Path(temp_path) / 'pool' / 'none.json'}
+    with CompressionPool({'compression': 'none', 'passthrough': True}, 2, batch_records=1) as pool:
+        await pool.write(file_metadata, [b'{"id": 1}\n', b'{"id": 2}\n', b'{"id": 3}\n'])
+        await pool.flush()
+
+    assert file_metadata['absolute_path'].read_bytes() == b'{"id": 1}\n{"id": 2}\n{"id": 3}\n'
+    assert file_metadata['size'] == len(b'{"id": 1}\n{"id": 2}\n{"id": 3}\n')
+
+
+async def test_loader_compression_pool(config_raw):
+    '''TEST : the files complete once uploaded'''
+
+    uploaded = {}
+
+    async def upload(config, file_metadata):
+        with gzip.open(file_metadata['absolute_path'], 'rt', encoding='utf-8') as input_file:
+            uploaded[file_metadata['relative_path']] = [json.loads(line)['id'] for line in input_file]
+
+    lines = []
+    for stream in ('a', 'b'):
+        lines.append({'type': 'SCHEMA', 'stream': stream, 'key_properties': ['id'], 'schema': {'type': 'object', 'properties': {'id': {'type': 'integer'}}}})
+        lines += [{'type': 'RECORD', 'stream': stream, 'record': {'id': index}} for index in range(100)]
+
+    config = config_file(config_raw | {'compression': 'gzip', 'path_template': '{stream}.json.gz', 'open_func': gzip.open,
+                                       'compression_processes': 2, 'compression_batch_records': 30})
+    await Loader(config, writeline=partial(save_json, save=write, post_processing=upload_thread), upload=upload) \
+        .sync(StringIO(''.join(json.dumps(line) + '\n' for line in lines)))
+
+    assert uploaded == {'a.json.gz': list(range(100)), 'b.json.gz': list(range(100))}
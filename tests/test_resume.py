@@ -0,0 +1,115 @@
+'''Tests for the target_s3_json.resume module'''
+# Standard library imports
+from pathlib import Path
+from time import time
+
+# Package imports
+from target_s3_json.resume import UploadManifest, get_manifest, manifest_path, pending_uploads, resumable, uploaded_parts, MANIFEST_DIR
+
+
+def test_upload_manifest(temp_path):
+    '''TEST : the manifest is saved on each change'''
+
+    file_path = Path(temp_path.join('output', 'file.json'))
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_bytes(b'x' * 25)
+    config = {'s3_bucket': 'BUCKET', 'work_path': Path(temp_path.join('output'))}
+    file_metadata = {'absolute_path': file_path, 'relative_path': 'dummy/file.json'}
+
+    manifest = get_manifest(config, file_metadata, 10)
+    assert manifest.path == manifest_path(config, 'dummy/file.json')
+    assert manifest.path.parent.name == MANIFEST_DIR
+    assert manifest.upload_id is None
+    assert manifest.data == {'bucket': 'BUCKET', 'key': 'dummy/file.json', 'path': str(file_path), 'size': 25, 'part_size': 10, 'checksum_algorithm': 'none'}
+    assert not manifest.path.exists()
+
+    manifest.start('UPLOAD-ID')
+    manifest.add_part(2, '"etag-2"', 'Y2hlY2sy')
+    manifest.add_part(1, '"etag-1"', 'Y2hlY2sx')
+
+    manifest = get_manifest(config, file_metadata, 20)
+    assert manifest.upload_id == 'UPLOAD-ID'
+    assert manifest.part_size == 10
+    assert manifest.parts == {1: '"etag-1"', 2: '"etag-2"'}
+    assert manifest.checksums == {1: 'Y2hlY2sx', 2: 'Y2hlY2sy'}
+    assert 0 <= manifest.age < 60
+    assert manifest.file_metadata() == file_metadata
+
+    manifest.set_parts({1: {'ETag': '"etag-1"'}})
+    assert UploadManifest.load(manifest.path).parts == {1: '"etag-1"'}
+    assert UploadManifest.load(manifest.path).checksums == {1: 'Y2hlY2sx'}
+
+    # NOTE: the checksums listed by S3 are kept, those of the parts not saved in the manifest included
+    manifest.set_parts({1: {'ETag': '"etag-1"', 'ChecksumSHA256': 'bGlzdDE='}, 3: {'ETag': '"etag-3"', 'ChecksumSHA256': 'bGlzdDM='}})
+    assert UploadManifest.load(manifest.path).parts == {1: '"etag-1"', 3: '"etag-3"'}
+    assert UploadManifest.load(manifest.path).checksums == {1: 'bGlzdDE=', 3: 'bGlzdDM='}
+
+    manifest.remove()
+    manifest.remove()
+    assert get_manifest(config, file_metadata, 20).upload_id is None
+    assert get_manifest(config | {'multipart_resume': False}, file_metadata, 20) is None
+
+
+def test_invalid_manifest(caplog, temp_path):
+    '''TEST : the invalid manifests are ignored'''
+
+    path = Path(temp_path.join('output', MANIFEST_DIR, 'invalid.json'))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('{"bucket": ', encoding='utf-8')
+
+    assert UploadManifest.load(path) is None
+    assert 'Invalid multipart upload manifest' in caplog.text
+    assert pending_uploads({'s3_bucket': 'BUCKET', 'work_path': path.parent.parent}) == []
+
+
+def test_resumable(temp_path):
+    '''TEST : the uploads are resumed, aborted or left as is'''
+
+    file_path = Path(temp_path.join('output', 'file.json'))
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_path.write_bytes(b'x' * 25)
+    manifest = UploadManifest(Path(temp_path.join('manifest.json')), {
+        'path': str(file_path), 'size': 25, 'part_size': 10, 'upload_id': 'UPLOAD-ID', 'initiated': time() - 60})
+
+    assert resumable({}, manifest) is True
+    assert resumable({'multipart_abort_age': 30}, manifest) is False
+    # NOTE: the parts checksums are required by the upload completion with the checksum algorithm of its creation
+    assert resumable({'checksum_algorithm': 'crc32c'}, manifest) is False
+
+    file_path.write_bytes(b'x' * 30)
+    assert resumable({}, manifest) is False
+
+    file_path.unlink()
+    assert resumable({}, manifest) is None
+    assert resumable({'multipart_abort_age': 30}, manifest) is False
+
+
+def test_uploaded_parts():
+    '''TEST : only the parts with the expected size are kept'''
+
+    manifest = UploadManifest(Path('manifest.json'), {'size': 25, 'part_size': 10})
+    assert uploaded_parts(manifest, [
+        {'PartNumber': 1, 'ETag': '"etag-1"', 'Size': 10},
+        {'PartNumber': 2, 'ETag': '"etag-2"', 'Size': 4},
+        {'PartNumber': 3, 'ETag': '"etag-3"', 'Size': 5, 'ChecksumCRC32': 'Y3JjMw=='}]) == {
+            1: {'PartNumber': 1, 'ETag': '"etag-1"', 'Size': 10},
+            3: {'PartNumber': 3, 'ETag': '"etag-3"', 'Size': 5, 'ChecksumCRC32': 'Y3JjMw=='}}
+
+
+def test_pending_uploads(caplog, temp_path):
+    '''TEST : the started uploads of the bucket are pending'''
+
+    config = {'s3_bucket': 'BUCKET', 'work_path': Path(temp_path.join('output'))}
+    assert pending_uploads(config) == []
+
+    for bucket, key, upload_id in (
+            ('BUCKET', 'dummy/started.json', 'UPLOAD-ID'), ('BUCKET', 'dummy/new.json', None), ('OTHER', 'dummy/other.json', 'OTHER-ID')):
+        manifest = UploadManifest.create(config | {'s3_bucket': bucket}, {'absolute_path': Path(temp_path.join(key)), 'relative_path': key}, 10)
+        if upload_id:
+            manifest.start(upload_id)
+        else:
+            manifest.save()
+
+    assert pending_uploads(config) == [{'absolute_path': Path(temp_path.join('dummy/started.json')), 'relative_path': 'dummy/started.json'}]
+    assert 'Multipart upload UPLOAD-ID of' in caplog.text
+    assert pending_uploads(config | {'local': True}) == []
@@ -0,0 +1,143 @@
+'''Tests for the target_s3_json.retry module'''
+# Standard library imports
+from asyncio import create_task, sleep
+
+# Third party imports
+from pytest import mark, raises
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+# Package imports
+from target_s3_json import retry
+from target_s3_json.retry import AdaptiveConcurrency, Retry, get_concurrency, is_retryable, is_throttling
+
+
+def client_error(code, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'UploadPart')
+
+
+@mark.parametrize('error,throttling,retryable', [
+    (client_error('SlowDown', 503), True, True),
+    (client_error('ServiceUnavailable', 503), True, True),
+    (client_error('ThrottlingException'), True, True),
+    (client_error('InternalError', 500), False, True),
+    (client_error('RequestTimeout'), False, True),
+    (client_error('AccessDenied', 403), False, False),
+    (client_error('NoSuchBucket', 404), False, False),
+    (EndpointConnectionError(endpoint_url='http://localhost'), False, True),
+    (ValueError('Broken stream'), False, False)])
+def test_errors(error, throttling, retryable):
+    '''TEST : the throttling and transient errors are recognized'''
+
+    assert is_throttling(error) is throttling
+    assert is_retryable(error) is retryable
+
+
+def test_adaptive_concurrency(caplog):
+    '''TEST : the limit is halved when throttled, then raised by one per window of successful requests'''
+
+    concurrency = AdaptiveConcurrency(8, 's3://bucket/prefix')
+    for _ in range(8):
+        assert concurrency.try_acquire()
+    assert not concurrency.try_acquire()
+
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 4
+    assert 'S3 throttling on s3://bucket/prefix, concurrency lowered to 4' in caplog.text
+    concurrency.release(succeeded=False)
+    assert concurrency.limit == 4
+    assert not concurrency.try_acquire()
+
+    for _ in range(6):
+        concurrency.release()
+    assert concurrency.inflight == 0
+    assert 5 <= concurrency.limit < 6
+
+    for _ in range(100):
+        concurrency.acquire()
+        concurrency.release()
+    assert concurrency.limit == 8
+
+    concurrency.limit = 1.5
+    for _ in range(4):
+        concurrency.release(throttled=True)
+    assert concurrency.limit == 1
+
+    assert get_concurrency('s3://bucket/prefix', 8) is get_concurrency('s3://bucket/prefix', 8)
+    assert get_concurrency('s3://bucket/prefix', 8) is not get_concurrency('s3://bucket/other', 8)
+
+
+def test_get_concurrency_bounded(monkeypatch):
+    '''TEST : only the limits of the most recently used prefixes are kept'''
+
+    monkeypatch.setattr('target_s3_json.retry.MAX_LIMITS', 2)
+    concurrency = get_concurrency('s3://bucket/dt=1', 8)
+    get_concurrency('s3://bucket/dt=2', 8)
+    assert get_concurrency('s3://bucket/dt=1', 8) is concurrency
+    get_concurrency('s3://bucket/dt=3', 8)
+
+    assert len(retry._limits) == 2
+    assert get_concurrency('s3://bucket/dt=1', 8) is concurrency
+    assert ('s3://bucket/dt=2', 8) not in retry._limits
+
+
+def test_retry(caplog):
+    '''TEST : the retryable errors are retried with a jittered delay, the throttling ones lower the concurrency'''
+
+    retry = Retry(max_attempts=3, base_delay=0.001, concurrency=AdaptiveConcurrency(4), on_retry=(errors := []).append)
+    assert 0 <= retry.delay(10) <= 20
+    assert 0 <= retry.delay(1) <= 0.002
+
+    responses = [client_error('SlowDown', 503), client_error('InternalError', 500), {'ETag': '"etag"'}]
+
+    def upload_part(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert retry.call(upload_part, PartNumber=1) == {'ETag': '"etag"'}
+    assert [error.response['Error']['Code'] for error in errors] == ['SlowDown', 'InternalError']
+    assert retry.concurrency.limit == 2.5
+    assert retry.concurrency.inflight == 0
+    assert 'upload_part request failed with An error occurred (SlowDown)' in caplog.text
+
+    # NOTE: the other errors are raised at once, and the retryable ones after `max_attempts` attempts
+    responses = [client_error('AccessDenied', 403)]
+    with raises(ClientError, match='AccessDenied'):
+        retry.call(upload_part)
+
+    responses = [client_error('InternalError', 500)] * 3
+    with raises(ClientError, match='InternalError'):
+        retry.call(upload_part)
+    assert responses == []
+    assert retry.concurrency.inflight == 0
+
+    assert Retry().call(dict, PartNumber=1) == {'PartNumber': 1}
+
+
+async def test_retry_async():
+    '''TEST : the coroutines are retried the same way'''
+
+    retry = Retry(base_delay=0.001, concurrency=AdaptiveConcurrency(1))
+    responses = [client_error('SlowDown', 503), {'ETag': '"etag"'}]
+
+    async def upload_part(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    # NOTE: the request waits for a free slot
+    retry.concurrency.acquire()
+    task = create_task(retry.call_async(upload_part, PartNumber=1))
+    await sleep(0.1)
+    assert not task.done()
+    retry.concurrency.release()
+
+    assert await task == {'ETag': '"etag"'}
+    assert retry.concurrency.inflight == 0
+
+    responses = [ValueError('Broken stream')]
+    with raises(ValueError):
+        await retry.call_async(upload_part)
+    assert retry.concurrency.inflight == 0
@@ -1,14 +1,18 @@
 '''Tests for the target_s3_json.s3 module'''
 # Standard library imports
 import sys
-from os import environ
+import asyncio
+from os import environ, urandom
 from copy import deepcopy
+from hashlib import sha256
 from re import match
 import lzma
 from pathlib import Path
 import datetime
 import boto3
 from botocore.client import BaseClient
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import ClientError
 # from botocore.stub import Stubber
 # from botocore.exceptions import ClientError
 # from aiobotocore.session import get_session
@@ -21,11 +25,17 @@ import gzip
 # Third party imports
 from pytest import fixture, raises, mark
 from moto import mock_s3, mock_sts
+import zstandard
 
 # Package imports
 # from target.file import save_json
+from target_s3_json.checksum import CHECKSUMS, composite_checksum, encode
+from target_s3_json.metrics import Metrics
+from target_s3_json.multipart import MIN_PART_SIZE
+from target_s3_json.resume import UploadManifest, manifest_path
 from target_s3_json.s3 import (
-    _log_backoff_attempt, config_compression, create_session, get_encryption_args, put_object, upload_file, config_s3, main
+    _log_backoff_attempt, config_compression, create_session, get_client, get_encryption_args, get_retry, pool_size, put_object, upload, upload_file,
+    config_s3, main
 )
 
 # from .conftest import clear_dir
@@ -190,21 +200,33 @@ def test_log_backoff_attempt(caplog):
 def test_config_compression(config):
     '''TEST : simple config_compression call'''
 
-    assert f"{config.get('compression')}".lower() in {'', 'none', 'gzip', 'lzma'}
+    assert f"{config.get('compression')}".lower() in {'', 'none', 'gzip', 'lzma', 'zstd'}
 
     with raises(Exception):
         config_compression(config | {'compression': 'dummy'})
 
 
-@mark.parametrize("compression,extention,open_func", [('none', '', open), ('gzip', '.gz', gzip.compress), ('lzma', '.xz', lzma.compress)])
-def test_config_compression_open_func(config, compression, extention, open_func):
+@mark.parametrize("compression,extention,decompress", [
+    ('none', '', bytes), ('gzip', '.gz', gzip.decompress), ('lzma', '.xz', lzma.decompress),
+    ('zstd', '.zst', lambda data: zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True).read())])
+def test_config_compression_open_func(config, temp_path, compression, extention, decompress):
     '''TEST : simple config_compression call'''
 
-    assert config_compression(config | {'compression': compression}) == config | {
+    config_codec = config_compression(config | {'compression': compression})
+    assert config_codec == config | {
         'compression': compression,
         'path_template': config['path_template'] + extention,
-        'open_func': open_func
+        'open_func': config_codec['open_func']
     }
+    assert config_codec['open_func'] is open if compression == 'none' else config_codec['open_func'].__name__ == f'{compression}_open'
+
+    # NOTE: each `open_func` call appends a new compressed member or frame
+    temp_file: Path = Path(temp_path.join(f'temp_file.json{extention}'))
+    for _ in range(2):
+        with config_codec['open_func'](temp_file, 'at', encoding='utf-8') as output_file:
+            output_file.write('{"c_pk": 1, "c_varchar": "é"}\n')
+
+    assert decompress(temp_file.read_bytes()) == '{"c_pk": 1, "c_varchar": "é"}\n'.encode('utf-8') * 2
 
 
 @mock_sts
@@ -212,9 +234,39 @@ def test_config_compression_open_func(config, compression, extention, open_func)
 def test_create_client_with_assumed_role(caplog, config_assume_role: dict):
     '''Assert client is created with assumed role when role_arn is specified'''
 
-    create_session(config_assume_role)
+    session = create_session(config_assume_role)
     assert caplog.text.endswith('Creating s3 session with role TestAssumeRole\n')
 
+    # NOTE: the role is assumed again once the credentials expire
+    credentials = session.get_credentials()
+    assert isinstance(credentials, RefreshableCredentials)
+    access_key = credentials.get_frozen_credentials().access_key
+    assert credentials.get_frozen_credentials().access_key == access_key
+
+    credentials._expiry_time = datetime.datetime.now(datetime.timezone.utc)
+    assert credentials.get_frozen_credentials().access_key != access_key
+    assert not credentials.refresh_needed()
+
+
+def test_pool_size():
+    '''TEST : the connection pool is sized to the uploads concurrency'''
+
+    assert pool_size({}) == 32
+    assert pool_size({'max_inflight_files': 1, 'part_concurrency': 1}) == 10
+    assert pool_size({'max_inflight_files': 16, 'part_concurrency': 8}) == 128
+    assert pool_size({'max_inflight_files': 16, 'max_pool_connections': 20}) == 20
+
+
+@mock_s3
+def test_get_client(config):
+    '''TEST : the clients are cached by credentials, endpoint and pool size'''
+
+    client: BaseClient = get_client(config)
+    assert client.meta.config.max_pool_connections == 32
+    assert get_client(config | {'s3_bucket': 'other-bucket'}) is client
+    assert get_client(config | {'aws_endpoint_url': 'http://localhost:5000'}) is not client
+    assert get_client(config | {'max_inflight_files': 16}).meta.config.max_pool_connections == 64
+
 
 @mock_s3
 def test_create_session(aws_credentials, config):
@@ -298,6 +350,20 @@ def test_get_encryption_args(config):
         encryption_desc, encryption_args = get_encryption_args(config | {'encryption_type': 'dummy'})
 
 
+def test_get_retry(config):
+    '''TEST : the retries are counted by stream, and the concurrency limit is shared by S3 prefix'''
+
+    metrics = Metrics({})
+    retry = get_retry(config | {'metrics': metrics, 'retry_max_attempts': 2}, {'relative_path': 'dummy/messages.json', 'stream': 'my_stream'})
+    assert retry.max_attempts == 2
+    assert retry.concurrency.name == f"s3://{config['s3_bucket']}/dummy"
+    assert get_retry(config, {'relative_path': 'dummy/other.json'}).concurrency is retry.concurrency
+
+    retry.on_retry(ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate.'}}, 'UploadPart'))
+    retry.on_retry(ClientError({'Error': {'Code': 'InternalError', 'Message': 'We encountered an internal error.'}}, 'UploadPart'))
+    assert metrics.counters == {('retries', 'my_stream'): 2, ('throttles', 'my_stream'): 1}
+
+
 @mock_s3
 def test_put_object(config):
     '''TEST : simple put_object call'''
@@ -317,14 +383,16 @@ def test_put_object(config):
         {"c_pk": 2, "c_varchar": "2", "c_int": 2, "c_time": "07:15:00"},
         {"c_pk": 3, "c_varchar": "3", "c_int": 3, "c_time": "23:00:03"}]
 
+    metrics = Metrics({})
     put_object(
-        config | {'client': client},
-        file_metadata,
+        config | {'client': client, 'metrics': metrics},
+        file_metadata | {'stream': 'my_stream'},
         stream_data)
 
     head = client.head_object(Bucket=config.get('s3_bucket'), Key=file_metadata['relative_path'])
     assert head['ResponseMetadata']['HTTPStatusCode'] == 200
     assert head['ContentLength'] == 102
+    assert metrics.counters == {('bytes_in', 'my_stream'): 192, ('bytes_out', 'my_stream'): 102}
     assert head['ResponseMetadata']['RetryAttempts'] == 0
 
     # NOTE: 'kms' encryption_type with default encryption_key
@@ -362,6 +430,27 @@ def test_put_object(config):
             file_metadata | {'relative_path': 'dummy/messages_dummy.json.gz'},
             stream_data)
 
+    # NOTE: 'dummy' compression
+    with raises(NotImplementedError):
+        put_object(
+            config | {'client': client, 'compression': 'dummy'},
+            file_metadata | {'relative_path': 'dummy/messages_dummy.json.gz'},
+            stream_data)
+
+    # NOTE: streamed records are uploaded by parts
+    file_metadata = {
+        'absolute_path': Path('tests', 'resources', 'messages.json'),
+        'relative_path': 'dummy/messages.json'}
+    put_object(
+        config | {'client': client, 'compression': 'none', 'part_size': 0},
+        file_metadata,
+        (record | {'c_varchar': urandom(1024).hex()} for _ in range(1000) for record in stream_data))
+
+    response = client.get_object(Bucket=config.get('s3_bucket'), Key=file_metadata['relative_path'])
+    assert response['ETag'].endswith('-2"')
+    assert len(response['Body'].read().splitlines()) == 3000
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket=config.get('s3_bucket'))
+
 
 @mock_s3
 def test_upload_file(config, temp_path):
@@ -430,6 +519,133 @@ def test_upload_file(config, temp_path):
     #         file_metadata | {'relative_path': 'dummy/messages_dummy.json'})
 
 
+@mock_s3
+def test_upload_from_memory(config, temp_path):
+    '''TEST : the file buffered in memory uploaded by parts, without the `work_dir`'''
+
+    client: BaseClient = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=config['s3_bucket'])
+
+    body: bytes = urandom(MIN_PART_SIZE * 2 + 1024)
+    file_metadata = {'absolute_path': Path(temp_path.join('memory.json')), 'relative_path': 'dummy/memory.json', 'buffer': bytearray(body)}
+    asyncio.run(upload(config | {'client': client, 'part_size': MIN_PART_SIZE, 'thread_pool': False}, file_metadata))
+
+    assert client.get_object(Bucket=config['s3_bucket'], Key='dummy/memory.json')['Body'].read() == body
+    assert 'buffer' not in file_metadata
+    assert file_metadata['compressed_size'] == len(body)
+    assert file_metadata['etag'].endswith('-3"')
+    assert not file_metadata['absolute_path'].exists()
+
+
+@mock_s3
+def test_upload_file_resume(caplog, config, temp_path, monkeypatch):
+    '''TEST : an interrupted upload is resumed by sending only the missing parts'''
+
+    client: BaseClient = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=config['s3_bucket'])
+    config = config | {'client': client, 'part_size': MIN_PART_SIZE, 'part_concurrency': 1, 'retry_base_delay': 0.001, 'checksum_algorithm': 'sha256'}
+
+    temp_file: Path = Path(temp_path.join('temp_file.json'))
+    body: bytes = urandom(MIN_PART_SIZE * 2 + 1024)
+    temp_file.write_bytes(body)
+    file_metadata = {'absolute_path': temp_file, 'relative_path': 'dummy/resumed.json'}
+
+    upload_part, sent = client.upload_part, []
+
+    def interrupted_upload_part(**kwargs):
+        if kwargs['PartNumber'] == 2:
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'UploadPart')
+        sent.append(kwargs['PartNumber'])
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(client, 'upload_part', interrupted_upload_part)
+    with raises(ClientError):
+        upload_file(config, file_metadata)
+
+    # NOTE: the upload is left in progress with its manifest
+    manifest = UploadManifest.load(manifest_path(config, 'dummy/resumed.json'))
+    assert manifest.parts.keys() == {1}
+    assert len(client.list_multipart_uploads(Bucket=config['s3_bucket'])['Uploads']) == 1
+    assert 'resumed by the next run' in caplog.text
+
+    monkeypatch.setattr(client, 'upload_part', lambda **kwargs: sent.append(kwargs['PartNumber']) or upload_part(**kwargs))
+    upload_file(config, file_metadata)
+
+    assert sent == [1, 2, 3]
+    assert 'resumed with 1 parts already uploaded' in caplog.text
+    assert client.get_object(Bucket=config['s3_bucket'], Key='dummy/resumed.json')['Body'].read() == body
+    # NOTE: the checksum of the part resumed is read from the manifest
+    assert file_metadata['checksum'] == composite_checksum(
+        CHECKSUMS['sha256'], [encode(sha256(body[index:index + MIN_PART_SIZE]).digest()) for index in range(0, len(body), MIN_PART_SIZE)])
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket=config['s3_bucket'])
+    assert not manifest.path.exists()
+    assert not temp_file.exists()
+
+    # NOTE: the uploads older than `multipart_abort_age` are aborted, then the file is uploaded again
+    temp_file.write_bytes(body)
+    upload_id = client.create_multipart_upload(Bucket=config['s3_bucket'], Key='dummy/resumed.json')['UploadId']
+    manifest = UploadManifest.create(config, file_metadata, MIN_PART_SIZE)
+    manifest.start(upload_id)
+    manifest.data['initiated'] -= 3600
+    manifest.save()
+
+    sent.clear()
+    upload_file(config | {'multipart_abort_age': 60}, file_metadata)
+    assert 'left by a previous run aborted' in caplog.text
+    assert sent == [1, 2, 3]
+    assert client.get_object(Bucket=config['s3_bucket'], Key='dummy/resumed.json')['Body'].read() == body
+    assert 'Uploads' not in client.list_multipart_uploads(Bucket=config['s3_bucket'])
+
+    # NOTE: an upload no longer found is started again, and the uploads of a missing file are left as is
+    manifest.start('UNKNOWN-ID')
+    temp_file.write_bytes(body)
+    upload_file(config, file_metadata)
+    assert 'UNKNOWN-ID of' in caplog.text and 'not found' in caplog.text
+    assert not manifest.path.exists()
+
+    manifest.start('UNKNOWN-ID')
+    upload_file(config, file_metadata)
+    assert manifest.path.exists()
+
+
+@mock_s3
+def test_upload_file_resume_unsaved_part(config, temp_path, monkeypatch):
+    '''TEST : a checksummed upload is resumed after a part was sent, but not saved in the manifest'''
+
+    client: BaseClient = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=config['s3_bucket'])
+    config = config | {'client': client, 'part_size': MIN_PART_SIZE, 'part_concurrency': 1, 'retry_base_delay': 0.001, 'checksum_algorithm': 'sha256'}
+
+    temp_file: Path = Path(temp_path.join('temp_file.json'))
+    body: bytes = urandom(MIN_PART_SIZE * 2 + 1024)
+    temp_file.write_bytes(body)
+    file_metadata = {'absolute_path': temp_file, 'relative_path': 'dummy/unsaved.json'}
+
+    upload_part = client.upload_part
+
+    def interrupted_upload_part(**kwargs):
+        if kwargs['PartNumber'] == 2:
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'UploadPart')
+        return upload_part(**kwargs)
+
+    monkeypatch.setattr(client, 'upload_part', interrupted_upload_part)
+    with raises(ClientError):
+        upload_file(config, file_metadata)
+
+    # NOTE: the process stopped once the part 1 was sent, before it was saved in the manifest
+    manifest = UploadManifest.load(manifest_path(config, 'dummy/unsaved.json'))
+    manifest.data |= {'parts': {}, 'checksums': {}}
+    manifest.save()
+
+    monkeypatch.setattr(client, 'upload_part', upload_part)
+    upload_file(config, file_metadata)
+
+    assert client.get_object(Bucket=config['s3_bucket'], Key='dummy/unsaved.json')['Body'].read() == body
+    assert file_metadata['checksum'] == composite_checksum(
+        CHECKSUMS['sha256'], [encode(sha256(body[index:index + MIN_PART_SIZE]).digest()) for index in range(0, len(body), MIN_PART_SIZE)])
+    assert not manifest.path.exists()
+
+
 def test_config_s3(config_raw):
 
     config = deepcopy(config_raw)
@@ -449,13 +665,32 @@ def test_config_s3(config_raw):
     config['naming_convention'] = '{stream}-{date}.json'
     assert config_s3(config) == config_raw | {'path_template': '{stream}-{date_time:%Y%m%d}.json'}
 
+    with raises(NotImplementedError):
+        config_s3(config | {'upload_backend': 'dummy'})
+
+    with raises(NotImplementedError):
+        config_s3(config | {'passthrough': True, 'add_metadata_columns': True})
+
+    with raises(NotImplementedError):
+        config_s3(config | {'passthrough': True, 'path_template': '{stream}/dt={record.event_date}/{part}.json'})
+
+    # NOTE: a partition written again once closed requires a new file name
+    assert config_s3(config | {'path_template': '{stream}/dt={record.event_date}/{date_time}_{part:0>3}.json'})
+    with raises(NotImplementedError):
+        config_s3(config | {'path_template': '{stream}/dt={record.event_date}/{date_time}.json'})
+
+    # NOTE: a rotated stream continues with a new file name
+    assert config_s3(config | {'path_template': '{stream}-{uuid}.json', 'max_object_age_seconds': 60})
+    with raises(NotImplementedError):
+        config_s3(config | {'path_template': '{stream}-{date_time}.json', 'max_records': 1000})
+
     config.pop('s3_bucket')
     with raises(Exception):
         config_s3(config)
 
 
 @mock_s3
-def test_main(capsys, patch_datetime, patch_sys_stdin, patch_argument_parser, config_raw, state, file_metadata):
+def test_main(capsys, caplog, patch_datetime, patch_sys_stdin, patch_argument_parser, config_raw, state, file_metadata):
     '''TEST : simple main call'''
 
     conn = boto3.resource('s3', region_name='us-east-1', endpoint_url='https://s3.amazonaws.com')
@@ -486,3 +721,8 @@ def test_main(capsys, patch_datetime, patch_sys_stdin, patch_argument_parser, co
     assert head['ResponseMetadata']['HTTPStatusCode'] == 200
     assert head['ContentLength'] == 192
     assert head['ResponseMetadata']['RetryAttempts'] == 0
+
+    # NOTE: the metrics emitted at the end of the run
+    for metric, value in (('records_in', 3), ('bytes_in', 192), ('bytes_out', 192)):
+        assert f'METRIC: {{"type": "counter", "metric": "{metric}", "value": {value}, "tags": {{"stream": "tap_dummy_test-test_table_three"}}}}' in caplog.text
+    assert 'METRIC: {"type": "gauge", "metric": "queue_depth", "value": 0, "tags": {}}' in caplog.text
@@ -0,0 +1,198 @@
+'''Load and recovery tests of the uploads, against the fault injecting S3 stand-in'''
+# Standard library imports
+import json
+from concurrent.futures import ThreadPoolExecutor
+from os import urandom
+from pathlib import Path
+from time import perf_counter
+from uuid import uuid4
+
+# Third party imports
+from pytest import fixture, mark, raises
+import boto3
+from botocore.exceptions import ClientError
+
+# Package imports
+from target_s3_json.aio import create_client, upload_file as aio_upload_file
+from target_s3_json.metrics import Metrics
+from target_s3_json.multipart import MIN_PART_SIZE
+from target_s3_json.retry import get_concurrency
+from target_s3_json.s3 import pool_size, put_object, upload_file
+from target_s3_json.serializer import json_dumps
+from tests.s3_faults import Faults, FaultyS3, s3_operation
+
+BANDWIDTH: int = 64 * 1024 ** 2
+
+
+@fixture
+def faulty_s3(s3_server):
+    '''S3 stand-in in front of the moto server, with no faults until set by the test'''
+
+    with FaultyS3(s3_server) as server:
+        yield server
+
+
+@fixture
+def config(temp_path, s3_server, faulty_s3):
+    '''Uploads to the S3 stand-in, retried without waiting long'''
+
+    config = {
+        's3_bucket': f'bucket-{uuid4()}',
+        'aws_access_key_id': 'ACCESS-KEY',
+        'aws_secret_access_key': 'SECRET',
+        'aws_endpoint_url': faulty_s3.url,
+        'compression': 'none',
+        'client': None,
+        'part_size': MIN_PART_SIZE,
+        'retry_max_attempts': 10,
+        'retry_base_delay': 0.01,
+        'retry_max_delay': 0.1,
+        'work_dir': f'{temp_path}/tests/output'}
+    config['metrics'] = Metrics(config)
+    Path(config['work_dir']).mkdir(parents=True, exist_ok=True)
+
+    return config
+
+
+@fixture
+def s3_client(config, s3_server):
+    '''boto3 client of the moto server, used to check the uploads'''
+
+    client = boto3.client('s3', region_name='us-east-1', endpoint_url=s3_server, aws_access_key_id='ACCESS-KEY', aws_secret_access_key='SECRET')
+    client.create_bucket(Bucket=config['s3_bucket'])
+
+    return client
+
+
+def write_files(config, sizes):
+    files = []
+    for index, size in enumerate(sizes):
+        path = Path(config['work_dir'], f'users-{index}.json')
+        path.write_bytes(urandom(size))
+        files.append({'absolute_path': path, 'relative_path': f'users/users-{index}.json', 'stream': 'users', 'data': path.read_bytes()})
+    return files
+
+
+@mark.parametrize('method, path, operation', [
+    ('PUT', '/bucket/key?partNumber=1&uploadId=id', 'UploadPart'),
+    ('PUT', '/bucket/folder/key', 'PutObject'),
+    ('PUT', '/bucket', 'CreateBucket'),
+    ('POST', '/bucket/key?uploads', 'CreateMultipartUpload'),
+    ('POST', '/bucket/key?uploadId=id', 'CompleteMultipartUpload'),
+    ('DELETE', '/bucket/key?uploadId=id', 'AbortMultipartUpload'),
+    ('GET', '/bucket/key?uploadId=id', 'ListParts'),
+    ('GET', '/bucket/key', 'GetObject'),
+    ('HEAD', '/bucket/key', 'HeadObject'),
+])
+def test_s3_operation(method, path, operation):
+    '''TEST : the operation of the path style requests'''
+
+    assert s3_operation(method, path) == operation
+
+
+def test_faulty_s3(config, s3_client, faulty_s3):
+    '''TEST : the faults injected are those of S3, a throttling error and a connection reset, and the bandwidth is capped'''
+
+    client = boto3.client('s3', region_name='us-east-1', endpoint_url=faulty_s3.url, aws_access_key_id='ACCESS-KEY', aws_secret_access_key='SECRET',
+                          config=boto3.session.Config(retries={'total_max_attempts': 1}))
+    faulty_s3.faults = Faults(script=['slow_down', 'drop'])
+
+    with raises(ClientError) as error:
+        client.put_object(Bucket=config['s3_bucket'], Key='key', Body=b'data')
+    assert error.value.response['Error']['Code'] == 'SlowDown'
+    assert error.value.response['ResponseMetadata']['HTTPStatusCode'] == 503
+
+    with raises(Exception, match='Connection was closed'):
+        client.put_object(Bucket=config['s3_bucket'], Key='key', Body=b'data')
+    assert 'Contents' not in s3_client.list_objects_v2(Bucket=config['s3_bucket'])
+
+    faulty_s3.faults = Faults(latency=0.1, bandwidth=4 * 1024 ** 2)
+    start = perf_counter()
+    client.put_object(Bucket=config['s3_bucket'], Key='key', Body=urandom(1024 ** 2))
+    assert perf_counter() - start >= 0.35
+    assert faulty_s3.stats['PutObject', 'ok'] == 1
+    assert faulty_s3.injected('slow_down') == faulty_s3.injected('drop') == 1
+
+
+def test_upload_file_faults(config, s3_client, faulty_s3):
+    '''TEST : the files uploaded at the same time are complete, every throttled or dropped request being retried alone'''
+
+    files = write_files(config, [MIN_PART_SIZE * 2 + 1024, MIN_PART_SIZE + 1024, MIN_PART_SIZE + 1024, 1024, 0])
+    faulty_s3.faults = Faults(latency=0.005, bandwidth=BANDWIDTH, slow_down_rate=0.2, drop_rate=0.1, seed=1)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda file_metadata: upload_file(config, file_metadata), files))
+    duration = perf_counter() - start
+
+    for file_metadata in files[:-1]:
+        assert s3_client.get_object(Bucket=config['s3_bucket'], Key=file_metadata['relative_path'])['Body'].read() == file_metadata['data']
+        assert not file_metadata['absolute_path'].exists()
+    assert not s3_client.list_multipart_uploads(Bucket=config['s3_bucket']).get('Uploads')
+
+    # NOTE: the throughput is bounded by the bandwidth, the failed parts being sent again
+    assert duration >= faulty_s3.stats['bytes', 'in'] / BANDWIDTH
+    assert faulty_s3.stats['bytes', 'in'] > sum(len(file_metadata['data']) for file_metadata in files)
+    assert faulty_s3.injected('slow_down') > 0 and faulty_s3.injected('drop') > 0
+    assert config['metrics'].counters[('retries', 'users')] == faulty_s3.injected('slow_down') + faulty_s3.injected('drop')
+    assert config['metrics'].counters[('throttles', 'users')] == faulty_s3.injected('slow_down')
+
+
+def test_put_object_faults(config, s3_client, faulty_s3):
+    '''TEST : the records streamed by parts are complete, every throttled or dropped part being retried alone'''
+
+    streams = {
+        f'stream_{index}': [{'id': record, 'value': urandom(48).hex()} for record in range(count)]
+        for index, count in enumerate((80000, 50000, 10))}
+    faulty_s3.faults = Faults(latency=0.005, bandwidth=BANDWIDTH, slow_down_rate=0.2, drop_rate=0.1, seed=2)
+
+    def put(stream):
+        put_object(config, {'absolute_path': Path(f'{stream}.json'), 'relative_path': f'{stream}/{stream}.json', 'stream': stream}, streams[stream])
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(put, streams))
+
+    for stream, records in streams.items():
+        body = s3_client.get_object(Bucket=config['s3_bucket'], Key=f'{stream}/{stream}.json')['Body'].read()
+        assert body == b''.join(map(json_dumps, records))
+        assert [json.loads(line)['id'] for line in body.splitlines()] == list(range(len(records)))
+
+    # NOTE: the 2 largest streams are sent by parts of `part_size` bytes
+    assert faulty_s3.stats['CompleteMultipartUpload', 'ok'] == 2
+    assert faulty_s3.stats['PutObject', 'ok'] == 1
+    assert faulty_s3.injected('slow_down') + faulty_s3.injected('drop') > 0
+    assert sum(value for (name, _), value in config['metrics'].counters.items() if name == 'retries') \
+        == faulty_s3.injected('slow_down') + faulty_s3.injected('drop')
+
+
+def test_retry_exhausted(config, s3_client, faulty_s3):
+    '''TEST : a part throttled on every attempt fails the upload, aborted, the prefix concurrency being lowered'''
+
+    files = write_files(config, [MIN_PART_SIZE + 1024])
+    faulty_s3.faults = Faults(slow_down_rate=1)
+
+    with raises(ClientError) as error:
+        upload_file(config | {'retry_max_attempts': 3}, files[0])
+
+    assert error.value.response['Error']['Code'] == 'SlowDown'
+    assert faulty_s3.stats['AbortMultipartUpload', 'ok'] == 1
+    assert not s3_client.list_multipart_uploads(Bucket=config['s3_bucket']).get('Uploads')
+    assert files[0]['absolute_path'].exists()
+    assert get_concurrency(f"s3://{config['s3_bucket']}/users", pool_size(config)).limit < pool_size(config)
+
+
+async def test_aio_upload_file_faults(config, s3_client, faulty_s3):
+    '''TEST : the aiobotocore parts are retried alone as well'''
+
+    files = write_files(config, [MIN_PART_SIZE * 2 + 1024, 1024])
+    faulty_s3.faults = Faults(bandwidth=BANDWIDTH, script=['slow_down', 'drop', None, 'drop'])
+
+    async with create_client(config) as client:
+        for file_metadata in files:
+            await aio_upload_file(config | {'client': client}, file_metadata)
+
+    for file_metadata in files:
+        assert s3_client.get_object(Bucket=config['s3_bucket'], Key=file_metadata['relative_path'])['Body'].read() == file_metadata['data']
+    # NOTE: aiohttp sends again by itself a request dropped on a reused keep-alive connection
+    assert 1 <= config['metrics'].counters[('retries', 'users')] <= 3
+    assert config['metrics'].counters[('throttles', 'users')] == 1
@@ -0,0 +1,175 @@
+'''Tests for the target_s3_json.scheduler module'''
+# Standard library imports
+from asyncio import Event, create_task, sleep
+from os import utime
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture, raises
+
+# Package imports
+from target_s3_json.scheduler import UploadScheduler
+
+
+@fixture
+def files(temp_path):
+    '''Files of 10 bytes, the first one being the most recent'''
+
+    paths = []
+    for index in range(5):
+        path = Path(temp_path.join(f'file_{index}.json'))
+        path.write_bytes(b'0123456789')
+        utime(path, (1000 - index, 1000 - index))
+        paths.append({'absolute_path': path, 'relative_path': path.name})
+
+    return paths
+
+
+class Uploads:
+    '''Upload coroutine function recording the uploads, held until released'''
+
+    def __init__(self):
+        self.started = []
+        self.completed = []
+        self.release = Event()
+
+    async def __call__(self, file_metadata):
+        self.started.append(file_metadata['relative_path'])
+        await self.release.wait()
+        if file_metadata['relative_path'] == 'error.json':
+            raise ValueError('Upload failure')
+        self.completed.append(file_metadata['relative_path'])
+
+
+async def test_scheduler_max_inflight_files(files):
+    '''TEST : the files are queued while the in flight files limit is reached, the submit blocks once the queue is full'''
+
+    uploads = Uploads()
+    scheduler = UploadScheduler(uploads, max_inflight_files=2)
+
+    await scheduler.submit(files[0])
+    await scheduler.submit(files[1])
+    assert scheduler.queue_depth == 2
+    assert scheduler.inflight_bytes == 20
+
+    await scheduler.submit(files[2])
+    await scheduler.submit(files[3])
+    assert scheduler.queue_depth == 4
+    assert scheduler.inflight_bytes == 20
+
+    waiting = create_task(scheduler.submit(files[4]))
+    await sleep(0)
+    assert not waiting.done()
+    assert uploads.started == ['file_0.json', 'file_1.json']
+
+    uploads.release.set()
+    await waiting
+    await scheduler.drain()
+
+    assert sorted(uploads.completed) == [f'file_{index}.json' for index in range(5)]
+    assert scheduler.queue_depth == 0
+
+
+async def test_scheduler_max_inflight_bytes(files):
+    '''TEST : the submit blocks while the in flight bytes limit is reached, larger files are uploaded alone'''
+
+    uploads = Uploads()
+    scheduler = UploadScheduler(uploads, max_inflight_files=10, max_inflight_bytes=15)
+
+    await scheduler.submit(files[0])
+    assert len(scheduler.inflight) == 1
+
+    uploads.release.set()
+    await scheduler.submit(files[1])
+    await scheduler.drain()
+    assert uploads.completed == ['file_0.json', 'file_1.json']
+
+    scheduler = UploadScheduler(uploads, max_inflight_bytes=5)
+    await scheduler.submit(files[2])
+    await scheduler.drain()
+    assert uploads.completed[-1] == 'file_2.json'
+
+
+async def test_scheduler_oldest_first(files):
+    '''TEST : the files queued are uploaded oldest first'''
+
+    uploads = Uploads()
+    scheduler = UploadScheduler(uploads, max_inflight_files=2)
+
+    for file_metadata in files[:4]:
+        await scheduler.submit(file_metadata)
+    assert len(scheduler.pending) == 2
+
+    uploads.release.set()
+    await scheduler.drain()
+
+    assert uploads.started == ['file_0.json', 'file_1.json', 'file_3.json', 'file_2.json']
+
+
+async def test_scheduler_submit_once(files, temp_path):
+    '''TEST : a file is uploaded once, missing files are scheduled as empty'''
+
+    uploads = Uploads()
+    uploads.release.set()
+    scheduler = UploadScheduler(uploads)
+
+    await scheduler.submit(files[0])
+    await scheduler.submit(files[0])
+    await scheduler.submit({'absolute_path': Path(temp_path.join('missing.json')), 'relative_path': 'missing.json'})
+    await scheduler.drain()
+
+    assert uploads.completed == ['file_0.json', 'missing.json']
+
+
+async def test_scheduler_errors(files, temp_path, caplog):
+    '''TEST : the upload errors are raised to the caller'''
+
+    uploads = Uploads()
+    scheduler = UploadScheduler(uploads, max_inflight_files=1)
+    errors = [{'absolute_path': Path(temp_path.join(f'error_{index}.json')), 'relative_path': 'error.json'} for index in range(2)]
+
+    await scheduler.submit(errors[0])
+    await scheduler.submit(errors[1])
+    uploads.release.set()
+    await sleep(0.01)
+
+    # NOTE: the error of the first upload is raised by the next submit, the one of the queued upload, completed meanwhile, logged
+    with raises(ValueError):
+        await scheduler.submit(files[0])
+    assert 'Upload failed' in caplog.text
+
+    await scheduler.drain()
+    assert uploads.completed == []
+
+    # NOTE: the errors of the uploads failed at the same time are raised first, the others logged
+    caplog.clear()
+    scheduler = UploadScheduler(uploads, max_inflight_files=2)
+    for error in errors:
+        await scheduler.submit(error)
+    with raises(ValueError):
+        await scheduler.drain()
+    assert 'Upload failed' in caplog.text
+
+
+async def test_scheduler_error_raised_once(files, temp_path, caplog):
+    '''TEST : a failed upload is raised once, by the next submit, and not again by the drain'''
+
+    uploads = Uploads()
+    uploads.release.set()
+    scheduler = UploadScheduler(uploads, max_inflight_files=1)
+    raised = []
+
+    try:
+        await scheduler.submit({'absolute_path': Path(temp_path.join('error.json')), 'relative_path': 'error.json'})
+        await sleep(0)
+        await scheduler.submit(files[0])
+    except ValueError as error:
+        raised.append(error)
+    finally:
+        try:
+            await scheduler.drain()
+        except ValueError as error:
+            raised.append(error)
+
+    assert len(raised) == 1
+    assert 'Upload failed' not in caplog.text
@@ -0,0 +1,120 @@
+'''Tests for the target_s3_json.serializer module'''
+# Standard library imports
+import sys
+import gzip
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture, mark, raises
+
+# Package imports
+from target_s3_json import serializer
+from target_s3_json.codec import open_func
+from target_s3_json.serializer import get_serializer, json_dumps, json_dumps_compact, write, write_buffer
+
+
+@fixture
+def records():
+    '''Records with non ASCII text, decimals and date times values'''
+
+    return [
+        {'c_pk': 1, 'c_varchar': 'é 中文 😀 "\\\n ', 'c_float': 1.5, 'c_bool': True, 'c_null': None},
+        {'c_decimal': Decimal('1.10'), 'c_decimals': [Decimal('-0.000001'), Decimal('1E+3')]},
+        {'c_date_time': datetime(2019, 2, 1, 15, 12, 45, 123456, tzinfo=timezone.utc), 'c_naive': datetime(2019, 2, 1, 15, 12, 45),
+         'c_date': date(2019, 2, 1), 'c_time': time(4, 0, 3)},
+        {'c_object': {'c_nested': [{'c_date': date(2019, 2, 1), 'c_varchar': 'ü'}]}}]
+
+
+@mark.parametrize('name', ['orjson', 'ORJSON'])
+def test_orjson_serializer(records, name):
+    '''TEST : orjson produces the compact standard library lines, without the whitespace of the default `json` serializer'''
+
+    dumps = get_serializer({'json_serializer': name})
+    assert dumps is not json_dumps_compact
+
+    for record in records:
+        assert dumps(record) == json_dumps_compact(record)
+        assert dumps(record) != json_dumps(record)
+
+
+@mark.parametrize('record, line', [
+    ({'c_int': 2 ** 64, 'c_nested': [-2 ** 63 - 1]}, b'{"c_int":18446744073709551616,"c_nested":[-9223372036854775809]}\n'),
+    ({'c_nan': float('nan'), 'c_null': None}, b'{"c_nan":NaN,"c_null":null}\n'),
+    ({'c_nested': {'c_inf': [float('-inf')]}}, b'{"c_nested":{"c_inf":[-Infinity]}}\n'),
+    ({'c_int': 2 ** 64 - 1, 'c_null': None}, b'{"c_int":18446744073709551615,"c_null":null}\n'),
+])
+def test_orjson_serializer_unsupported(record, line):
+    '''TEST : the records with integers over 64 bits or non finite floats are serialized by the standard library'''
+
+    assert get_serializer({'json_serializer': 'orjson'})(record) == line == json_dumps_compact(record)
+
+
+def test_json_serializer(records):
+    '''TEST : the default serializer produces the `target-core` JSON Lines format'''
+
+    assert get_serializer({}) is json_dumps
+    assert json_dumps(records[1]) == '{"c_decimal": "1.10", "c_decimals": ["-0.000001", "1E+3"]}\n'.encode('utf-8')
+    assert json_dumps(records[3]) == '{"c_object": {"c_nested": [{"c_date": "2019-02-01", "c_varchar": "ü"}]}}\n'.encode('utf-8')
+
+    with raises(NotImplementedError):
+        get_serializer({'json_serializer': 'dummy'})
+
+    # NOTE: the passthrough mode records are already serialized
+    assert get_serializer({'passthrough': True, 'json_serializer': 'orjson'})(b'{"c_pk": 1}\n') == b'{"c_pk": 1}\n'
+
+
+def test_orjson_serializer_fallback(monkeypatch, caplog, records):
+    '''TEST : the standard library is used if orjson is not installed'''
+
+    monkeypatch.setitem(sys.modules, 'orjson', None)
+    serializer._orjson_serializer.cache_clear()
+    try:
+        assert get_serializer({'json_serializer': 'orjson'}) is json_dumps_compact
+        assert 'requires the orjson package' in caplog.text
+    finally:
+        serializer._orjson_serializer.cache_clear()
+
+
+async def test_write(temp_path, records):
+    '''TEST : the records are written as bytes through the `open_func`'''
+
+    file_metadata = {'absolute_path': Path(temp_path.join('output', 'file.json.gz'))}
+    config = {'open_func': open_func({'compression': 'gzip'}), 'json_serializer': 'orjson'}
+
+    stream_data = records[:2]
+    await write(config, file_metadata, stream_data)
+    assert stream_data == []
+
+    await write(config, file_metadata, records[2:])
+    await write(config, file_metadata, [])
+
+    assert gzip.decompress(file_metadata['absolute_path'].read_bytes()) == b''.join(map(json_dumps_compact, records))
+
+
+async def test_write_in_memory(temp_path, records):
+    '''TEST : the records are compressed in the file buffer, until spilled to the file'''
+
+    file_metadata = {'absolute_path': Path(temp_path.join('output', 'memory.json.gz'))}
+    config = {'open_func': open_func({'compression': 'gzip'}), 'compression': 'gzip', 'upload_from_memory': True}
+    stream_data = {'stream': {'part': 1, 'path': {1: file_metadata}, 'file_data': records[:2]}}
+
+    await write(config, file_metadata, stream_data['stream']['file_data'])
+    assert stream_data['stream']['file_data'] == []
+    assert not file_metadata['absolute_path'].exists()
+    assert gzip.decompress(file_metadata['buffer']) == b''.join(map(json_dumps, records[:2]))
+    assert file_metadata['size'] == len(b''.join(map(json_dumps, records[:2])))
+
+    # NOTE: once spilled, the file is written to the `work_dir`
+    stream_data['stream']['file_data'] = records[2:3]
+    await write_buffer('stream', stream_data, config)
+    assert 'buffer' not in file_metadata
+    await write(config, file_metadata, records[3:])
+    assert gzip.decompress(file_metadata['absolute_path'].read_bytes()) == b''.join(map(json_dumps, records))
+
+    # NOTE: the local files are kept in the `work_dir`
+    file_metadata = {'absolute_path': Path(temp_path.join('output', 'local.json'))}
+    await write(config | {'local': True, 'open_func': open}, file_metadata, records[:1])
+    assert 'buffer' not in file_metadata
+    assert file_metadata['absolute_path'].exists()
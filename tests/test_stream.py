@@ -0,0 +1,191 @@
+'''Tests for the target_s3_json.stream module'''
+# Standard library imports
+import sys
+import json
+from io import BytesIO
+from pathlib import Path
+
+from json import JSONDecodeError
+from functools import partial
+
+# Third party imports
+from pytest import mark, raises
+
+# Package imports
+from target.file import config_file, save_json
+from target_s3_json.resume import UploadManifest
+from target_s3_json.stream import BlockReader, Loader, batch_lines, parse_envelope, parse_lines
+from target_s3_json.s3 import upload_thread
+from target_s3_json.serializer import write
+
+
+def test_loader(capsys, patch_datetime, patch_sys_stdin, config_raw, state, file_metadata):
+    '''TEST : without upload the files are saved in the work_dir'''
+
+    Loader(config_file(config_raw | {'open_func': open})).run(sys.stdin)
+
+    assert capsys.readouterr().out == json.dumps(state) + '\n'
+    assert file_metadata['tap_dummy_test-test_table_three']['path'][1]['absolute_path'].exists()
+
+
+def test_loader_upload(patch_datetime, patch_sys_stdin, config_raw, file_metadata):
+    '''TEST : the files are uploaded by the scheduler, and the upload errors raised'''
+
+    uploaded = []
+
+    async def upload(config, file_metadata):
+        assert config['scheduler'].queue_depth > 0
+        uploaded.append(file_metadata['relative_path'])
+
+    async def save_s3(stream, stream_data, config, record=None):
+        await save_json(stream, stream_data, config, record=record, post_processing=upload_thread)
+
+    # NOTE: the upload left in progress by a previous run is resumed first
+    config = config_file(config_raw | {'open_func': open})
+    UploadManifest.create(config, {'absolute_path': config['work_path'] / 'left.json', 'relative_path': 'dummy/left.json'}, 10).start('UPLOAD-ID')
+
+    Loader(config, writeline=save_s3, upload=upload).run(sys.stdin)
+
+    # NOTE: each file uploaded once
+    assert uploaded[0] == 'dummy/left.json'
+    assert sorted(uploaded[1:]) == sorted(item['path'][1]['relative_path'] for item in file_metadata.values())
+
+    async def failed_upload(config, file_metadata):
+        raise ValueError('Upload failure')
+
+    with raises(ValueError), Path('tests', 'resources', 'messages-with-three-streams.json').open(encoding='utf-8') as lines:
+        Loader(config_file(config_raw | {'open_func': open}), writeline=save_s3, upload=failed_upload).run(lines)
+
+
+def test_loader_upload_resumed_path(patch_datetime, patch_sys_stdin, config_raw, file_metadata):
+    '''TEST : the upload left in progress is completed before a file of this run is written to the same path, then uploaded too'''
+
+    uploaded = []
+
+    async def upload(config, file_metadata):
+        uploaded.append((file_metadata['relative_path'], file_metadata['absolute_path'].read_text(encoding='utf-8')))
+        file_metadata['absolute_path'].unlink()
+
+    async def save_s3(stream, stream_data, config, record=None):
+        await save_json(stream, stream_data, config, record=record, post_processing=upload_thread)
+
+    config = config_file(config_raw | {'open_func': open})
+    left = file_metadata['tap_dummy_test-test_table_three']['path'][1]
+    left['absolute_path'].parent.mkdir(parents=True, exist_ok=True)
+    left['absolute_path'].write_text('{"left": 1}\n', encoding='utf-8')
+    UploadManifest.create(config, left, 10).start('UPLOAD-ID')
+
+    Loader(config, writeline=save_s3, upload=upload).run(sys.stdin)
+
+    assert uploaded[0] == (left['relative_path'], '{"left": 1}\n')
+    assert sorted(path for path, _ in uploaded[1:]) == sorted(item['path'][1]['relative_path'] for item in file_metadata.values())
+    records = file_metadata['tap_dummy_test-test_table_three']['file_data']
+    assert dict(uploaded[1:])[left['relative_path']] == ''.join(json.dumps(record) + '\n' for record in records)
+
+
+@mark.parametrize('line,message,record', [
+    ('{"type": "RECORD", "stream": "s\\"1", "record": {"c_pk": 1, "c_varchar": "\\u00e9 {"}, "version": 1}\n',
+     {'type': 'RECORD', 'stream': 's"1', 'version': 1}, '{"c_pk": 1, "c_varchar": "\\u00e9 {"}'),
+    ('{"type":"RECORD","stream":"s","record":{"c_pk":1}}', {'type': 'RECORD', 'stream': 's'}, '{"c_pk":1}'),
+    ('{"type": "RECORD", "stream": "s", "record": {"c_pk": {"a": "}"}}, "time_extracted": "2022-01-01T00:00:00Z"}\n',
+     {'type': 'RECORD', 'stream': 's', 'time_extracted': '2022-01-01T00:00:00Z'}, '{"c_pk": {"a": "}"}}'),
+    ('{"type": "RECORD", "stream": "s", "record": {"c_pk": 1}, "time_extracted": "}", "version": 1}',
+     {'type': 'RECORD', 'stream': 's', 'time_extracted': '}', 'version': 1}, '{"c_pk": 1}'),
+    ('{"type": "RECORD", "stream": "s", "record": [1], "version": 1}', {'type': 'RECORD', 'stream': 's', 'version': 1}, '[1]'),
+    (' { "stream" : "s", "record" : { "c_pk" : [1, 2] } , "type" : "RECORD" } ', {'type': 'RECORD', 'stream': 's'}, '{ "c_pk" : [1, 2] }'),
+    ('{"type": "STATE", "value": {"record": 1}}', {'type': 'STATE', 'value': {'record': 1}}, None),
+    ('{}', {}, None)])
+def test_parse_envelope(line, message, record):
+    '''TEST : the record is returned as its original JSON text'''
+
+    assert parse_envelope(line) == (message, record)
+
+
+@mark.parametrize('line,message,record', [
+    ('{"type": "RECORD", "stream": "s", "record": {"x": "a"}, "version": 1, "extra": {"b": 1}}',
+     {'type': 'RECORD', 'stream': 's', 'version': 1, 'extra': {'b': 1}}, '{"x": "a"}'),
+    ('{"type": "RECORD", "stream": "s", "record": {"x": "}, {"}, "extra": {"b": "{}"}, "version": 1}',
+     {'type': 'RECORD', 'stream': 's', 'extra': {'b': '{}'}, 'version': 1}, '{"x": "}, {"}')])
+def test_parse_envelope_trailing_object(line, message, record):
+    '''TEST : the record ends where its JSON value ends, before the object fields following it'''
+
+    assert parse_envelope(line) == (message, record)
+
+
+@mark.parametrize('line', [
+    '', '[]', '{"type" "RECORD"}', '{"type": "RECORD" "stream": "s"}', '{type: "RECORD"}',
+    '{"type": "RECORD", "stream": "s", "record": {"c_pk": 1}, }', '{"type": "RECORD", "stream": "s", "record": {"c_pk": 1}'])
+def test_parse_envelope_error(line):
+    '''TEST : the invalid JSON lines raise a JSONDecodeError'''
+
+    with raises(JSONDecodeError):
+        parse_envelope(line)
+
+
+@mark.parametrize('block_size', [1, 3, 7, 1024])
+def test_block_reader(block_size):
+    '''TEST : the lines are split on the blocks read, whatever their boundaries'''
+
+    data = '{"a": "\u00e9\u20ac"}\r\n{"b": 2}\n\n{"c": "' + 'x' * 20 + '"}'
+    reader = BlockReader(BytesIO(data.encode('utf-8')), block_size)
+
+    assert list(reader) == ['{"a": "\u00e9\u20ac"}\r', '{"b": 2}', '', '{"c": "' + 'x' * 20 + '"}']
+    assert list(BlockReader(BytesIO(b''))) == []
+
+
+async def test_block_reader_async():
+    '''TEST : the blocks are read by a thread, and the text lines by batches'''
+
+    reader = BlockReader(BytesIO(b'{"a": 1}\n{"b": 2}\n{"c": 3}'), 12)
+    assert [batch async for batch in reader.abatches()] == [['{"a": 1}'], ['{"b": 2}'], ['{"c": 3}']]
+    assert [batch async for batch in batch_lines(iter('abcde'), 2)] == [['a', 'b'], ['c', 'd'], ['e']]
+
+
+def test_parse_lines(caplog):
+    '''TEST : the batches are decoded at once, one line at a time when invalid'''
+
+    batch = ['{"type": "STATE", "value": 1}', '{"type": "RECORD", "stream": "s", "record": {"c_pk": 1}}\n']
+    assert list(parse_lines(batch)) == [({'type': 'STATE', 'value': 1}, None, batch[0]),
+                                        ({'type': 'RECORD', 'stream': 's', 'record': {'c_pk': 1}}, None, batch[1])]
+    assert list(parse_lines(batch, passthrough=True))[1] == ({'type': 'RECORD', 'stream': 's'}, '{"c_pk": 1}', batch[1])
+
+    # NOTE: the lines before the invalid one are returned first, and several values on a line are invalid
+    for invalid_batch in (batch + ['{"type": "STATE"'], batch + ['{"type": "STATE", "value": 1}, {"type": "STATE", "value": 2}'], batch + ['']):
+        messages = iter(parse_lines(invalid_batch))
+        assert next(messages)[0] == {'type': 'STATE', 'value': 1}
+        assert next(messages)[0] == {'type': 'RECORD', 'stream': 's', 'record': {'c_pk': 1}}
+        with raises(JSONDecodeError):
+            next(messages)
+    assert f'Unable to parse:\n{invalid_batch[-1]}' in caplog.text
+
+
+def test_loader_passthrough(capsys, caplog, patch_datetime, patch_sys_stdin, config_raw, state, file_metadata):
+    '''TEST : the records are written as received'''
+
+    config = config_file(config_raw | {'open_func': open, 'passthrough': True})
+    Loader(config, writeline=partial(save_json, save=write)).run(sys.stdin)
+
+    assert capsys.readouterr().out == json.dumps(state) + '\n'
+    assert file_metadata['tap_dummy_test-test_table_three']['path'][1]['absolute_path'].read_text(encoding='utf-8') == (
+        '{"c_pk": 1, "c_varchar": "1", "c_int": 1, "c_time": "04:00:00"}\n'
+        '{"c_pk": 2, "c_varchar": "2", "c_int": 2, "c_time": "07:15:00"}\n'
+        # NOTE: the metadata columns are not removed
+        '{"c_pk": 3, "c_varchar": "3", "c_int": 3, "c_time": "23:00:03", "_sdc_deleted_at": "2019-02-10T15:51:50.215998Z"}\n')
+
+
+async def test_loader_passthrough_messages(caplog, config_raw):
+    '''TEST : the passthrough mode messages handling'''
+
+    config = config_file(config_raw | {'open_func': open, 'passthrough': True})
+    lines = [
+        '{"type": "SCHEMA", "stream": "s", "schema": {}, "key_properties": []}',
+        '{"type": "DUMMY"}',
+        '{"type": "ACTIVATE_VERSION", "stream": "s", "version": 1}',
+        '{"type": "RECORD", "stream": "s", "record": {}}']
+    await Loader(config | {'asynchronous': False}, writeline=partial(save_json, save=write)).writelines(lines + lines[:1])
+    assert 'Unknown line type "DUMMY"' in caplog.text
+
+    for invalid_lines in (['{"type": "SCHEMA"}'], ['{"type": "SCHEMA", "stream": "s"}'], ['{"type": "RECORD", "stream": "s"}'],
+                          ['{"type": "RECORD", "stream": "s", "record": {}}'], ['{"type": "RECORD", "stream": "s", "record": {"c_pk": 1}']):
+        with raises(Exception):
+            await Loader(config, writeline=partial(save_json, save=write)).writelines(invalid_lines)
@@ -0,0 +1,152 @@
+'''Tests for the target_s3_json.sync module'''
+# Standard library imports
+import json
+import sys
+from asyncio import create_task, sleep
+from pathlib import Path
+
+# Third party imports
+from pytest import fixture, raises
+from moto import mock_s3
+import boto3
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+
+# Package imports
+from target_s3_json import sync as s3_sync
+from target_s3_json.multipart import MIN_PART_SIZE
+from target_s3_json.sync import BucketSync, is_synced, list_objects, main, parse_url
+from target_s3_json.retry import Retry
+
+
+@fixture
+def client():
+    '''S3 client with a source and a target moto buckets'''
+
+    with mock_s3():
+        client: BaseClient = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='source')
+        client.create_bucket(Bucket='target')
+
+        for key, body in {
+                'data/a/1.json': b'{"c_pk": 1}\n',
+                'data/a/2.json': b'{"c_pk": 2}\n',
+                'data/b/1.json': b'{"c_pk": 3}\n',
+                'data/b/2.jsonl': b'{"c_pk": 4}\n',
+                'data/3.json': b'{"c_pk": 5}\n',
+                'other/1.json': b'{"c_pk": 6}\n'}.items():
+            client.put_object(Bucket='source', Key=key, Body=body)
+        client.put_object(Bucket='source', Key='data/b/big.json', Body=b'x' * (MIN_PART_SIZE + 1024), ContentType='application/json',
+                          Metadata={'origin': 'tap'})
+
+        client.put_object(Bucket='target', Key='backfill/a/1.json', Body=b'{"c_pk": 1}\n')
+        client.put_object(Bucket='target', Key='backfill/3.json', Body=b'{"c_pk": 0}\n')
+        yield client
+
+
+def test_parse_url():
+    '''TEST : S3 URL bucket and prefix'''
+
+    assert parse_url('s3://bucket/prefix/key') == ('bucket', 'prefix/key')
+    assert parse_url('s3://bucket') == ('bucket', '')
+
+    with raises(ValueError):
+        parse_url('bucket/prefix')
+
+
+def test_is_synced():
+    '''TEST : the existing target objects are compared by size and ETag'''
+
+    source = {'Size': 10, 'ETag': '"a"'}
+    assert is_synced(source, {'Size': 10, 'ETag': '"a"'})
+    assert not is_synced(source, None)
+    assert not is_synced(source, {'Size': 11, 'ETag': '"a"'})
+    assert not is_synced(source, {'Size': 10, 'ETag': '"b"'})
+    assert is_synced(source, {'Size': 10, 'ETag': '"b-2"'})
+    assert is_synced(source, {'Size': 10, 'ETag': '"b"'}, 'size')
+
+    with raises(NotImplementedError):
+        BucketSync({}, 's3://source/', 's3://target/', compare='md5')
+
+
+def test_list_objects(client):
+    '''TEST : paginated listing, with common prefixes'''
+
+    objects, prefixes = list_objects(client, Retry(), 'source', 'data/', '/')
+    assert [item['Key'] for item in objects] == ['data/3.json']
+    assert prefixes == ['data/a/', 'data/b/']
+
+    # NOTE: one page per object
+    list_objects_v2 = client.list_objects_v2
+    client.list_objects_v2 = lambda **kwargs: list_objects_v2(MaxKeys=1, **kwargs)
+    objects, prefixes = list_objects(client, Retry(), 'source', 'data/')
+    assert len(objects) == 6
+    assert prefixes == []
+
+
+async def test_sync(caplog, client, monkeypatch):
+    '''TEST : the missing or different objects are copied, the larger ones by parts'''
+
+    monkeypatch.setattr(s3_sync, 'COPY_PART_SIZE', MIN_PART_SIZE)
+    bucket_sync = BucketSync({'client': client, 's3_bucket': 'target'}, 's3://source/data/', 's3://target/backfill/', regex=r'\.json$',
+                             concurrency=2, multipart_threshold=MIN_PART_SIZE)
+    await bucket_sync.run()
+
+    assert sorted(item['Key'] for item in client.list_objects_v2(Bucket='target')['Contents']) == [
+        'backfill/3.json', 'backfill/a/1.json', 'backfill/a/2.json', 'backfill/b/1.json', 'backfill/b/big.json']
+    assert client.get_object(Bucket='target', Key='backfill/3.json')['Body'].read() == b'{"c_pk": 5}\n'
+    big = client.get_object(Bucket='target', Key='backfill/b/big.json')
+    assert big['Body'].read() == b'x' * (MIN_PART_SIZE + 1024)
+    assert big['ContentType'] == 'application/json'
+    assert big['Metadata'] == {'origin': 'tap'}
+    assert big['ETag'].endswith('-2"')
+
+    assert (bucket_sync.copied, bucket_sync.skipped, bucket_sync.failed) == (4, 1, 0)
+    assert 'S3 Bucket Sync completed - 4 objects' in caplog.text
+
+    # NOTE: the multipart copy is skipped by size
+    await BucketSync({'client': client, 's3_bucket': 'target'}, 's3://source/data/', 's3://target/backfill/', depth=0).run()
+    assert '1 objects, 12 bytes copied' in caplog.text
+    assert '5 skipped, 0 failed' in caplog.text
+
+
+async def test_sync_failed(caplog, client):
+    '''TEST : the failed copies are logged, and fail the sync once every other copy is completed'''
+
+    copy_object = client.copy_object
+
+    def failed_copy_object(**kwargs):
+        if kwargs['Key'] == 'backfill/a/2.json':
+            raise ClientError({'Error': {'Code': 'AccessDenied', 'Message': 'Access Denied'}}, 'CopyObject')
+        return copy_object(**kwargs)
+
+    client.copy_object = failed_copy_object
+    bucket_sync = BucketSync({'client': client, 's3_bucket': 'target'}, 's3://source/data/', 's3://target/backfill/', overwrite=True)
+
+    with raises(RuntimeError):
+        await bucket_sync.run()
+
+    assert 'S3 Bucket Sync - "s3://source/data/a/2.json" copy failed' in caplog.text
+    assert (bucket_sync.copied, bucket_sync.skipped, bucket_sync.failed) == (5, 0, 1)
+
+
+async def test_sync_progress(caplog):
+    '''TEST : the throughput is logged every interval'''
+
+    bucket_sync = BucketSync({}, 's3://source/', 's3://target/')
+    task = create_task(bucket_sync.progress(0.01))
+    await sleep(0.05)
+    task.cancel()
+
+    assert 'S3 Bucket Sync in progress - 0 objects, 0 bytes copied in' in caplog.text
+
+
+def test_main(monkeypatch, client, temp_path):
+    '''TEST : bucket sync command'''
+
+    config_path = Path(temp_path.join('config.json'))
+    config_path.write_text(json.dumps({}), encoding='utf-8')
+    monkeypatch.setattr(sys, 'argv', ['target-s3-sync', '--config', str(config_path), 's3://source/other/', 's3://target/other/'])
+    main()
+
+    assert client.get_object(Bucket='target', Key='other/1.json')['Body'].read() == b'{"c_pk": 6}\n'